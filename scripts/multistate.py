@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Multi-state ensemble fitting of FoXS profiles, as a fast alternative to
+multi_foxs.
+
+An N-state model fits the experimental curve with
+
+    I(q) = c * sum_k w_k I_k(q) + offset,   w_k >= 0, sum_k w_k = 1
+
+which is a non-negative least-squares problem in c * w_k with a free
+offset. Profiles are whitened by the experimental errors and the offset is
+projected out, so every candidate ensemble reduces to a k x k Gram system;
+candidates are solved in batches (exactly, by enumerating the faces of the
+non-negative orthant) spread over a process pool.
+
+Ensembles are grown by beam search: every profile is scored alone, then
+each of the `beam` best (N-1)-state models is extended by every other
+profile. beam=1 is a greedy search.
+
+The outputs match those of multi_foxs, so the results code and
+pipeline_decision_tree.py read them unchanged:
+
+- ensembles_size_<N>.txt   best N-state models, MultiFoXS layout
+- multi_state_model_<N>_1_1.dat   fit of the best N-state model
+- multi_foxs.log           including a "number_of_states N" line per size
+
+Unlike multi_foxs, the c1/c2 hydration parameters are not refitted: each
+profile is used as FoXS wrote it (c1 = 1, c2 = 0 for partial profiles).
+
+    python multistate.py foxs_dat_files_for_multifoxs.txt ../saxs-data.dat
+    python multistate.py list.txt data.dat --compare   # also run multi_foxs
+"""
+
+import argparse
+import itertools
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from profile_store import interpolate, load_profiles, read_saxs_data
+
+DEFAULTS = {"max_size": 5, "beam": 200, "top": 100, "chunk": 2000}
+# Weights below this fraction of the total make a model degenerate (it is
+# then really a smaller ensemble and is not reported at this size)
+MIN_WEIGHT = 1e-4
+
+
+class Problem:
+    """
+    Whitened profiles with the offset projected out. `z` holds one unit-norm
+    row per profile; `norm` the factor taken out of each row.
+    """
+
+    def __init__(self, q, intensity, exp_q, exp_i, exp_err):
+        keep = (exp_q >= q[0]) & (exp_q <= q[-1])
+        self.exp_q, self.exp_i, self.exp_err = exp_q[keep], exp_i[keep], exp_err[keep]
+        # Profiles on the experimental q grid, in units of the error
+        self.x = interpolate(intensity, q, self.exp_q) / self.exp_err
+        self.y = self.exp_i / self.exp_err
+        self.u = 1.0 / self.exp_err
+        u_hat = self.u / np.linalg.norm(self.u)
+        z = self.x - np.outer(self.x @ u_hat, u_hat)
+        self.norm = np.linalg.norm(z, axis=1)
+        self.norm[self.norm == 0] = 1.0
+        self.z = z / self.norm[:, None]
+        self.y_proj = self.y - (self.y @ u_hat) * u_hat
+        self.yy = float(self.y_proj @ self.y_proj)
+
+    @property
+    def n_points(self):
+        return len(self.y)
+
+    def solve(self, ensembles):
+        """
+        χ² (per data point, as in pipeline_decision_tree.calculate_chi_square)
+        and weights (unit-norm space) of every row of an (n, k) array of
+        profile indices.
+        """
+        zs = self.z[ensembles]
+        gram = zs @ zs.transpose(0, 2, 1)
+        h = zs @ self.y_proj
+        beta, rss = nnls_faces(gram, h, self.yy)
+        return np.clip(rss, 0.0, None) / self.n_points, beta
+
+    def fit(self, ensemble, beta):
+        """(weights, scale c, offset, model curve) of one solved ensemble."""
+        amplitude = beta / self.norm[ensemble]  # c * w_k on the raw profiles
+        curve = amplitude @ self.x[ensemble]
+        offset = float((self.y - curve) @ self.u / (self.u @ self.u))
+        scale = float(amplitude.sum())
+        weights = amplitude / scale if scale > 0 else amplitude
+        model = (curve + offset * self.u) * self.exp_err
+        return weights, scale, offset, model
+
+
+def nnls_faces(gram, h, yy):
+    """
+    min ||y - Z b||^2 subject to b >= 0 for a batch of small problems given
+    as Gram matrices (B, k, k) and Z^T y (B, k). The optimum is the
+    unconstrained optimum of one face of the orthant, so all 2^k - 1 faces
+    are solved and the best feasible one is kept. Returns (b, rss).
+    """
+    n_batch, k, _ = gram.shape
+    best_rss = np.full(n_batch, np.inf)
+    best = np.zeros((n_batch, k))
+    for size in range(1, k + 1):
+        for face in itertools.combinations(range(k), size):
+            idx = list(face)
+            g = gram[:, idx][:, :, idx] + 1e-12 * np.eye(size)
+            b = np.linalg.solve(g, h[:, idx, None])[..., 0]
+            rss = yy - 2.0 * (b * h[:, idx]).sum(axis=1)
+            rss += np.einsum("bi,bij,bj->b", b, gram[:, idx][:, :, idx], b)
+            better = (b >= 0).all(axis=1) & (rss < best_rss)
+            best_rss[better] = rss[better]
+            best[better] = 0.0
+            best[np.ix_(better, idx)] = b[better]
+    return best, best_rss
+
+
+_problem = None
+
+
+def _init_worker(problem):
+    global _problem
+    _problem = problem
+
+
+def _solve_chunk(ensembles):
+    return _problem.solve(ensembles)
+
+
+def solve_all(problem, candidates, pool, chunk):
+    """χ² and weights of every candidate, in chunks over the pool."""
+    chunks = [candidates[i : i + chunk] for i in range(0, len(candidates), chunk)]
+    if pool is None or len(chunks) == 1:
+        results = [problem.solve(c) for c in chunks]
+    else:
+        results = list(pool.map(_solve_chunk, chunks))
+    return (
+        np.concatenate([r[0] for r in results]),
+        np.concatenate([r[1] for r in results]),
+    )
+
+
+def extend(ensembles, n_profiles):
+    """Every ensemble extended by every profile not in it, without repeats."""
+    grown = np.repeat(ensembles, n_profiles, axis=0)
+    added = np.tile(np.arange(n_profiles), len(ensembles))
+    grown = np.sort(np.column_stack([grown, added]), axis=1)
+    distinct = (np.diff(grown, axis=1) != 0).all(axis=1)
+    return np.unique(grown[distinct], axis=0)
+
+
+def search(problem, max_size, beam, top, workers=1, chunk=DEFAULTS["chunk"]):
+    """
+    Beam search over ensemble sizes 1..max_size. Returns {size: (ensembles,
+    χ², beta)} with the `top` best non-degenerate models of each size.
+    """
+    n_profiles = len(problem.z)
+    results = {}
+    pool = (
+        ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(problem,))
+        if workers > 1
+        else None
+    )
+    try:
+        seeds = np.empty((1, 0), dtype=np.int64)
+        for size in range(1, min(max_size, n_profiles) + 1):
+            candidates = extend(seeds, n_profiles)
+            chi2, beta = solve_all(problem, candidates, pool, chunk)
+            # Weights on the raw profiles, as reported
+            amplitude = beta / problem.norm[candidates]
+            share = amplitude / np.maximum(
+                amplitude.sum(axis=1, keepdims=True), 1e-300
+            )
+            valid = (share >= MIN_WEIGHT).all(axis=1)
+            if not valid.any():
+                break
+            order = np.flatnonzero(valid)[np.argsort(chi2[valid], kind="stable")]
+            best = order[:top]
+            results[size] = (candidates[best], chi2[best], beta[best])
+            seeds = candidates[order[:beam]]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def write_ensembles(path, problem, names, ensembles, chi2, beta):
+    """
+    ensembles_size_<N>.txt in the MultiFoXS layout. The weight statistics
+    and the fraction after each file name are over the models listed.
+    """
+    weights = np.array([problem.fit(e, b)[0] for e, b in zip(ensembles, beta)])
+    members = {}
+    for e, w in zip(ensembles, weights):
+        for i, wi in zip(e, w):
+            members.setdefault(int(i), []).append(wi)
+    with open(path, "w", encoding="utf-8") as f:
+        for rank, (e, x, w) in enumerate(zip(ensembles, chi2, weights), start=1):
+            f.write(f"{rank} |  {x:5.2f} | x1 {x:5.2f} (1.00, 0.00)\n")
+            for i, wi in zip(e, w):
+                seen = members[int(i)]
+                f.write(
+                    f"{int(i):>5}   | {wi:.3f} ({np.mean(seen):.3f}, "
+                    f"{np.std(seen):.3f}) | {names[i]} "
+                    f"({len(seen) / len(ensembles):.3f})\n"
+                )
+
+
+def write_model(path, problem, ensemble, beta, chi2):
+    """multi_state_model_<N>_1_1.dat: data and model curves of one model."""
+    _, scale, offset, model = problem.fit(ensemble, beta)
+    q = problem.exp_q
+    delta = (q[-1] - q[0]) / max(len(q) - 1, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(
+            f"# SAXS profile: number of points = {len(q)}, q_min = {q[0]:.15g}, "
+            f"q_max = {q[-1]:.15g}, delta_q = {delta:.15g}\n"
+        )
+        f.write(
+            f"# offset = {offset:.15g}, scaling c = {scale:.15g}, "
+            f"Chi^2 = {chi2:.15g}\n"
+        )
+        f.write("#  q       exp_intensity   model_intensity error\n")
+        for row in zip(q, problem.exp_i, model, problem.exp_err):
+            f.write("%.8f %.8f    %.8f    %.8f\n" % row)
+
+
+def run(list_file, data_file, out_dir=".", max_size=5, beam=200, top=100, workers=1):
+    """Fit ensembles of the profiles in `list_file`; returns a summary dict."""
+    start = time.perf_counter()
+    with open(list_file, "r", encoding="utf-8") as f:
+        names = [line.strip() for line in f if line.strip()]
+    base = os.path.dirname(os.path.abspath(list_file))
+    paths = [os.path.join(base, n) for n in names]
+    q, intensity, _, _, _ = load_profiles(paths, workers)
+    problem = Problem(q, intensity.astype(np.float64), *read_saxs_data(data_file))
+    results = search(problem, max_size, beam, top, workers)
+
+    os.makedirs(out_dir, exist_ok=True)
+    summary = {"profiles": len(names), "beam": beam, "sizes": {}}
+    log_lines = [f"{len(names)} profiles read from {list_file}"]
+    for size, (ensembles, chi2, beta) in results.items():
+        write_ensembles(
+            os.path.join(out_dir, f"ensembles_size_{size}.txt"),
+            problem,
+            names,
+            ensembles,
+            chi2,
+            beta,
+        )
+        write_model(
+            os.path.join(out_dir, f"multi_state_model_{size}_1_1.dat"),
+            problem,
+            ensembles[0],
+            beta[0],
+            float(chi2[0]),
+        )
+        summary["sizes"][size] = {
+            "chi2": float(chi2[0]),
+            "profiles": [names[i] for i in ensembles[0]],
+        }
+        log_lines.append(
+            f"number_of_states {size} best_chi2 {chi2[0]:.4f} models {len(ensembles)}"
+        )
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    log_lines.append(f"Done in {summary['seconds']} s")
+    with open(os.path.join(out_dir, "multi_foxs.log"), "w", encoding="utf-8") as f:
+        f.write("\n".join(log_lines) + "\n")
+    return summary
+
+
+def best_ensembles(directory):
+    """
+    {size: (χ², [profile paths without leading ../])} of the top ensemble
+    of every ensembles_size_<N>.txt in `directory`.
+    """
+    best = {}
+    for name in os.listdir(directory):
+        match = re.match(r"ensembles_size_(\d+)\.txt$", name)
+        if not match:
+            continue
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        if not lines:
+            continue
+        chi = re.search(r"\|\s*([\d.eE+-]+)", lines[0])
+        members = []
+        for line in lines[1:]:
+            if re.match(r"^\d+\s*\|", line):
+                break
+            members += [
+                re.sub(r"^(\.\./)+", "", p) for p in re.findall(r"(\S+\.dat)", line)
+            ]
+        best[int(match.group(1))] = (float(chi.group(1)) if chi else None, members)
+    return best
+
+
+def compare_with_multifoxs(args, summary):
+    """Run multi_foxs on the same list and compare best models and run time."""
+    ref_dir = os.path.join(args.output_dir, "multifoxs_reference")
+    os.makedirs(ref_dir, exist_ok=True)
+    list_copy = os.path.join(ref_dir, os.path.basename(args.list_file))
+    base = os.path.dirname(os.path.abspath(args.list_file))
+    with open(args.list_file, "r", encoding="utf-8") as f, open(
+        list_copy, "w", encoding="utf-8"
+    ) as out:
+        for line in f:
+            if line.strip():
+                out.write(os.path.join(base, line.strip()) + "\n")
+    start = time.perf_counter()
+    with open(os.path.join(ref_dir, "multi_foxs.log"), "w") as log:
+        proc = subprocess.run(
+            [
+                args.multifoxs_cmd,
+                "-o",
+                "-s",
+                str(args.max_size),
+                os.path.abspath(args.data_file),
+                os.path.basename(list_copy),
+            ],
+            cwd=ref_dir,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    seconds = time.perf_counter() - start
+    native, reference = best_ensembles(args.output_dir), best_ensembles(ref_dir)
+    sizes = {}
+    for n in sorted(set(native) | set(reference)):
+        chi_n, members_n = native.get(n, (None, []))
+        chi_r, members_r = reference.get(n, (None, []))
+        sizes[n] = {
+            "chi2_native": chi_n,
+            "chi2_multifoxs": chi_r,
+            "same_profiles": sorted(os.path.basename(p) for p in members_n)
+            == sorted(os.path.basename(p) for p in members_r),
+        }
+    return {
+        "seconds_native": summary["seconds"],
+        "seconds_multifoxs": round(seconds, 2),
+        "multifoxs_exit_code": proc.returncode,
+        "best_ensembles": sizes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Fit multi-state ensembles of FoXS profiles (multi_foxs outputs)."
+    )
+    parser.add_argument("list_file", help="File listing the FoXS .dat profiles")
+    parser.add_argument("data_file", help="Experimental SAXS profile")
+    parser.add_argument("--output-dir", default=".", help="Where to write outputs")
+    parser.add_argument(
+        "--max-size", type=int, default=DEFAULTS["max_size"], help="Largest ensemble"
+    )
+    parser.add_argument(
+        "--beam",
+        type=int,
+        default=DEFAULTS["beam"],
+        help="Models of each size extended to the next (1 = greedy)",
+    )
+    parser.add_argument(
+        "--top", type=int, default=DEFAULTS["top"], help="Models written per size"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes for parsing and solving",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Also run multi_foxs (in multifoxs_reference/) and compare",
+    )
+    parser.add_argument("--multifoxs-cmd", default="multi_foxs")
+    args = parser.parse_args()
+
+    summary = run(
+        args.list_file,
+        args.data_file,
+        args.output_dir,
+        args.max_size,
+        args.beam,
+        args.top,
+        args.workers,
+    )
+    for size, best in summary["sizes"].items():
+        print(f"{size}-state: χ² {best['chi2']:.3f} {best['profiles']}")
+    print(f"✅ Ensembles of {summary['profiles']} profiles in {summary['seconds']} s")
+    if args.compare:
+        if shutil.which(args.multifoxs_cmd) is None:
+            print(f"[ERROR] {args.multifoxs_cmd} not found", file=sys.stderr)
+            return 2
+        summary["comparison"] = compare_with_multifoxs(args, summary)
+        print(json.dumps(summary["comparison"], indent=2))
+    with open(
+        os.path.join(args.output_dir, "multistate_summary.json"), "w", encoding="utf-8"
+    ) as f:
+        json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -744,7 +744,9 @@ generate_dcd2pdb_script() {
     local dcd2pdb_script="$WORKDIR/run_dcd2pdb.sh"
     > $dcd2pdb_script
     echo "#!/bin/bash" >> $dcd2pdb_script
-    echo "parallel 'charmm -o {.}.out -i {}' ::: dcd2pdb_rg*.inp" >> $dcd2pdb_script
+    # Vectorized NumPy extraction; fall back to the CHARMM inputs if it fails
+    echo "python /app/scripts/openmm/dcd2pdb.py --all --psf ${in_psf_file} --rg-file ${foxs_rg} --workers \$(nproc) || \\" >> $dcd2pdb_script
+    echo "    parallel 'charmm -o {.}.out -i {}' ::: dcd2pdb_rg*.inp" >> $dcd2pdb_script
     echo "" >> $dcd2pdb_script
     chmod u+x $dcd2pdb_script
 }
@@ -770,17 +772,13 @@ generate_foxs_scripts() {
     local root_dir=$WORKDIR/foxs
     cat << EOF > $WORKDIR/run_foxs.sh
 #!/bin/bash
-echo "Run FoXS..."
-find . -type d -name 'rg*_run*' | while read rundir; do
-  echo "Processing directory: \$rundir"
-  if [ -d "\$rundir" ]; then
-    cd "\$rundir"
-    parallel "foxs -p {} >> foxs.log 2>> foxs_error.log && echo \$(pwd)/{}.dat | sed 's|/bilbomd/work|..|' >> foxs_dat_files.txt" ::: *.pdb
-    cd /bilbomd/work/foxs
-  else
-    echo "Directory not found: \$rundir"
-  fi
-done
+# Chunked foxs -p calls across all rg*_run* directories; PDBs with an
+# up-to-date .dat are skipped. Failed PDBs are listed in foxs_error.log.
+python /app/scripts/nersc/run-foxs-after-openmm.py --layout charmm --root . --workers \$(nproc) || \
+    echo "Some FoXS runs failed; see foxs_error.log in the rg*_run* directories"
+# One memory-mappable file with every profile, for the analysis scripts
+python /app/scripts/profile_store.py build foxs_dat_files.txt --data ../$saxs_data --workers \$(nproc) || \
+    echo "Could not build foxs_profiles.bin; the analysis reads the PDBs instead"
 EOF
     chmod u+x $WORKDIR/run_foxs.sh
 }
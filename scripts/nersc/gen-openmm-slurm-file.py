@@ -33,6 +33,8 @@ def setup_environment(uuid):
     cfs_base = f"{cfs}/{project}/bilbomd"
     upload_dir = f"{cfs_base}/{env_dir}/uploads/{uuid}"
     workdir = f"{pscratch}/bilbomd/{env_dir}/{uuid}"
+    # Autotune decisions, shared by every job (keyed by host fingerprint)
+    platform_cache_dir = f"{cfs_base}/{env_dir}/openmm-platform-cache"
 
     # Docker images
     openmm_worker = "bilbomd/bilbomd-openmm-worker:0.0.10"
@@ -62,6 +64,7 @@ def setup_environment(uuid):
         "cfs_base": cfs_base,
         "upload_dir": upload_dir,
         "workdir": workdir,
+        "platform_cache_dir": platform_cache_dir,
         "openmm_worker": openmm_worker,
         "bilbomd_worker": bilbomd_worker,
         "af_worker": af_worker,
@@ -133,7 +136,17 @@ def prepare_openmm_config(config, params):
             "heat_dir": "heating",
             "md_dir": "md",
         },
-        "constraints": {"fixed_bodies": [], "rigid_bodies": []},
+        "platform": {
+            "autotune": True,
+            # PLATFORM_CACHE_DIR, mounted by the minimize, heat and md steps
+            "cache": "/platform-cache/openmm_platform.json",
+        },
+        "constraints": {
+            "fixed_bodies": [],
+            "rigid_bodies": [],
+            "exclude_intra_body": True,
+            "fixed_mode": "restraint",
+        },
         "steps": {
             "minimization": {
                 "parameters": {"max_iterations": 1000},
@@ -156,9 +169,52 @@ def prepare_openmm_config(config, params):
                     "nsteps": 1000000,
                     "timestep": 0.001,
                 },
+                "nonbonded": {"mode": "full"},
+                "mts": {"enabled": False, "inner_steps": 2},
+                "saxs": {
+                    "enabled": False,
+                    "filename": "saxs_profiles.npz",
+                    "q_max": 0.5,
+                    "n_q": 101,
+                },
+                "convergence": {
+                    "enabled": False,
+                    "min_fraction": 0.2,
+                    "window": 50,
+                    "rg_tolerance": 0.5,
+                    "novelty_threshold": 1.0,
+                },
+                "adaptive": {
+                    "enabled": False,
+                    "grid_size": 16,
+                    "explore_fraction": 0.3,
+                    "max_steps_factor": 3,
+                    "novelty_threshold": 0.5,
+                    "reach_tolerance": 3.0,
+                },
+                "replica_exchange": {"enabled": False, "exchange_interval": 1000},
+                "frame_selection": {
+                    "enabled": False,
+                    "budget": 1000,
+                    "rmsd_cutoff": 1.0,
+                },
+                "streaming_foxs": {"enabled": False, "poll_seconds": 15},
+                "saxs_screening": {
+                    "enabled": False,
+                    "data_file": params.get("data_file"),
+                    "top_k": 500,
+                },
+                "multifoxs_prefilter": {
+                    "enabled": False,
+                    "max_profiles": 500,
+                    "min_distance": 0.3,
+                },
+                "native_multistate": {"enabled": False, "max_size": 5, "beam": 200},
                 "rgyr": {
                     "rg_sets": [],
                     "k_rg": 1,
+                    "selection": "all",
+                    "method": "rgforce",
                     "report_interval": 500,
                     "filename": "rgyr_report.csv",
                 },
@@ -166,6 +222,8 @@ def prepare_openmm_config(config, params):
                 "pdb_report_interval": 500,
                 "output_restart": "md.xml",
                 "output_dcd": "md.dcd",
+                "output_checkpoint": "md.chk",
+                "checkpoint_interval": 50000,
             },
         },
     }
@@ -231,6 +289,12 @@ def prepare_openmm_config(config, params):
     else:
         openmm_config["steps"]["md"]["rgyr"]["rg_sets"] = []
 
+    # Build Systems straight from the PSF/CRD when the CRD pipeline made them
+    psf_file, crd_file = params.get("psf_file"), params.get("crd_file")
+    if psf_file and crd_file:
+        openmm_config["input"]["psf_file"] = psf_file
+        openmm_config["input"]["crd_file"] = crd_file
+
     # Write to config.yaml
     config_yaml_path = os.path.join(config["workdir"], "openmm_config.yaml")
     with open(config_yaml_path, "w") as f:
@@ -291,6 +355,8 @@ export OMP_PROC_BIND=spread
 # Global ENV variables
 export UPLOAD_DIR="{config['upload_dir']}"
 export WORKDIR="{config['workdir']}"
+export PLATFORM_CACHE_DIR="{config['platform_cache_dir']}"
+mkdir -p $PLATFORM_CACHE_DIR
 export STATUS_FILE="{config['workdir']}/status.txt"
 """
     return header
@@ -365,6 +431,7 @@ srun --ntasks=1 \\
      --job-name minimize \\
      podman-hpc run --rm --gpu \\
         -v $WORKDIR:/bilbomd/work \\
+        -v $PLATFORM_CACHE_DIR:/platform-cache \\
         -v $UPLOAD_DIR:/cfs \\
         {config['openmm_worker']} /bin/bash -c "
             set -e
@@ -447,6 +514,7 @@ srun --ntasks=1 \\
      --job-name heat \\
      podman-hpc run --rm --gpu \\
         -v $WORKDIR:/bilbomd/work \\
+        -v $PLATFORM_CACHE_DIR:/platform-cache \\
         -v $UPLOAD_DIR:/cfs \\
         {config['openmm_worker']} /bin/bash -c "
             set -e
@@ -461,6 +529,49 @@ update_status heat Success
     return section
 
 
+def streaming_foxs_options(config):
+    """
+    The streaming_foxs options when FoXS should run alongside MD, else None.
+    Frame selection and SAXS screening need every frame first, so either
+    turns streaming off.
+    """
+    config_yaml_path = os.path.join(config["workdir"], "openmm_config.yaml")
+    with open(config_yaml_path, "r") as f:
+        openmm_config = yaml.safe_load(f)
+    md = openmm_config["steps"]["md"]
+    streaming = md.get("streaming_foxs") or {}
+    if not streaming.get("enabled") or any(
+        (md.get(name) or {}).get("enabled")
+        for name in ("frame_selection", "saxs_screening")
+    ):
+        return None
+    return streaming
+
+
+def generate_streaming_foxs_start(config, streaming):
+    # Leave a core for each GPU's MD task
+    workers = max(1, config["num_cores"] - 4)
+    return f"""
+# 📡 Compute FoXS profiles on the CPUs while MD runs on the GPUs
+rm -f $WORKDIR/openmm/md/md.done
+update_status foxs Running
+srun --overlap \\
+     --ntasks=1 \\
+     --cpus-per-task={workers} \\
+     --job-name foxs_watch \\
+     podman-hpc run --rm \\
+        -v $WORKDIR:/bilbomd/work \\
+        -v $UPLOAD_DIR:/cfs \\
+        {config['bilbomd_worker']} /bin/bash -c "
+            set -e
+            cd /bilbomd/work/openmm/md &&
+            python /app/scripts/nersc/run-foxs-after-openmm.py --root . --watch \\
+                --poll {streaming.get('poll_seconds', 15)} --workers {workers}
+        " &
+FOXS_WATCH_PID=$!
+"""
+
+
 def generate_md_section(config):
     cores_per_task = int(config["num_cores"] / (config["num_rgs"] / 2))
     tasks_per_wave = int(config["num_rgs"] / 2)
@@ -481,11 +592,79 @@ def generate_md_section(config):
     )
     tasks_per_wave = int(config["num_rgs"] / 2) if config["num_rgs"] > 1 else 1
 
+    streaming = streaming_foxs_options(config)
     section = """
 # --------------------------------------------------------------------------------------
 # OpenMM Molecular Dynamics (concurrent runs with each Rg set)
 update_status md Running
 """
+    md_done = "echo 'OpenMM MD complete'\nupdate_status md Success\n"
+    if streaming:
+        section += generate_streaming_foxs_start(config, streaming)
+        # Tell the FoXS watcher that no more frames will appear
+        md_done += "touch $WORKDIR/openmm/md/md.done\n"
+    adaptive = openmm_config["steps"]["md"].get("adaptive") or {}
+    if adaptive.get("enabled") and num_sets:
+        # One step for the whole budget: tasks explore, sync, then extend
+        section += "echo 'Running adaptive OpenMM MD over all Rg sets...'\n"
+        section += f"""srun --ntasks={tasks_per_wave} \\
+     --cpus-per-task={cores_per_task} \\
+     --gpus-per-node=4 \\
+     --cpu-bind=cores \\
+     --gpu-bind=map_gpu:0,1,2,3 \\
+     --job-name md_adaptive \\
+     podman-hpc run --rm --gpu \\
+         --env SLURM_JOB_ID \\
+         --env SLURM_STEP_ID \\
+         --env SLURM_PROCID \\
+         --env SLURM_NTASKS \\
+         --env CUDA_VISIBLE_DEVICES \\
+         -v $WORKDIR:/bilbomd/work \\
+         -v $PLATFORM_CACHE_DIR:/platform-cache \\
+         -v $UPLOAD_DIR:/cfs \\
+         {config['openmm_worker']} /bin/bash -c "
+             set -e
+             export OMP_NUM_THREADS=$SLURM_CPUS_PER_TASK
+             cd /bilbomd/work/ &&
+             python /app/scripts/openmm/md.py openmm_config.yaml --adaptive
+         "
+"""
+        section += f"MD_EXIT=$?\ncheck_exit_code $MD_EXIT md\n"
+        section += md_done
+        return section
+
+    replica_exchange = openmm_config["steps"]["md"].get("replica_exchange") or {}
+    if replica_exchange.get("enabled") and num_sets:
+        # Every Rg of a set is a replica in a single process on one GPU; the
+        # sets run concurrently, shared round-robin by the tasks
+        rex_tasks = min(num_sets, tasks_per_wave)
+        section += "echo 'Running OpenMM Rg replica exchange for all Rg sets...'\n"
+        section += f"""srun --ntasks={rex_tasks} \\
+     --cpus-per-task={cores_per_task} \\
+     --gpus-per-node=4 \\
+     --cpu-bind=cores \\
+     --gpu-bind=map_gpu:0,1,2,3 \\
+     --job-name md_rex \\
+     podman-hpc run --rm --gpu \\
+         --env SLURM_JOB_ID \\
+         --env SLURM_STEP_ID \\
+         --env SLURM_PROCID \\
+         --env SLURM_NTASKS \\
+         --env CUDA_VISIBLE_DEVICES \\
+         -v $WORKDIR:/bilbomd/work \\
+         -v $PLATFORM_CACHE_DIR:/platform-cache \\
+         -v $UPLOAD_DIR:/cfs \\
+         {config['openmm_worker']} /bin/bash -c "
+             set -e
+             export OMP_NUM_THREADS=$SLURM_CPUS_PER_TASK
+             cd /bilbomd/work/ &&
+             python /app/scripts/openmm/md.py openmm_config.yaml --replica-exchange
+         "
+"""
+        section += f"MD_EXIT=$?\ncheck_exit_code $MD_EXIT md\n"
+        section += md_done
+        return section
+
     section += "echo 'Running OpenMM MD for all Rg sets...'\n"
     for i in range(num_sets):
         rg_values = rg_sets[i]
@@ -503,6 +682,7 @@ update_status md Running
          --env SLURM_NTASKS \\
          --env CUDA_VISIBLE_DEVICES \\
          -v $WORKDIR:/bilbomd/work \\
+         -v $PLATFORM_CACHE_DIR:/platform-cache \\
          -v $UPLOAD_DIR:/cfs \\
          {config['openmm_worker']} /bin/bash -c "
              set -e
@@ -512,16 +692,69 @@ update_status md Running
          "
 """
         section += f"MD_EXIT=$?\ncheck_exit_code $MD_EXIT md\n"
-    section += "echo 'OpenMM MD complete'\nupdate_status md Success\n"
+    section += md_done
     return section
 
 
+def generate_frame_selection_section(config):
+    """
+    Steps that pick the frames FoXS runs on (frame_selection, then
+    saxs_screening), and the manifest passed to --selection ("" for all).
+    """
+    config_yaml_path = os.path.join(config["workdir"], "openmm_config.yaml")
+    with open(config_yaml_path, "r") as f:
+        openmm_config = yaml.safe_load(f)
+    md = openmm_config["steps"]["md"]
+    commands, selection = [], ""
+    if (md.get("frame_selection") or {}).get("enabled"):
+        commands.append(("select_frames", "select_frames.py openmm_config.yaml"))
+        selection = "frame_selection.json"
+    if (md.get("saxs_screening") or {}).get("enabled"):
+        candidates = " --candidates openmm/md/frame_selection.json" if selection else ""
+        commands.append(
+            ("screen_saxs", f"screen_saxs.py openmm_config.yaml{candidates}")
+        )
+        selection = "saxs_screening.json"
+
+    section = ""
+    for job_name, command in commands:
+        section += f"""echo "Running {job_name} to choose the MD frames for FoXS..."
+srun --ntasks=1 \\
+     --cpus-per-task={config['num_cores']} \\
+     --cpu-bind=cores \\
+     --job-name {job_name} \\
+     podman-hpc run --rm \\
+        -v $WORKDIR:/bilbomd/work \\
+        {config['openmm_worker']} /bin/bash -c "
+            set -e
+            cd /bilbomd/work/ &&
+            python /app/scripts/openmm/{command}
+        "
+SELECT_EXIT=$?
+check_exit_code $SELECT_EXIT foxs
+"""
+    return section, selection
+
+
 def generate_foxs_section(config):
+    if streaming_foxs_options(config):
+        return """
+# --------------------------------------------------------------------------------------
+# Wait for the FoXS watcher started with MD to profile the last frames
+echo "Waiting for streaming FoXS to finish..."
+wait $FOXS_WATCH_PID
+FOXS_EXIT=$?
+check_exit_code $FOXS_EXIT foxs
+echo "FoXS analysis complete"
+update_status foxs Success
+"""
+    frame_selection, selection = generate_frame_selection_section(config)
+    selection_flag = f" --selection {selection}" if selection else ""
     section = f"""
 # --------------------------------------------------------------------------------------
 # Run FoXS on all MD PDB files
 update_status foxs Running
-echo "Running FoXS on all MD PDB files..."
+{frame_selection}echo "Running FoXS on all MD PDB files..."
 
 PDB_DIR=$WORKDIR/openmm/md
 FOXSDIR=$WORKDIR/foxs
@@ -536,7 +769,7 @@ srun --ntasks=1 \\
         {config['bilbomd_worker']} /bin/bash -c "
             set -e
             cd /bilbomd/work/openmm/md &&
-            python /app/scripts/nersc/run-foxs-after-openmm.py --root .
+            python /app/scripts/nersc/run-foxs-after-openmm.py --root .{selection_flag}
         "
 FOXS_EXIT=$?
 check_exit_code $FOXS_EXIT foxs
@@ -546,7 +779,51 @@ update_status foxs Success
     return section
 
 
+def generate_profile_store_section(config, params):
+    saxs_data = f"/bilbomd/work/{params.get('data_file')}"
+    section = f"""
+# --------------------------------------------------------------------------------------
+# Consolidate the FoXS profiles into one memory-mappable file
+echo "Building the FoXS profile store..."
+srun --ntasks=1 \\
+     --cpus-per-task={config['num_cores']} \\
+     --cpu-bind=cores \\
+     --job-name profile_store \\
+     podman-hpc run --rm \\
+        -v $WORKDIR:/bilbomd/work \\
+        {config['bilbomd_worker']} /bin/bash -c "
+            cd /bilbomd/work/openmm/md &&
+            python /app/scripts/profile_store.py build foxs_dat_files.txt \\
+                --data {saxs_data} --workers {config['num_cores']}
+        " || echo "Could not build foxs_profiles.bin; continuing without it"
+"""
+    return section
+
+
+def multifoxs_flags(config):
+    """run-multifoxs.py options for the prefilter and the native solver."""
+    config_yaml_path = os.path.join(config["workdir"], "openmm_config.yaml")
+    with open(config_yaml_path, "r") as f:
+        openmm_config = yaml.safe_load(f)
+    md = openmm_config["steps"]["md"]
+    flags = ""
+    prefilter = md.get("multifoxs_prefilter") or {}
+    if prefilter.get("enabled"):
+        flags += (
+            f" --prefilter --max-profiles {prefilter.get('max_profiles', 500)}"
+            f" --min-distance {prefilter.get('min_distance', 0.3)}"
+        )
+    native = md.get("native_multistate") or {}
+    if native.get("enabled"):
+        flags += (
+            f" --solver native --max-size {native.get('max_size', 5)}"
+            f" --beam {native.get('beam', 200)} --workers {config['num_cores']}"
+        )
+    return flags
+
+
 def generate_multifoxs_section(config):
+    flags = multifoxs_flags(config)
     section = f"""
 # --------------------------------------------------------------------------------------
 # Run MultiFoXS on FoXS results
@@ -565,7 +842,7 @@ srun --ntasks=1 \\
          {config['bilbomd_worker']} /bin/bash -c "
             set -e
             cd /bilbomd/work/multifoxs &&
-            python /app/scripts/nersc/run-multifoxs.py
+            python /app/scripts/nersc/run-multifoxs.py{flags}
         "
 MFOXS_EXIT=$?
 check_exit_code $MFOXS_EXIT multifoxs
@@ -662,6 +939,7 @@ def main():
     slurm_sections.append(generate_heat_section(config))
     slurm_sections.append(generate_md_section(config))
     slurm_sections.append(generate_foxs_section(config))
+    slurm_sections.append(generate_profile_store_section(config, params))
     slurm_sections.append(generate_multifoxs_section(config))
     slurm_sections.append(generate_analysis_section(config))
     # slurm_sections.append(generate_copy_section(config))
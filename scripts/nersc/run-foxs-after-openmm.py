@@ -1,14 +1,27 @@
 #!/usr/bin/env python3
 """
-Run FoXS over PDBs in openmm/md/rg_* directories.
+Run FoXS over PDBs in openmm/md/rg_* directories (or CHARMM foxs/rg*_run*).
 
-- For each rg_* directory:
-  - Runs: foxs -p <file.pdb>
+- PDBs of all directories are split into chunks and each chunk is passed to
+  a single invocation: foxs -p <a.pdb> <b.pdb> ...
+  Chunks of every directory share one queue, so idle workers pick up work
+  from whichever directory still has some.
   - Appends stdout to   <dir>/foxs.log
   - Appends stderr to   <dir>/foxs_error.log
-  - On success, appends relative path to <dir>/foxs_dat_files.txt
+  - PDBs whose .dat is not older than the PDB are skipped (reruns only
+    redo what is missing); PDBs a failed chunk left without a .dat are
+    retried one at a time.
+  - Writes <dir>/foxs_dat_files.txt listing the .dat files of the directory
 - Also writes a global manifest at <root>/foxs_dat_files.txt listing all .dat files
   relative to --relative-to (defaults to <root>).
+- With --selection (frame_selection.json from select_frames.py), only the
+  representative frames listed there are sent to FoXS.
+- With --watch, runs alongside MD: frames are picked up as they are renamed
+  into place and profiled in small chunks until <root>/md.done exists, then
+  the manifests are written as above.
+- With --layout charmm, runs over the rg*_run* directories of the CHARMM
+  pipeline instead (all *.pdb, manifest paths as ../foxs/rg*_run*/<pdb>.dat,
+  as run_foxs_after_charmm.sh wrote them).
 
 Requirements:
 - 'foxs' available on PATH (or pass --foxs-cmd)
@@ -16,12 +29,21 @@ Requirements:
 
 from __future__ import annotations
 import argparse
+import json
+import math
 import os
+import re
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import subprocess
 import sys
-import threading
+import time
+
+LAYOUTS = {
+    # layout: (directory glob, PDB filename regex)
+    "openmm": ("rg_*", r"md_\d+\.pdb$"),
+    "charmm": ("rg*_run*", r".*\.pdb$"),
+}
 
 
 def parse_args() -> argparse.Namespace:
@@ -33,7 +55,15 @@ def parse_args() -> argparse.Namespace:
         help="Root directory containing rg_* subdirs (default: openmm/md)",
     )
     p.add_argument(
-        "--pattern", default="rg_*", help="Subdirectory glob pattern (default: rg_*)"
+        "--layout",
+        choices=sorted(LAYOUTS),
+        default="openmm",
+        help="openmm: rg_*/md_*.pdb; charmm: rg*_run*/*.pdb (default: openmm)",
+    )
+    p.add_argument(
+        "--pattern",
+        default=None,
+        help="Subdirectory glob pattern (default: rg_* or rg*_run* for --layout)",
     )
     p.add_argument(
         "--foxs-cmd",
@@ -56,60 +86,98 @@ def parse_args() -> argparse.Namespace:
             "otherwise the machine CPU count)"
         ),
     )
+    p.add_argument(
+        "--max-chunk",
+        type=int,
+        default=64,
+        help="Most PDBs passed to one FoXS invocation (default: 64)",
+    )
     p.add_argument(
         "--relative-to",
         type=Path,
         default=None,
-        help="Base path to make .dat paths relative to (default: --root)",
+        help=(
+            "Base path to make .dat paths relative to "
+            "(default: --root, or its parent for --layout charmm)"
+        ),
     )
     p.add_argument(
         "--global-manifest",
         default="foxs_dat_files.txt",
         help="Global manifest filename written under --root (default: foxs_dat_files.txt)",
     )
+    p.add_argument(
+        "--selection",
+        type=Path,
+        default=None,
+        help="frame_selection.json listing the frames to run (default: all frames)",
+    )
+    p.add_argument(
+        "--force",
+        action="store_true",
+        help="Rerun FoXS even where an up-to-date .dat exists",
+    )
+    p.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run FoXS on frames as MD writes them, until --stop-file appears",
+    )
+    p.add_argument(
+        "--stop-file",
+        default="md.done",
+        help="File under --root that ends --watch once MD is done (default: md.done)",
+    )
+    p.add_argument(
+        "--poll",
+        type=float,
+        default=15.0,
+        help="Seconds between directory scans in --watch mode (default: 15)",
+    )
     return p.parse_args()
 
 
-# Thread-safe append helpers
-_write_locks: dict[Path, threading.Lock] = {}
-_global_lock = threading.Lock()
-
-
-def get_lock(path: Path) -> threading.Lock:
-    with _global_lock:
-        lock = _write_locks.get(path)
-        if lock is None:
-            lock = threading.Lock()
-            _write_locks[path] = lock
-        return lock
-
-
-def append_line(path: Path, line: str) -> None:
-    lock = get_lock(path)
-    with lock:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        with path.open("a", encoding="utf-8") as f:
-            f.write(line.rstrip() + "\n")
+def dat_path(pdb_path: Path) -> Path:
+    return pdb_path.with_name(pdb_path.name + ".dat")  # matches bash: "{}.dat"
 
 
-def run_foxs_on_pdb(
-    pdb_path: Path,
-    foxs_cmd: str,
-    per_dir_log: Path,
-    per_dir_err: Path,
-    per_dir_manifest: Path,
-    global_manifest: Path,
-    rel_base: Path,
-) -> tuple[Path, int]:
-    """Run FoXS on one PDB; return (pdb_path, returncode)."""
-    workdir = pdb_path.parent
+def is_up_to_date(pdb_path: Path) -> bool:
+    """True when the PDB's .dat exists and is not older than the PDB."""
+    try:
+        return dat_path(pdb_path).stat().st_mtime >= pdb_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def chunk_size(n_pending: int, workers: int, max_chunk: int) -> int:
+    """
+    PDBs per FoXS invocation: about four chunks per worker, so the process
+    start-up is amortized while the queue still balances at the end.
+    """
+    return max(1, min(max_chunk, math.ceil(n_pending / (4 * max(1, workers)))))
+
+
+def make_chunks(pending: dict[Path, list[Path]], size: int) -> list[list[Path]]:
+    """Split each directory's PDBs into chunks, interleaving the directories."""
+    per_dir = [
+        [pdbs[i : i + size] for i in range(0, len(pdbs), size)]
+        for pdbs in pending.values()
+    ]
+    chunks = []
+    for i in range(max((len(c) for c in per_dir), default=0)):
+        chunks += [c[i] for c in per_dir if i < len(c)]
+    return chunks
+
+
+def run_foxs(pdbs: list[Path], foxs_cmd: str) -> int:
+    """Run one `foxs -p` over PDBs of a single directory; return its exit code."""
+    workdir = pdbs[0].parent
     # Open in append mode so multiple runs aggregate logs
-    with per_dir_log.open("a", encoding="utf-8") as out_f, per_dir_err.open(
-        "a", encoding="utf-8"
-    ) as err_f:
+    with (workdir / "foxs.log").open("a", encoding="utf-8") as out_f, (
+        workdir / "foxs_error.log"
+    ).open("a", encoding="utf-8") as err_f:
         try:
             proc = subprocess.run(
-                [foxs_cmd, "-p", pdb_path.name],
+                [foxs_cmd, "-p", *[p.name for p in pdbs]],
                 cwd=workdir,
                 stdout=out_f,
                 stderr=err_f,
@@ -117,103 +185,188 @@ def run_foxs_on_pdb(
             )
         except FileNotFoundError:
             # FoXS not found
-            append_line(per_dir_err, f"[ERROR] FoXS command not found: {foxs_cmd}")
-            return (pdb_path, 127)
-
-    rc = proc.returncode
-    if rc == 0:
-        # FoXS success: record the .dat path
-        dat_name = pdb_path.name + ".dat"  # matches bash: "{}.dat"
-        dat_path = workdir / dat_name
-        # Relative path for manifests
-        rel_path = dat_path.resolve().relative_to(rel_base.resolve())
-        append_line(per_dir_manifest, str(rel_path))
-        append_line(global_manifest, str(rel_path))
-    else:
-        append_line(per_dir_err, f"[ERROR] foxs failed (rc={rc}) for {pdb_path.name}")
-
-    return (pdb_path, rc)
+            err_f.write(f"[ERROR] FoXS command not found: {foxs_cmd}\n")
+            return 127
+    return proc.returncode
+
+
+def run_chunk(pdbs: list[Path], foxs_cmd: str) -> list[tuple[Path, bool]]:
+    """
+    Run FoXS on a chunk and return (pdb, success) for each PDB. If the chunk
+    fails, PDBs without a fresh .dat are retried on their own so one bad
+    structure does not fail its neighbours.
+    """
+    rc = run_foxs(pdbs, foxs_cmd)
+    results = []
+    for pdb in pdbs:
+        ok = is_up_to_date(pdb)
+        if not ok and rc != 0 and len(pdbs) > 1 and rc != 127:
+            ok = run_foxs([pdb], foxs_cmd) == 0 and is_up_to_date(pdb)
+        if not ok:
+            with (pdb.parent / "foxs_error.log").open("a", encoding="utf-8") as f:
+                f.write(f"[ERROR] foxs failed (rc={rc}) for {pdb.name}\n")
+        results.append((pdb, ok))
+    return results
+
+
+def write_manifest(path: Path, lines: list[str]) -> None:
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+    os.replace(tmp_path, path)
+
+
+def find_pdbs(
+    root: Path, pattern: str, pdb_regex: str, selected: set[str] | None
+) -> dict[Path, list[Path]]:
+    """Matching PDBs of every directory, in file order."""
+    found = {}
+    for rgdir in sorted(d for d in root.glob(pattern) if d.is_dir()):
+        pdbs = sorted(f for f in rgdir.glob("*.pdb") if re.match(pdb_regex, f.name))
+        if selected is not None:
+            pdbs = [f for f in pdbs if f.relative_to(root).as_posix() in selected]
+        found[rgdir] = pdbs
+    return found
+
+
+def watch(args: argparse.Namespace, pdb_regex: str, pool: ThreadPoolExecutor) -> int:
+    """
+    Run FoXS on frames as md.py writes them, until <root>/<stop-file> exists.
+
+    Frames are renamed into place by the writer, so every matching PDB is
+    complete. A PDB that is rewritten (a resumed MD run replaces frames past
+    its checkpoint) is picked up again because its .dat is then older.
+    Returns the number of PDBs dispatched.
+    """
+    stop_file = args.root / args.stop_file
+    print(f"Watching {args.root} for new frames until {stop_file} exists...")
+    dispatched: dict[Path, int] = {}
+    futures = []
+    while True:
+        # Check before scanning, so the last scan sees every final frame
+        stopping = stop_file.exists()
+        new: dict[Path, list[Path]] = {}
+        if args.root.is_dir():
+            found = find_pdbs(args.root, args.pattern, pdb_regex, None)
+            for rgdir, pdbs in found.items():
+                for pdb in pdbs:
+                    try:
+                        mtime = pdb.stat().st_mtime_ns
+                    except FileNotFoundError:
+                        continue  # removed by a resuming run
+                    if dispatched.get(pdb) != mtime and not is_up_to_date(pdb):
+                        dispatched[pdb] = mtime
+                        new.setdefault(rgdir, []).append(pdb)
+        n_new = sum(len(p) for p in new.values())
+        if n_new:
+            size = chunk_size(n_new, args.workers, args.max_chunk)
+            for chunk in make_chunks(new, size):
+                futures.append(pool.submit(run_chunk, chunk, args.foxs_cmd))
+            print(f"- {n_new} new frames queued ({len(dispatched)} so far)", flush=True)
+        if stopping:
+            break
+        time.sleep(args.poll)
+    for fut in as_completed(futures):
+        fut.result()
+    return len(dispatched)
 
 
 def main() -> int:
     args = parse_args()
     root: Path = args.root
-    rel_base: Path = args.relative_to or root
+    pattern, pdb_regex = LAYOUTS[args.layout]
+    args.pattern = args.pattern or pattern
+    if args.relative_to:
+        rel_base, prefix = args.relative_to, ""
+    elif args.layout == "charmm":
+        # MultiFoXS runs from a sibling of --root (e.g. work/multifoxs)
+        rel_base, prefix = root.resolve().parent, "../"
+    else:
+        rel_base, prefix = root, ""
     global_manifest = root / args.global_manifest
 
-    if not root.is_dir():
+    if args.watch:
+        if args.selection:
+            print("[ERROR] --selection cannot be used with --watch", file=sys.stderr)
+            return 2
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            n_run = watch(args, pdb_regex, pool)
+        print(
+            f"FoXS done {time.perf_counter() - start:.0f} s after starting; "
+            f"{n_run} PDBs run while watching."
+        )
+        skipped = 0
+    elif not root.is_dir():
         print(f"[ERROR] Root directory does not exist: {root}", file=sys.stderr)
         return 2
 
-    # Clear previous global manifest if present (start fresh)
-    if global_manifest.exists():
-        global_manifest.unlink()
+    selected = None
+    if args.selection:
+        with args.selection.open("r", encoding="utf-8") as f:
+            selection = json.load(f)
+        selected = {frame["pdb"] for frame in selection["selected"]}
+        print(
+            f"Frame selection: {selection['frames_selected']} of "
+            f"{selection['frames_total']} frames "
+            f"(~{selection['estimated_cpu_seconds_saved']:.0f} CPU-seconds saved)"
+        )
 
     # Collect rg_* directories
-    rg_dirs = sorted([d for d in root.glob(args.pattern) if d.is_dir()])
-    if not rg_dirs:
+    found = find_pdbs(root, args.pattern, pdb_regex, selected)
+    if not found:
         print(f"[WARN] No directories matching {args.pattern} under {root}")
         return 0
 
-    print("Run FoXS...")
-    print(f"Found {len(rg_dirs)} directories.")
-
-    futures = []
-    total_pdbs = 0
-    with ThreadPoolExecutor(max_workers=args.workers) as pool:
-        for rgdir in rg_dirs:
-            # Per-directory artifacts
-            per_dir_log = rgdir / "foxs.log"
-            per_dir_err = rgdir / "foxs_error.log"
-            per_dir_manifest = rgdir / "foxs_dat_files.txt"
-
-            # Clean per-dir manifest (keep logs appended)
-            if per_dir_manifest.exists():
-                per_dir_manifest.unlink()
-
-
-            # Only process files matching 'md_\d+.pdb'
-            import re
-            pdbs = sorted([
-                f for f in rgdir.glob("*.pdb")
-                if re.match(r"md_\d+\.pdb$", f.name)
-            ])
+    if not args.watch:
+        print("Run FoXS...")
+        print(f"Found {len(found)} directories.")
+        pending: dict[Path, list[Path]] = {}
+        skipped = 0
+        for rgdir, pdbs in found.items():
             if not pdbs:
-                append_line(
-                    per_dir_err, "[WARN] No matching .pdb files found in this directory."
-                )
+                with (rgdir / "foxs_error.log").open("a", encoding="utf-8") as f:
+                    f.write("[WARN] No matching .pdb files found in this directory.\n")
                 continue
+            pending[rgdir] = [
+                p for p in pdbs if args.force or not is_up_to_date(p)
+            ]
+            skipped += len(pdbs) - len(pending[rgdir])
+            print(
+                f"- Processing {rgdir} ({len(pdbs)} PDBs, "
+                f"{len(pdbs) - len(pending[rgdir])} up to date)"
+            )
 
-            print(f"- Processing {rgdir} ({len(pdbs)} PDBs)")
-            total_pdbs += len(pdbs)
-
-            for pdb in pdbs:
-                futures.append(
-                    pool.submit(
-                        run_foxs_on_pdb,
-                        pdb,
-                        args.foxs_cmd,
-                        per_dir_log,
-                        per_dir_err,
-                        per_dir_manifest,
-                        global_manifest,
-                        rel_base,
-                    )
-                )
-
-        # Consume results
-        failures = 0
-        for fut in as_completed(futures):
-            pdb_path, rc = fut.result()
-            if rc != 0:
-                failures += 1
+        n_pending = sum(len(p) for p in pending.values())
+        size = chunk_size(n_pending, args.workers, args.max_chunk)
+        chunks = make_chunks(pending, size)
+        print(f"Running {n_pending} PDBs in {len(chunks)} FoXS calls of up to {size}")
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            futures = [pool.submit(run_chunk, c, args.foxs_cmd) for c in chunks]
+            for fut in as_completed(futures):
+                fut.result()
+
+    # Manifests are written once, in file order, after every FoXS call
+    all_lines = []
+    total_pdbs = failures = 0
+    for rgdir, pdbs in found.items():
+        if not pdbs:
+            continue
+        ok = [p for p in pdbs if is_up_to_date(p)]
+        total_pdbs += len(pdbs)
+        failures += len(pdbs) - len(ok)
+        lines = [
+            prefix + str(dat_path(p).resolve().relative_to(rel_base.resolve()))
+            for p in ok
+        ]
+        write_manifest(rgdir / "foxs_dat_files.txt", lines)
+        all_lines += lines
+    write_manifest(global_manifest, all_lines)
 
     print("Completed FoXS runs.")
     print(f"- Total PDBs processed: {total_pdbs}")
+    print(f"- Skipped (up to date): {skipped}")
     print(f"- Failures: {failures}")
-    # print(
-    #     f"- Global manifest: {global_manifest.relative_to(Path.cwd()) if global_manifest.exists() else '(not created)'}"
-    # )
 
     return 0 if failures == 0 else 1
 
@@ -1,19 +1,358 @@
+#!/usr/bin/env python3
+"""
+Run MultiFoXS on the FoXS profiles of the OpenMM MD frames.
+
+Run from the multifoxs directory. The profiles listed in
+../openmm/md/foxs_dat_files.txt are written to
+foxs_dat_files_for_multifoxs.txt and passed to multi_foxs.
+
+MultiFoXS enumerates ensembles of the profiles it is given, so its run time
+grows combinatorially with their number. With --prefilter the list is
+reduced first:
+
+- every profile is fitted to the data (scale and offset), vectorized
+- walking the frames from best single-state χ² down, a profile is dropped
+  when its fitted curve lies within --min-distance (RMS, in units of the
+  experimental error) of one already kept, i.e. it is a near duplicate
+- the best frames of each of --rg-bins Rg bins are kept first, so extended
+  and compact states stay available to the ensembles
+- at most --max-profiles are kept
+
+Profiles and Rg are read from ../openmm/md/foxs_profiles.bin when it
+lists every frame, otherwise from the .dat files (Rg from a Guinier fit).
+A summary goes to multifoxs_prefilter.json. With --compare, multi_foxs is
+also run on the full list (in unfiltered/) and the run times and best
+ensembles of both runs are reported.
+
+With --solver native, ensembles are fitted by multistate.py instead of
+multi_foxs, writing the same output files.
+"""
+
+import argparse
+import json
+import os
 import subprocess
+import sys
+import time
+
+import numpy as np
+
+# profile_store and multistate live in the scripts directory (/app/scripts)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import multistate  # noqa: E402
+from multistate import best_ensembles  # noqa: E402
+from profile_store import (  # noqa: E402
+    STORE_NAME,
+    ProfileStore,
+    fit_to_data,
+    interpolate,
+    load_profiles,
+    read_saxs_data,
+)
+
+MULTIFOXS_LIST = "foxs_dat_files_for_multifoxs.txt"
+REPORT_NAME = "multifoxs_prefilter.json"
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run MultiFoXS on the MD FoXS profiles")
+    p.add_argument(
+        "--manifest",
+        default="../openmm/md/foxs_dat_files.txt",
+        help="FoXS manifest (default: ../openmm/md/foxs_dat_files.txt)",
+    )
+    p.add_argument(
+        "--prefix",
+        default="../openmm/md/",
+        help="Prefix turning manifest entries into paths from here",
+    )
+    p.add_argument(
+        "--data", default="../saxs-data.dat", help="Experimental SAXS profile"
+    )
+    p.add_argument(
+        "--prefilter",
+        action="store_true",
+        help="Drop near-duplicate and poorly fitting profiles before MultiFoXS",
+    )
+    p.add_argument(
+        "--max-profiles",
+        type=int,
+        default=500,
+        help="Most profiles passed to MultiFoXS with --prefilter (default: 500)",
+    )
+    p.add_argument(
+        "--min-distance",
+        type=float,
+        default=0.3,
+        help="RMS distance (in experimental errors) below which two fitted "
+        "profiles are duplicates (default: 0.3)",
+    )
+    p.add_argument(
+        "--rg-bins",
+        type=int,
+        default=10,
+        help="Rg bins whose best frames are always kept (default: 10)",
+    )
+    p.add_argument(
+        "--per-bin",
+        type=int,
+        default=5,
+        help="Frames kept first from each Rg bin (default: 5)",
+    )
+    p.add_argument(
+        "--compare",
+        action="store_true",
+        help="Also run MultiFoXS on the unfiltered list and compare",
+    )
+    p.add_argument(
+        "--solver",
+        choices=["multifoxs", "native"],
+        default="multifoxs",
+        help="multi_foxs, or the NumPy solver of multistate.py (same outputs)",
+    )
+    p.add_argument(
+        "--max-size",
+        type=int,
+        default=5,
+        help="Largest ensemble for --solver native (default: 5)",
+    )
+    p.add_argument(
+        "--beam",
+        type=int,
+        default=200,
+        help="Models of each size extended by --solver native (default: 200)",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes for --solver native (default: CPU count)",
+    )
+    p.add_argument(
+        "--multifoxs-cmd",
+        default="multi_foxs",
+        help="MultiFoXS executable (default: multi_foxs)",
+    )
+    return p.parse_args()
+
+
+def read_entries(manifest):
+    with open(manifest, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def write_list(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def guinier_rg(q, intensity, qrg_max=1.3, q_start=0.05):
+    """
+    Rg (Å) of every profile from a Guinier fit (ln I vs q^2 up to
+    q * Rg = qrg_max, refined twice from q <= q_start).
+    """
+    q2 = q**2
+    log_i = np.log(np.clip(intensity, 1e-30, None))
+    q_cut = np.full(len(intensity), q_start)
+    rg = np.full(len(intensity), np.nan)
+    for _ in range(3):
+        mask = ((q > 0) & (q[None, :] <= q_cut[:, None])).astype(np.float64)
+        n = mask.sum(axis=1)
+        mx = (mask * q2).sum(axis=1) / np.maximum(n, 1)
+        my = (mask * log_i).sum(axis=1) / np.maximum(n, 1)
+        sxx = (mask * (q2 - mx[:, None]) ** 2).sum(axis=1)
+        sxy = (mask * (q2 - mx[:, None]) * (log_i - my[:, None])).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where((n >= 3) & (sxx > 0), sxy / sxx, np.nan)
+            rg = np.sqrt(np.clip(-3.0 * slope, 0.0, None))
+            q_cut = np.where(rg > 0, qrg_max / rg, q_start)
+    return rg
+
+
+def load_frames(entries, prefix):
+    """q, intensity matrix and Rg of the manifest frames (store or .dat files)."""
+    paths = [prefix + e for e in entries]
+    store_path = os.path.join(prefix, STORE_NAME)
+    if os.path.exists(store_path):
+        store = ProfileStore(store_path)
+        try:
+            rows = [store.row(e) for e in entries]
+        except KeyError:
+            print(f"⚠️ {store_path} does not list every frame; reading .dat files")
+        else:
+            print(f"Reading {len(rows)} profiles from {store_path}")
+            intensity = np.asarray(store.intensity[rows], dtype=np.float64)
+            rg = store.rg[rows]
+            missing = np.isnan(rg)
+            if missing.any():
+                rg[missing] = guinier_rg(store.q, intensity[missing])
+            return store.q, intensity, rg
+    print(f"Reading {len(paths)} profiles from .dat files")
+    q, intensity, _, _, _ = load_profiles(paths)
+    intensity = intensity.astype(np.float64)
+    return q, intensity, guinier_rg(q, intensity)
+
+
+def prefilter(q, intensity, rg, data, max_profiles, min_distance, rg_bins, per_bin):
+    """
+    Indices of the profiles to keep and a summary. See the module docstring.
+    """
+    exp_q, exp_i, exp_err = data
+    chi2, scale, offset = fit_to_data(intensity, q, exp_q, exp_i, exp_err)
+    # Fitted curves on the experimental q grid, in units of the error
+    keep_q = (exp_q >= q[0]) & (exp_q <= q[-1])
+    fitted = interpolate(intensity, q, exp_q[keep_q])
+    fitted = (fitted * scale[:, None] + offset[:, None]) / exp_err[keep_q]
+    n_points = fitted.shape[1]
+
+    order = np.argsort(chi2, kind="stable")
+    # Rg coverage first: the best frames of every Rg bin, then all by χ²
+    finite = np.isfinite(rg)
+    first = []
+    if finite.any() and rg_bins > 0:
+        edges = np.linspace(rg[finite].min(), rg[finite].max(), rg_bins + 1)
+        bins = np.clip(np.searchsorted(edges, rg, side="right") - 1, 0, rg_bins - 1)
+        for b in range(rg_bins):
+            first += [i for i in order if finite[i] and bins[i] == b][:per_bin]
+    first = sorted(first, key=lambda i: chi2[i])
+    seen = set(first)
+    candidates = first + [i for i in order if i not in seen]
+
+    kept = np.empty((min(max_profiles, len(candidates)), n_points))
+    keep, duplicates = [], 0
+    for i in candidates:
+        if len(keep) == len(kept):
+            break
+        if keep:
+            d = np.sqrt(((kept[: len(keep)] - fitted[i]) ** 2).mean(axis=1))
+            if d.min() < min_distance:
+                duplicates += 1
+                continue
+        kept[len(keep)] = fitted[i]
+        keep.append(int(i))
+
+    summary = {
+        "profiles": len(intensity),
+        "kept": len(keep),
+        "duplicates_dropped": duplicates,
+        "max_profiles": max_profiles,
+        "min_distance": min_distance,
+        "best_chi2": float(chi2[order[0]]),
+        "worst_kept_chi2": float(chi2[keep].max()) if keep else None,
+        "rg_range": (
+            [float(np.nanmin(rg)), float(np.nanmax(rg))] if finite.any() else None
+        ),
+        "rg_range_kept": (
+            [float(np.nanmin(rg[keep])), float(np.nanmax(rg[keep]))]
+            if keep and finite[keep].any()
+            else None
+        ),
+    }
+    return sorted(keep), summary
+
+
+def run_multifoxs(args, data, list_file, cwd="."):
+    """
+    Run multi_foxs, or the native solver with --solver native, in `cwd`
+    (paths relative to it); returns (exit code, seconds).
+    """
+    start = time.perf_counter()
+    if args.solver == "native":
+        multistate.run(
+            os.path.join(cwd, list_file),
+            os.path.join(cwd, data),
+            cwd,
+            args.max_size,
+            args.beam,
+            workers=args.workers,
+        )
+        return 0, time.perf_counter() - start
+    with open(os.path.join(cwd, "multi_foxs.log"), "w") as log:
+        proc = subprocess.run(
+            [args.multifoxs_cmd, "-o", data, list_file],
+            cwd=cwd,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return proc.returncode, time.perf_counter() - start
+
+
+def compare(args, entries, seconds, code):
+    """Run MultiFoXS on every profile in unfiltered/ and compare with this run."""
+    os.makedirs("unfiltered", exist_ok=True)
+    write_list(
+        os.path.join("unfiltered", MULTIFOXS_LIST),
+        ["../" + args.prefix + e for e in entries],
+    )
+    full_code, full_seconds = run_multifoxs(
+        args, os.path.join("..", args.data), MULTIFOXS_LIST, "unfiltered"
+    )
+    filtered, full = best_ensembles("."), best_ensembles("unfiltered")
+    sizes = {}
+    for n in sorted(set(filtered) | set(full)):
+        chi_f, members_f = filtered.get(n, (None, []))
+        chi_u, members_u = full.get(n, (None, []))
+        sizes[n] = {
+            "chi2_filtered": chi_f,
+            "chi2_unfiltered": chi_u,
+            "same_profiles": sorted(members_f) == sorted(members_u),
+        }
+    result = {
+        "seconds_filtered": round(seconds, 2),
+        "seconds_unfiltered": round(full_seconds, 2),
+        "speedup": round(full_seconds / seconds, 2) if seconds > 0 else None,
+        "exit_codes": [code, full_code],
+        "best_ensembles": sizes,
+    }
+    print(
+        f"{args.solver}: {seconds:.1f} s filtered vs {full_seconds:.1f} s unfiltered; "
+        f"best ensembles identical for sizes "
+        f"{[n for n, s in sizes.items() if s['same_profiles']]}"
+    )
+    return result
+
 
-# Paths
-input_file = '../openmm/md/foxs_dat_files.txt'
-output_file = 'foxs_dat_files_for_multifoxs.txt'
-prefix = '../openmm/md/'
+def main():
+    args = parse_args()
+    entries = read_entries(args.manifest)
+    report = {"profiles": len(entries)}
+    selected = entries
+    if args.prefilter and len(entries) > 1:
+        start = time.perf_counter()
+        q, intensity, rg = load_frames(entries, args.prefix)
+        keep, summary = prefilter(
+            q,
+            intensity,
+            rg,
+            read_saxs_data(args.data),
+            args.max_profiles,
+            args.min_distance,
+            args.rg_bins,
+            args.per_bin,
+        )
+        selected = [entries[i] for i in keep]
+        summary["seconds"] = round(time.perf_counter() - start, 2)
+        report["prefilter"] = summary
+        print(
+            f"Prefilter kept {len(selected)}/{len(entries)} profiles "
+            f"({summary['duplicates_dropped']} near duplicates dropped) "
+            f"in {summary['seconds']:.1f} s"
+        )
 
-# Read and process lines
-with open(input_file, 'r') as f:
-    lines = [prefix + line.strip() for line in f if line.strip()]
+    # Run multi_foxs on the (reduced) list
+    write_list(MULTIFOXS_LIST, [args.prefix + e for e in selected])
+    code, seconds = run_multifoxs(args, args.data, f"./{MULTIFOXS_LIST}")
+    report["solver"] = args.solver
+    report["multifoxs_profiles"] = len(selected)
+    report["multifoxs_seconds"] = round(seconds, 2)
+    print(f"{args.solver} on {len(selected)} profiles took {seconds:.1f} s")
+    if args.compare and args.prefilter:
+        report["comparison"] = compare(args, entries, seconds, code)
+    with open(REPORT_NAME, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    # As before, a MultiFoXS failure is left to multi_foxs.log
+    return 0
 
-# Write to output file
-with open(output_file, 'w') as f:
-    f.write('\n'.join(lines) + '\n')
 
-# Run multi_foxs command
-cmd = ['multi_foxs', '-o', '../saxs-data.dat', './foxs_dat_files_for_multifoxs.txt']
-with open('multi_foxs.log', 'w') as log:
-    subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,8 @@
 #!/bin/bash
-echo "Run FoXS..."
-find . -type d -name 'rg*_run*' | while read rundir; do
-  echo "Processing directory: $rundir"
-  if [ -d "$rundir" ]; then
-    cd "$rundir"
-    parallel "foxs -p {} >> foxs.log 2>> foxs_error.log && echo $(pwd)/{}.dat | sed 's|/bilbomd/work|..|' >> foxs_dat_files.txt" ::: *.pdb
-    cd /bilbomd/work/foxs
-  else
-    echo "Directory not found: $rundir"
-  fi
-done
+# Chunked foxs -p calls across all rg*_run* directories; PDBs with an
+# up-to-date .dat are skipped. Failed PDBs are listed in foxs_error.log.
+python /app/scripts/nersc/run-foxs-after-openmm.py --layout charmm --root . --workers $(nproc) || \
+    echo "Some FoXS runs failed; see foxs_error.log in the rg*_run* directories"
+# One memory-mappable file with every profile, for the analysis scripts
+python /app/scripts/profile_store.py build foxs_dat_files.txt --workers $(nproc) || \
+    echo "Could not build foxs_profiles.bin; the analysis reads the PDBs instead"
@@ -0,0 +1,539 @@
+"""Throughput benchmarks for BilboMD OpenMM MD force and integrator options"""
+
+import argparse
+import copy
+import json
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import yaml
+from pdbfixer import PDBFixer
+from openmm import Context, VerletIntegrator
+from openmm.app import (
+    CharmmCrdFile,
+    CharmmParameterSet,
+    CharmmPsfFile,
+    CutoffNonPeriodic,
+    ForceField,
+    HBonds,
+    Modeller,
+    PDBFile,
+)
+from openmm.unit import amu, kelvin, kilojoules_per_mole, nanometer
+
+from md import add_rg_restraint, build_md_system, create_md_integrator
+from utils.fixed_bodies import get_fixed_body_atoms
+from utils.forcefield import implicit_solvent, input_path, toppar_files
+from utils.platform_tuner import select_platform
+
+
+def make_context(system, integrator, platform, props, positions):
+    if platform is None:
+        context = Context(system, integrator)
+    else:
+        context = Context(system, integrator, platform, props)
+    context.setPositions(positions)
+    context.computeVirtualSites()
+    return context
+
+
+def time_steps(context, nsteps, warmup=20):
+    """Return steps/s for `nsteps` integration steps after a warm-up."""
+    integrator = context.getIntegrator()
+    integrator.step(warmup)
+    context.getState(getEnergy=True)
+    start = time.perf_counter()
+    integrator.step(nsteps)
+    # Force a sync so asynchronous GPU platforms are timed correctly
+    context.getState(getEnergy=True)
+    return nsteps / (time.perf_counter() - start)
+
+
+def steps_per_second(system, positions, integrator, platform, props, nsteps, warmup=20):
+    """
+    Time `nsteps` integration steps and return (steps/s, context).
+    The context is returned so callers can run extra checks on it.
+    """
+    context = make_context(system, integrator, platform, props, positions)
+    return time_steps(context, nsteps, warmup), context
+
+
+def potential_energy(context):
+    state = context.getState(getEnergy=True)
+    return state.getPotentialEnergy().value_in_unit(kilojoules_per_mole)
+
+
+def with_md_option(config, key, value):
+    """Return a copy of `config` with `steps.md.<key>` replaced by `value`."""
+    cfg = copy.deepcopy(config)
+    cfg["steps"]["md"][key] = value
+    return cfg
+
+
+def bench_nonbonded(config, modeller, args, platform_config):
+    """Full charmm36 + HCT versus the CHARMM CA-only nonbonded protocol."""
+    results = []
+    for mode in ("full", "charmm_ca"):
+        cfg = with_md_option(config, "nonbonded", {"mode": mode})
+        system = build_md_system(cfg, modeller)
+        add_rg_restraint(system, args.rg, args.k_rg)
+        platform, props = select_platform(
+            platform_config, system, modeller.positions, "benchmark", prefer="CUDA"
+        )
+        rate, _ = steps_per_second(
+            system,
+            modeller.positions,
+            VerletIntegrator(args.timestep),
+            platform,
+            props,
+            args.steps,
+        )
+        results.append({"variant": mode, "steps_per_sec": rate})
+    return results
+
+
+def _energy_offsets(contexts, positions_list):
+    """Energy difference between the first two contexts at each set of positions."""
+    offsets = []
+    for positions in positions_list:
+        for context in contexts:
+            context.setPositions(positions)
+            context.computeVirtualSites()
+        offsets.append(potential_energy(contexts[0]) - potential_energy(contexts[1]))
+    return offsets
+
+
+def bench_rigid(config, modeller, args, platform_config):
+    """Intra-rigid-body interactions evaluated every step versus excluded."""
+    results, contexts = [], []
+    for exclude in (False, True):
+        cfg = copy.deepcopy(config)
+        cfg["constraints"]["exclude_intra_body"] = exclude
+        system = build_md_system(cfg, modeller)
+        add_rg_restraint(system, args.rg, args.k_rg)
+        platform, props = select_platform(
+            platform_config, system, modeller.positions, "benchmark", prefer="CUDA"
+        )
+        rate, context = steps_per_second(
+            system,
+            modeller.positions,
+            VerletIntegrator(args.timestep),
+            platform,
+            props,
+            args.steps,
+        )
+        variant = "intra-body excluded" if exclude else "baseline"
+        results.append({"variant": variant, "steps_per_sec": rate})
+        contexts.append(context)
+
+    # Excluding constant terms may only shift the energy by a constant
+    moved = contexts[0].getState(getPositions=True).getPositions()
+    offsets = _energy_offsets(contexts, [modeller.positions, moved])
+    results[1]["energy_offset_kj"] = offsets[0]
+    results[1]["offset_drift_kj"] = offsets[1] - offsets[0]
+    return results
+
+
+def bench_frozen(config, modeller, args, platform_config):
+    """Fixed bodies held by stiff harmonic restraints versus truly frozen."""
+    fixed_atoms = get_fixed_body_atoms(modeller, config["constraints"]["fixed_bodies"])
+    start = np.array(modeller.positions.value_in_unit(nanometer))[fixed_atoms]
+    results = []
+    for mode in ("restraint", "frozen"):
+        cfg = copy.deepcopy(config)
+        cfg["constraints"]["fixed_mode"] = mode
+        system = build_md_system(cfg, modeller)
+        add_rg_restraint(system, args.rg, args.k_rg)
+        platform, props = select_platform(
+            platform_config, system, modeller.positions, "benchmark", prefer="CUDA"
+        )
+        rate, context = steps_per_second(
+            system,
+            modeller.positions,
+            VerletIntegrator(args.timestep),
+            platform,
+            props,
+            args.steps,
+        )
+        state = context.getState(getPositions=True)
+        end = state.getPositions(asNumpy=True).value_in_unit(nanometer)[fixed_atoms]
+        drift = float(np.abs(end - start).max()) if fixed_atoms else 0.0
+        results.append(
+            {"variant": mode, "steps_per_sec": rate, "max_fixed_shift_nm": drift}
+        )
+    return results
+
+
+def degrees_of_freedom(system):
+    """Unconstrained degrees of freedom of the massive particles in `system`."""
+    massive = sum(
+        1
+        for i in range(system.getNumParticles())
+        if system.getParticleMass(i).value_in_unit(amu) > 0
+    )
+    return 3 * massive - system.getNumConstraints()
+
+
+def energy_drift(context, timestep, nsteps, samples=20):
+    """
+    Run `nsteps` NVE steps and fit the total-energy drift.
+    Returns (kJ/mol per ns, stable) where stable is False on NaN or failure.
+    """
+    interval = max(1, nsteps // samples)
+    times, energies = [], []
+    try:
+        for k in range(samples + 1):
+            if k:
+                context.getIntegrator().step(interval)
+            state = context.getState(getEnergy=True)
+            total = state.getPotentialEnergy() + state.getKineticEnergy()
+            total = total.value_in_unit(kilojoules_per_mole)
+            if not math.isfinite(total):
+                return float("nan"), False
+            times.append(k * interval * timestep / 1000.0)  # ps → ns
+            energies.append(total)
+    except Exception as e:
+        print(f"  ⚠️ NVE run failed: {e}")
+        return float("nan"), False
+    slope = float(np.polyfit(times, energies, 1)[0])
+    return slope, True
+
+
+def bench_hmr(config, modeller, args, platform_config):
+    """
+    Plain masses at the configured timestep versus hydrogen mass
+    repartitioning (HBonds constraints) at each of `--timesteps`.
+    Every variant also gets an NVE energy-drift check from thermal velocities.
+    """
+    temperature = float(config["steps"]["md"]["parameters"]["temperature"])
+    variants = [("baseline", None, args.timestep)]
+    variants += [
+        (f"hmr {dt * 1000:g} fs", args.hydrogen_mass, dt) for dt in args.timesteps
+    ]
+    results = []
+    for name, hydrogen_mass, dt in variants:
+        cfg = copy.deepcopy(config)
+        cfg["steps"]["md"]["parameters"]["hydrogen_mass"] = hydrogen_mass
+        system = build_md_system(cfg, modeller)
+        add_rg_restraint(system, args.rg, args.k_rg)
+        platform, props = select_platform(
+            platform_config, system, modeller.positions, "benchmark", prefer="CUDA"
+        )
+        result = {"variant": name, "timestep_ps": dt}
+        try:
+            rate, context = steps_per_second(
+                system,
+                modeller.positions,
+                VerletIntegrator(dt),
+                platform,
+                props,
+                args.steps,
+            )
+        except Exception as e:
+            print(f"  ⚠️ {name} failed: {e}")
+            results.append(dict(result, steps_per_sec=float("nan"), stable=False))
+            continue
+        context.setVelocitiesToTemperature(temperature * kelvin)
+        drift, stable = energy_drift(context, dt, args.steps)
+        result.update(
+            steps_per_sec=rate,
+            ns_per_day=rate * dt * 86400 / 1000.0,
+            drift_kj_per_ns_dof=drift / degrees_of_freedom(system),
+            stable=stable,
+        )
+        results.append(result)
+    return results
+
+
+def rg_tracking(context, atoms, rg_target, nsteps, samples=20):
+    """
+    Run `nsteps` more steps and sample the unweighted Rg (Å) of `atoms`.
+    Returns (mean Rg, RMS deviation from `rg_target`) over the samples.
+    """
+    interval = max(1, nsteps // samples)
+    values = []
+    for _ in range(samples):
+        context.getIntegrator().step(interval)
+        state = context.getState(getPositions=True)
+        xyz = state.getPositions(asNumpy=True).value_in_unit(nanometer)[atoms] * 10.0
+        values.append(np.sqrt(((xyz - xyz.mean(axis=0)) ** 2).sum(axis=1).mean()))
+    values = np.array(values)
+    return float(values.mean()), float(np.sqrt(((values - rg_target) ** 2).mean()))
+
+
+def bench_mts(config, modeller, args, platform_config):
+    """
+    Rg-restraint implementations (RGForce, centroid-bond CV over all atoms and
+    over CA atoms only), each with a single time step and with MTS.
+    """
+    temperature = float(config["steps"]["md"]["parameters"]["temperature"])
+    all_atoms = list(range(modeller.topology.getNumAtoms()))
+    ca_atoms = [a.index for a in modeller.topology.atoms() if a.name == "CA"]
+    restraints = [
+        ("rgforce", "rgforce", None),
+        ("centroid", "centroid", all_atoms),
+        ("centroid CA", "centroid", ca_atoms),
+    ]
+    results = []
+    for label, method, atoms in restraints:
+        for mts in (False, True):
+            cfg = with_md_option(
+                config, "mts", {"enabled": mts, "inner_steps": args.inner_steps}
+            )
+            system = build_md_system(cfg, modeller)
+            add_rg_restraint(system, args.rg, args.k_rg, method, atoms)
+            platform, props = select_platform(
+                platform_config, system, modeller.positions, "benchmark", prefer="CUDA"
+            )
+            rate, context = steps_per_second(
+                system,
+                modeller.positions,
+                create_md_integrator(cfg, system, args.timestep),
+                platform,
+                props,
+                args.steps,
+            )
+            context.setVelocitiesToTemperature(temperature * kelvin)
+            mean_rg, rms_err = rg_tracking(
+                context, all_atoms if atoms is None else atoms, args.rg, args.steps
+            )
+            results.append(
+                {
+                    "variant": f"{label}{' + mts' if mts else ''}",
+                    "steps_per_sec": rate,
+                    "mean_rg_A": mean_rg,
+                    "rg_rms_error_A": rms_err,
+                }
+            )
+    return results
+
+
+def bench_rg(config, modeller, args, platform_config):
+    """
+    Cost of each Rg-restraint implementation: context creation time and
+    steps/s, from the current default (RGForce over every particle) down to
+    CA-only and residue-centroid selections. Run it over several --pdb files
+    to see how each scales with system size.
+    """
+    ca_atoms = [a.index for a in modeller.topology.atoms() if a.name == "CA"]
+    all_atoms = list(range(modeller.topology.getNumAtoms()))
+    restraints = [
+        ("rgforce all", "rgforce", None),
+        ("rgforce CA", "rgforce", ca_atoms),
+        ("centroid all", "centroid", all_atoms),
+        ("centroid CA", "centroid", ca_atoms),
+        ("residue centroids", "residue", None),
+        ("no restraint", None, None),
+    ]
+    results = []
+    for label, method, atoms in restraints:
+        system = build_md_system(config, modeller)
+        if method is not None:
+            add_rg_restraint(
+                system, args.rg, args.k_rg, method, atoms, modeller.topology
+            )
+        platform, props = select_platform(
+            platform_config, system, modeller.positions, "benchmark", prefer="CUDA"
+        )
+        start = time.perf_counter()
+        context = make_context(
+            system, VerletIntegrator(args.timestep), platform, props, modeller.positions
+        )
+        context.getState(getEnergy=True)
+        created = time.perf_counter() - start
+        rate = time_steps(context, args.steps)
+        results.append(
+            {"variant": label, "steps_per_sec": rate, "context_seconds": created}
+        )
+    return results
+
+
+def energy_terms(context, system):
+    """Potential energy (kJ/mol) of each force class, one force group per force."""
+    terms = {}
+    for i, force in enumerate(system.getForces()):
+        state = context.getState(getEnergy=True, groups={i})
+        energy = state.getPotentialEnergy().value_in_unit(kilojoules_per_mole)
+        name = force.__class__.__name__
+        terms[name] = terms.get(name, 0.0) + energy
+    return terms
+
+
+def bench_psf(config, modeller, args, platform_config):
+    """
+    System setup through PDBFixer + ForceField template matching versus the
+    PSF/CRD with the CHARMM toppar files, as minimize.py builds it.
+
+    Setup time covers reading the inputs, parsing the force field and
+    createSystem. For the energy check the ForceField System is rebuilt on
+    the PSF topology so both are evaluated at the same CRD coordinates.
+    """
+    if not (config["input"].get("psf_file") and config["input"].get("crd_file")):
+        raise ValueError("psf mode needs input.psf_file and input.crd_file (or --psf)")
+    kwargs = {
+        "nonbondedMethod": CutoffNonPeriodic,
+        "nonbondedCutoff": 1.2 * nanometer,
+        "constraints": HBonds,
+        "soluteDielectric": 1.0,
+        "solventDielectric": 78.5,
+    }
+
+    start = time.perf_counter()
+    fixer = PDBFixer(filename=input_path(config, config["input"]["pdb_file"]))
+    fixer.findMissingResidues()
+    fixer.findMissingAtoms()
+    fixer.addMissingAtoms()
+    fixer.addMissingHydrogens(pH=7.0)
+    forcefield = ForceField(*config["input"]["forcefield"])
+    forcefield.createSystem(fixer.topology, **kwargs)
+    ff_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    psf = CharmmPsfFile(input_path(config, config["input"]["psf_file"]))
+    positions = CharmmCrdFile(input_path(config, config["input"]["crd_file"])).positions
+    params = CharmmParameterSet(*toppar_files(config))
+    psf_system = psf.createSystem(
+        params, implicitSolvent=implicit_solvent(config), **kwargs
+    )
+    psf_seconds = time.perf_counter() - start
+
+    ff_system = forcefield.createSystem(psf.topology, **kwargs)
+    results, energies = [], []
+    for label, system, seconds in (
+        ("pdbfixer + forcefield", ff_system, ff_seconds),
+        ("psf + toppar", psf_system, psf_seconds),
+    ):
+        for i, force in enumerate(system.getForces()):
+            force.setForceGroup(i)
+        platform, props = select_platform(
+            platform_config, system, positions, "benchmark", prefer="CUDA"
+        )
+        context = make_context(
+            system, VerletIntegrator(args.timestep), platform, props, positions
+        )
+        energies.append((potential_energy(context), energy_terms(context, system)))
+        rate = time_steps(context, args.steps)
+        results.append(
+            {"variant": label, "steps_per_sec": rate, "setup_seconds": seconds}
+        )
+
+    (ff_energy, ff_terms), (psf_energy, psf_terms) = energies
+    results[0]["energy_kj"] = ff_energy
+    results[1]["energy_kj"] = psf_energy
+    results[1]["energy_delta_kj"] = psf_energy - ff_energy
+    results[1]["setup_speedup"] = ff_seconds / psf_seconds
+    print("  Energy terms (kJ/mol)     forcefield         psf       delta")
+    for name in sorted(set(ff_terms) | set(psf_terms)):
+        a, b = ff_terms.get(name, 0.0), psf_terms.get(name, 0.0)
+        print(f"  {name:<24} {a:11.2f} {b:11.2f} {b - a:11.3f}")
+    return results
+
+
+MODES = {
+    "nonbonded": bench_nonbonded,
+    "rigid": bench_rigid,
+    "frozen": bench_frozen,
+    "hmr": bench_hmr,
+    "mts": bench_mts,
+    "rg": bench_rg,
+    "psf": bench_psf,
+}
+
+
+def _default_rg(config):
+    rg_sets = config["steps"]["md"]["rgyr"].get("rg_sets") or [[]]
+    return float(rg_sets[0][0]) if rg_sets[0] else 30.0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark OpenMM MD options on the structures of a BilboMD job."
+    )
+    parser.add_argument("config_path", help="Path to openmm_config.yaml")
+    parser.add_argument("--mode", choices=sorted(MODES), required=True)
+    parser.add_argument(
+        "--pdb",
+        nargs="*",
+        default=None,
+        help="Structures to benchmark (default: the heated PDB from the config)",
+    )
+    parser.add_argument("--steps", type=int, default=2000, help="Timed steps per run")
+    parser.add_argument("--rg", type=float, default=None, help="Rg target in Å")
+    parser.add_argument("--platform", default=None, help="Force an OpenMM platform")
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    parser.add_argument(
+        "--timesteps",
+        type=float,
+        nargs="+",
+        default=[0.002, 0.003, 0.004],
+        help="Timesteps (ps) to try with hydrogen mass repartitioning (hmr mode)",
+    )
+    parser.add_argument(
+        "--hydrogen-mass",
+        type=float,
+        default=3.0,
+        help="Repartitioned hydrogen mass in amu (hmr mode)",
+    )
+    parser.add_argument(
+        "--inner-steps",
+        type=int,
+        default=2,
+        help="Fast-force steps per outer step (mts mode)",
+    )
+    parser.add_argument(
+        "--psf",
+        nargs=2,
+        metavar=("PSF", "CRD"),
+        default=None,
+        help="CHARMM PSF and CRD to compare against (psf mode, default: config)",
+    )
+    args = parser.parse_args()
+
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    if args.psf:
+        config["input"]["psf_file"], config["input"]["crd_file"] = args.psf
+
+    if args.pdb is None:
+        output_dir = config["output"]["output_dir"]
+        heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
+        args.pdb = [os.path.join(heat_dir, config["steps"]["heating"]["output_pdb"])]
+    if args.rg is None:
+        args.rg = _default_rg(config)
+    args.k_rg = float(config["steps"]["md"]["rgyr"]["k_rg"])
+    args.timestep = float(config["steps"]["md"]["parameters"]["timestep"])
+    platform_config = {"platform": {"name": args.platform}} if args.platform else {}
+
+    report = []
+    for pdb_path in args.pdb:
+        pdb = PDBFile(pdb_path)
+        modeller = Modeller(pdb.topology, pdb.positions)
+        natoms = modeller.topology.getNumAtoms()
+        print(f"\n📏 {pdb_path}: {natoms} atoms")
+        results = MODES[args.mode](config, modeller, args, platform_config)
+        baseline = results[0]["steps_per_sec"]
+        for r in results:
+            r["speedup"] = r["steps_per_sec"] / baseline
+            extras = "".join(
+                f"  {k}={v:.4g}" if isinstance(v, float) else f"  {k}={v}"
+                for k, v in r.items()
+                if k not in ("variant", "steps_per_sec", "speedup")
+            )
+            print(
+                f"  {r['variant']:<24} {r['steps_per_sec']:10.1f} steps/s  "
+                f"x{r['speedup']:.2f}{extras}"
+            )
+        report.append({"pdb": pdb_path, "atoms": natoms, "results": results})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "structures": report}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
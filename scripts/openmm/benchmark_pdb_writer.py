@@ -0,0 +1,133 @@
+"""Frames/sec of PDBFile.writeFile versus the templated PDB frame writer"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from openmm.app import PDBFile, Topology, element
+
+from utils.pdb_writer import PDBTemplate, write_frames
+
+# Heavy atoms and hydrogens of one alanine residue
+ALA_ATOMS = [
+    ("N", "N"),
+    ("H", "H"),
+    ("CA", "C"),
+    ("HA", "H"),
+    ("CB", "C"),
+    ("HB1", "H"),
+    ("HB2", "H"),
+    ("HB3", "H"),
+    ("C", "C"),
+    ("O", "O"),
+]
+
+
+def synthetic_topology(natoms, residues_per_chain=500):
+    """Poly-alanine chains totalling at least `natoms` atoms."""
+    topology = Topology()
+    chain = None
+    for i in range((natoms + len(ALA_ATOMS) - 1) // len(ALA_ATOMS)):
+        if i % residues_per_chain == 0:
+            chain = topology.addChain()
+        residue = topology.addResidue("ALA", chain)
+        for name, symbol in ALA_ATOMS:
+            topology.addAtom(name, element.get_by_symbol(symbol), residue)
+    return topology
+
+
+def random_walk_frames(natoms, nframes, seed=0):
+    """(nframes, natoms, 3) Å coordinates of a compact random walk."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(scale=0.9, size=(nframes, natoms, 3))
+    coords = np.cumsum(steps, axis=1)
+    return coords - coords.mean(axis=1, keepdims=True)
+
+
+def bench_topology(topology, frames, workers):
+    """Time both writers on the same frames and check they agree byte-for-byte."""
+    natoms = topology.getNumAtoms()
+    results = {"atoms": natoms, "frames": len(frames)}
+
+    start = time.perf_counter()
+    reference = []
+    for xyz in frames:
+        out = io.StringIO()
+        PDBFile.writeFile(topology, xyz, out)
+        reference.append(out.getvalue())
+    results["writefile_fps"] = len(frames) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    template = PDBTemplate(topology)
+    results["template_seconds"] = time.perf_counter() - start
+    start = time.perf_counter()
+    templated = [template.format(xyz) for xyz in frames]
+    results["templated_fps"] = len(frames) / (time.perf_counter() - start)
+    results["identical"] = templated == reference
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [os.path.join(tmp, f"frame_{i:06d}.pdb") for i in range(len(frames))]
+        start = time.perf_counter()
+        write_frames(template, paths, frames, workers=workers)
+        results["parallel_fps"] = len(frames) / (time.perf_counter() - start)
+    results["speedup"] = results["templated_fps"] / results["writefile_fps"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark PDB frame export: PDBFile.writeFile vs PDBTemplate."
+    )
+    parser.add_argument(
+        "--atoms",
+        type=int,
+        nargs="+",
+        default=[10000, 30000, 100000],
+        help="Synthetic system sizes (poly-alanine)",
+    )
+    parser.add_argument(
+        "--pdb", nargs="*", default=[], help="Also benchmark these structures"
+    )
+    parser.add_argument("--frames", type=int, default=20, help="Frames per system")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes for the parallel file export",
+    )
+    parser.add_argument("--output", default=None, help="Write results as JSON")
+    args = parser.parse_args()
+
+    systems = [(f"ala {n}", synthetic_topology(n)) for n in args.atoms]
+    systems += [(path, PDBFile(path).topology) for path in args.pdb]
+
+    report = []
+    print(
+        f"{'system':<24} {'atoms':>7} {'writeFile':>10} {'template':>10} "
+        f"{'parallel':>10} {'speedup':>8}  identical"
+    )
+    for label, topology in systems:
+        frames = random_walk_frames(topology.getNumAtoms(), args.frames)
+        r = bench_topology(topology, frames, args.workers)
+        r["system"] = label
+        print(
+            f"{label:<24} {r['atoms']:>7} {r['writefile_fps']:>8.2f}/s "
+            f"{r['templated_fps']:>8.2f}/s {r['parallel_fps']:>8.2f}/s "
+            f"x{r['speedup']:>7.1f}  {'yes' if r['identical'] else 'NO'}"
+        )
+        report.append(r)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"workers": args.workers, "systems": report}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    return 0 if all(r["identical"] for r in report) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""Coarse-grained CA-only OpenMM MD for fast Rg-range pre-screening"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import yaml
+from openmm import (
+    CustomNonbondedForce,
+    HarmonicBondForce,
+    LangevinMiddleIntegrator,
+    System,
+    Vec3,
+)
+from openmm.app import (
+    DCDReporter,
+    Element,
+    Modeller,
+    PDBFile,
+    Simulation,
+    StateDataReporter,
+    Topology,
+)
+from openmm.unit import amu, kelvin, nanometer, picoseconds
+
+from md import add_rg_restraint, rg_dir_name
+from utils.exclusions import find_close_pairs
+from utils.fixed_bodies import apply_fixed_body_constraints
+from utils.pdb_writer import PDBFrameWriter
+from utils.platform_tuner import select_platform
+from utils.rgyr import RadiusOfGyrationReporter
+from utils.rigid_body import get_rigid_bodies
+from utils.checkpoint import read_run_status, write_run_status
+
+CA_MASS = 110.0  # average residue mass (amu)
+CA_BOND_LENGTH = 0.38  # nm
+MAX_BOND_LENGTH = 0.45  # nm; longer CA-CA gaps are treated as chain breaks
+
+CG_DEFAULTS = {
+    "temperature": 300.0,
+    "friction": 1.0,
+    "timestep": 0.01,
+    "nsteps": 200000,
+    "report_interval": 1000,
+    "k_bond": 20000.0,
+    "k_enm": 5000.0,
+    "enm_cutoff": 1.0,
+    "k_repulsion": 1000.0,
+    "repulsion_distance": 0.4,
+    "minimize_iterations": 500,
+}
+
+
+def build_ca_model(pdb_path):
+    """
+    Read a PDB and keep only the CA atoms, with chain and residue numbering
+    unchanged so rigid/fixed body definitions from const.inp still apply.
+    Consecutive CAs closer than MAX_BOND_LENGTH are bonded.
+    """
+    pdb = PDBFile(pdb_path)
+    xyz = pdb.getPositions(asNumpy=True).value_in_unit(nanometer)
+    topology = Topology()
+    positions = []
+    carbon = Element.getBySymbol("C")
+    for chain in pdb.topology.chains():
+        new_chain = topology.addChain(chain.id)
+        previous = None
+        for residue in chain.residues():
+            ca = next((a for a in residue.atoms() if a.name == "CA"), None)
+            if ca is None:
+                continue
+            new_residue = topology.addResidue(
+                residue.name, new_chain, residue.id, residue.insertionCode
+            )
+            atom = topology.addAtom("CA", carbon, new_residue)
+            positions.append(xyz[ca.index])
+            if (
+                previous is not None
+                and np.linalg.norm(positions[-1] - positions[previous.index])
+                < MAX_BOND_LENGTH
+            ):
+                topology.addBond(previous, atom)
+            previous = atom
+    return topology, np.array(positions)
+
+
+def build_cg_system(config, modeller, cg):
+    """
+    CA-only System: harmonic CA-CA bonds along the chain, an elastic network
+    inside every rigid and fixed body, positional restraints on fixed bodies
+    and a soft repulsive wall between all other CA pairs.
+    """
+    positions = modeller.positions
+    system = System()
+    for _ in range(modeller.topology.getNumAtoms()):
+        system.addParticle(CA_MASS * amu)
+
+    chain_bonds = [(a.index, b.index) for a, b in modeller.topology.bonds()]
+    backbone = HarmonicBondForce()
+    backbone.setName("CABonds")
+    for i, j in chain_bonds:
+        backbone.addBond(i, j, CA_BOND_LENGTH, cg["k_bond"])
+    system.addForce(backbone)
+
+    bodies = []
+    for key in ("rigid_bodies", "fixed_bodies"):
+        bodies += get_rigid_bodies(modeller, config["constraints"][key]).values()
+    xyz = np.asarray(positions.value_in_unit(nanometer))
+    enm = HarmonicBondForce()
+    enm.setName("ElasticNetwork")
+    enm_pairs = set()
+    for body in bodies:
+        for i, j in find_close_pairs(positions, body, cg["enm_cutoff"]).tolist():
+            if (i, j) in enm_pairs:
+                continue
+            enm_pairs.add((i, j))
+            enm.addBond(i, j, float(np.linalg.norm(xyz[i] - xyz[j])), cg["k_enm"])
+    system.addForce(enm)
+    print(f"Elastic network: {len(enm_pairs)} bonds in {len(bodies)} bodies")
+
+    apply_fixed_body_constraints(
+        system, modeller, config["constraints"]["fixed_bodies"]
+    )
+
+    repulsion = CustomNonbondedForce("k_rep * step(d_rep - r) * (d_rep - r)^2")
+    repulsion.addGlobalParameter("k_rep", cg["k_repulsion"])
+    repulsion.addGlobalParameter("d_rep", cg["repulsion_distance"])
+    for _ in range(system.getNumParticles()):
+        repulsion.addParticle([])
+    repulsion.setNonbondedMethod(CustomNonbondedForce.CutoffNonPeriodic)
+    repulsion.setCutoffDistance(cg["repulsion_distance"])
+    repulsion.createExclusionsFromBonds(chain_bonds, 2)
+    excluded = {
+        tuple(sorted(repulsion.getExclusionParticles(k)))
+        for k in range(repulsion.getNumExclusions())
+    }
+    for pair in enm_pairs - excluded:
+        repulsion.addExclusion(*pair)
+    system.addForce(repulsion)
+    return system
+
+
+def run_cg_for_rg(rg, config, modeller, cg_dir):
+    """Run one coarse-grained trajectory for Rg target `rg` (Å)."""
+    cg = dict(CG_DEFAULTS, **(config["steps"].get("cg_md") or {}))
+    md_config = config["steps"]["md"]
+    nsteps = int(cg["nsteps"])
+    report_interval = int(cg["report_interval"])
+
+    rg_dir = os.path.join(cg_dir, rg_dir_name(rg))
+    os.makedirs(rg_dir, exist_ok=True)
+    if read_run_status(rg_dir).get("completed"):
+        print(f"⏭️ CG Rg {rg} already completed; skipping.")
+        return
+
+    system = build_cg_system(config, modeller, cg)
+    add_rg_restraint(system, rg, float(md_config["rgyr"]["k_rg"]))
+
+    integrator = LangevinMiddleIntegrator(
+        cg["temperature"] * kelvin,
+        cg["friction"] / picoseconds,
+        cg["timestep"] * picoseconds,
+    )
+    platform, props = select_platform(
+        config, system, modeller.positions, "cg_md", prefer="CPU"
+    )
+    if platform is None:
+        simulation = Simulation(modeller.topology, system, integrator)
+    else:
+        simulation = Simulation(modeller.topology, system, integrator, platform, props)
+    simulation.context.setPositions(modeller.positions)
+    print(
+        f"🔁 CG MD for Rg {rg} Å on {simulation.context.getPlatform().getName()}: "
+        f"{system.getNumParticles()} beads, {nsteps} steps"
+    )
+    simulation.minimizeEnergy(maxIterations=int(cg["minimize_iterations"]))
+    simulation.context.setVelocitiesToTemperature(cg["temperature"] * kelvin)
+
+    base_name = os.path.splitext(md_config["output_pdb"])[0]
+    simulation.reporters.append(
+        StateDataReporter(
+            sys.stdout, 10 * report_interval, step=True, temperature=True, speed=True
+        )
+    )
+    simulation.reporters.append(
+        DCDReporter(os.path.join(rg_dir, md_config["output_dcd"]), report_interval)
+    )
+    simulation.reporters.append(
+        RadiusOfGyrationReporter(
+            list(range(system.getNumParticles())),
+            system,
+            os.path.join(rg_dir, md_config["rgyr"]["filename"]),
+            reportInterval=report_interval,
+        )
+    )
+    simulation.reporters.append(
+        PDBFrameWriter(rg_dir, base_name, reportInterval=report_interval)
+    )
+
+    start = time.perf_counter()
+    simulation.step(nsteps)
+    elapsed = time.perf_counter() - start
+
+    state = simulation.context.getState(getPositions=True)
+    final_pdb = os.path.join(rg_dir, md_config["output_pdb"])
+    with open(final_pdb, "w", encoding="utf-8") as fh:
+        PDBFile.writeFile(simulation.topology, state.getPositions(), fh)
+    write_run_status(
+        rg_dir,
+        {
+            "rg": rg,
+            "target_steps": nsteps,
+            "steps_completed": nsteps,
+            "completed": True,
+            "wall_seconds": round(elapsed, 1),
+        },
+    )
+    print(f"✅ CG MD for Rg {rg} done in {elapsed:.1f} s. Results in {rg_dir}")
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Coarse-grained CA-only MD over the Rg targets of a BilboMD job."
+    )
+    parser.add_argument("config_path", help="Path to openmm_config.yaml")
+    parser.add_argument(
+        "--rg-set", type=int, default=None, help="Only run this rg_set (default: all)"
+    )
+    parser.add_argument(
+        "--pdb", default=None, help="Input structure (default: the job's input PDB)"
+    )
+    args = parser.parse_args()
+
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    rg_sets = config["steps"]["md"]["rgyr"].get("rg_sets", [])
+    if args.rg_set is not None:
+        rg_sets = [rg_sets[args.rg_set]]
+    rgs = [rg for rg_set in rg_sets for rg in rg_set]
+    if not rgs:
+        print("No rg_sets found in config.")
+        return 1
+
+    pdb_path = args.pdb or os.path.join(
+        config["input"]["dir"], config["input"]["pdb_file"]
+    )
+    topology, positions = build_ca_model(pdb_path)
+    modeller = Modeller(topology, [Vec3(*p) for p in positions] * nanometer)
+    print(f"CA model of {pdb_path}: {topology.getNumAtoms()} beads")
+
+    cg_dir = os.path.join(
+        config["output"]["output_dir"], config["output"].get("cg_md_dir", "cg_md")
+    )
+    os.makedirs(cg_dir, exist_ok=True)
+
+    # Shard the Rg list over Slurm tasks (round-robin), as md.py does
+    task_id = _env_int("SLURM_PROCID", 0)
+    world_sz = _env_int("SLURM_NTASKS", 1)
+    failures = 0
+    for rg in rgs[task_id::world_sz]:
+        try:
+            run_cg_for_rg(rg, config, modeller, cg_dir)
+        except Exception as e:
+            failures += 1
+            print(f"[cg_md.py] FAILED Rg={rg} -> {e}", flush=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
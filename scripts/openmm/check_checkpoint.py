@@ -0,0 +1,190 @@
+"""Check the resume helpers of utils/checkpoint.py on synthetic DCD/CSV/PDB output"""
+
+import argparse
+import csv
+import os
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+from utils.checkpoint import (
+    remove_frames_after_step,
+    trim_csv_after_step,
+    truncate_dcd,
+)
+from utils.dcd import DCDTrajectory, read_dcd_header
+
+FIRST_STEP = 100
+INTERVAL = 100
+
+
+def _record(payload):
+    """A Fortran unformatted record: length, payload, length."""
+    return struct.pack("<i", len(payload)) + payload + struct.pack("<i", len(payload))
+
+
+def write_dcd(path, frames, box=False, free_atoms=None):
+    """
+    Write (n_frames, n_atoms, 3) Å coordinates as a DCD laid out like OpenMM's
+    DCDFile, or like CHARMM with fixed atoms when `free_atoms` (0-based) is
+    given: later frames then hold only the free atoms.
+    """
+    nframes, natoms, _ = frames.shape
+    namnf = 0 if free_atoms is None else natoms - len(free_atoms)
+    last_step = FIRST_STEP + nframes * INTERVAL
+    header = struct.pack(
+        "<4s9if", b"CORD", nframes, FIRST_STEP, INTERVAL, last_step, 0, 0, 0, 0,
+        namnf, 0.001,
+    )  # fmt: skip
+    header += struct.pack("<10i", int(box), 0, 0, 0, 0, 0, 0, 0, 0, 24)
+    titles = struct.pack("<i80s80s", 2, b"Created by check_checkpoint", b"")
+    with open(path, "wb") as fh:
+        fh.write(_record(header))
+        fh.write(_record(titles))
+        fh.write(_record(struct.pack("<i", natoms)))
+        if free_atoms is not None:
+            fh.write(_record((np.asarray(free_atoms) + 1).astype("<i4").tobytes()))
+        for f, xyz in enumerate(frames):
+            if box:
+                fh.write(_record(struct.pack("<6d", 10.0, 0.0, 10.0, 0.0, 0.0, 10.0)))
+            if f and free_atoms is not None:
+                xyz = xyz[free_atoms]
+            for k in range(3):
+                fh.write(_record(xyz[:, k].astype("<f4").tobytes()))
+
+
+def check_dcd(tmp, label, frames, last_step, box=False, free_atoms=None):
+    """Truncate a synthetic DCD at `last_step`; returns a list of failures."""
+    path = os.path.join(tmp, f"{label}.dcd")
+    write_dcd(path, frames, box=box, free_atoms=free_atoms)
+    before = read_dcd_header(path)
+    # A frame cut short by the preemption must be dropped as well
+    with open(path, "ab") as fh:
+        fh.write(b"\0" * (before["frame_size"] // 2))
+
+    expected = 0
+    if last_step >= FIRST_STEP:
+        expected = min(len(frames), (last_step - FIRST_STEP) // INTERVAL + 1)
+    kept = truncate_dcd(path, last_step)
+
+    with open(path, "rb") as fh:
+        fh.seek(8)
+        (count,) = struct.unpack("<i", fh.read(4))
+        fh.seek(20)
+        (last,) = struct.unpack("<i", fh.read(4))
+    size = before["header_size"]
+    if expected:
+        size += before["first_frame_size"] + (expected - 1) * before["frame_size"]
+
+    failures = []
+    checks = [
+        ("frames kept", kept, expected),
+        ("header frame count (offset 8)", count, expected),
+        ("header last step (offset 20)", last, FIRST_STEP + expected * INTERVAL),
+        ("file size", os.path.getsize(path), size),
+    ]
+    for name, got, want in checks:
+        if got != want:
+            failures.append(f"{label}: {name} is {got}, expected {want}")
+    if expected and not failures:
+        xyz = DCDTrajectory(path).positions()
+        reference = frames[:expected].astype(np.float32)
+        if free_atoms is not None:
+            # Fixed atoms keep their first-frame coordinates
+            fixed = np.setdiff1d(np.arange(frames.shape[1]), free_atoms)
+            reference[:, fixed] = reference[0, fixed]
+        if not np.array_equal(xyz, reference):
+            failures.append(f"{label}: kept coordinates differ from the originals")
+    return failures
+
+
+def check_csv(tmp, nframes, last_step):
+    """Trim a synthetic Rg CSV at `last_step`; returns a list of failures."""
+    path = os.path.join(tmp, "rgyr.csv")
+    steps = [FIRST_STEP + i * INTERVAL for i in range(nframes)]
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["Step", "Radius_of_Gyration_nm"])
+        writer.writerows([step, 2.0 + 0.001 * step] for step in steps)
+    trim_csv_after_step(path, last_step)
+    with open(path, "r", newline="", encoding="utf-8") as fh:
+        rows = list(csv.reader(fh))
+
+    failures = []
+    if rows[0] != ["Step", "Radius_of_Gyration_nm"]:
+        failures.append(f"csv: header is {rows[0]}")
+    got = [int(row[0]) for row in rows[1:]]
+    want = [step for step in steps if step <= last_step]
+    if got != want:
+        failures.append(f"csv: steps {got}, expected {want}")
+    if os.path.exists(f"{path}.tmp"):
+        failures.append("csv: temporary file left behind")
+    return failures
+
+
+def check_pdb_frames(tmp, nframes, last_step):
+    """Remove synthetic md_<step>.pdb frames after `last_step`."""
+    directory = os.path.join(tmp, "frames")
+    os.makedirs(directory)
+    steps = [FIRST_STEP + i * INTERVAL for i in range(nframes)]
+    for step in steps:
+        with open(os.path.join(directory, f"md_{step}.pdb"), "w", encoding="utf-8"):
+            pass
+    # Files that only look like frames must survive
+    for name in ("md.pdb", "md_final.pdb", "other_100000.pdb"):
+        with open(os.path.join(directory, name), "w", encoding="utf-8"):
+            pass
+    removed = remove_frames_after_step(directory, "md", last_step)
+
+    failures = []
+    want = sorted(
+        [f"md_{step}.pdb" for step in steps if step <= last_step]
+        + ["md.pdb", "md_final.pdb", "other_100000.pdb"]
+    )
+    if sorted(os.listdir(directory)) != want:
+        failures.append(f"pdb: left {sorted(os.listdir(directory))}, expected {want}")
+    if removed != sum(1 for step in steps if step > last_step):
+        failures.append(f"pdb: reported {removed} removed")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check DCD/CSV/PDB truncation on resume from a checkpoint."
+    )
+    parser.add_argument("--atoms", type=int, default=50, help="Atoms per frame")
+    parser.add_argument("--frames", type=int, default=10, help="Frames written")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = rng.normal(scale=10.0, size=(args.frames, args.atoms, 3))
+    free = np.arange(0, args.atoms, 2)
+    mid_step = FIRST_STEP + (args.frames // 2) * INTERVAL - INTERVAL // 2
+    end_step = FIRST_STEP + args.frames * INTERVAL
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for last_step in (mid_step, FIRST_STEP, FIRST_STEP - 1, end_step):
+            for label, box, free_atoms in (
+                ("openmm", False, None),
+                ("openmm_box", True, None),
+                ("charmm_fixed", False, free),
+            ):
+                failures += check_dcd(
+                    tmp, f"{label}_{last_step}", frames, last_step, box, free_atoms
+                )
+            failures += check_csv(tmp, args.frames, last_step)
+        failures += check_pdb_frames(tmp, args.frames, mid_step)
+
+    for failure in failures:
+        print(f"FAILED {failure}")
+    if failures:
+        return 1
+    print("✅ truncate_dcd, trim_csv_after_step and remove_frames_after_step OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+Extract PDB frames, Rg and Dmax from CHARMM/OpenMM DCD trajectories.
+
+Drop-in replacement for the CHARMM dcd2pdb.inp loop: for every frame of
+dynamics_rg<rg>_run<run>.dcd it writes foxs/rg<rg>_run<run>/<basename>_<step>.pdb
+and appends "*<basename>_<step> <rgyr> <maxd>" to the Rg file, where rgyr is
+the unweighted radius of gyration of all atoms (as `coor rgyr`) and maxd the
+largest CA-CA distance (as `COOR MAXD`). Each PDB carries the same values in
+its "REMARK DCD2PDB_RG<rg>_RUN<run>_<step> <rgyr> <maxd>" title, as CHARMM
+writes it. The trajectory is memory-mapped and
+Rg/Dmax are computed for many frames at once; Dmax only compares the atoms on
+the convex hull of each frame.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.dcd import DCDTrajectory, max_dimension, radius_of_gyration
+
+# Name conversions applied by CHARMM's `write coor pdb official`
+OFFICIAL_RESNAMES = {"HSD": "HIS", "HSE": "HIS", "HSP": "HIS"}
+OFFICIAL_ATOM_NAMES = {("ILE", "CD"): "CD1"}
+DCD_PATTERN = re.compile(r"dynamics_rg(\d+)_run(\d+)\.dcd$")
+
+
+def read_psf_atoms(psf_path):
+    """Atoms of a CHARMM PSF as (segid, resid, resname, name) tuples."""
+    atoms = []
+    with open(psf_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if "!NATOM" in line:
+                natom = int(line.split()[0])
+                for _ in range(natom):
+                    fields = next(fh).split()
+                    atoms.append((fields[1], fields[2], fields[3], fields[4]))
+                break
+    if not atoms:
+        raise ValueError(f"No !NATOM section in {psf_path}")
+    return atoms
+
+
+def read_pdb_atoms(pdb_path):
+    """Atoms of a template PDB (e.g. an OpenMM minimized.pdb) in the same form."""
+    atoms = []
+    with open(pdb_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if line.startswith(("ATOM", "HETATM")):
+                segid = line[72:76].strip() or line[21]
+                resid = line[22:27].strip()
+                atoms.append((segid, resid, line[17:21].strip(), line[12:16].strip()))
+    return atoms
+
+
+def atom_record_templates(atoms):
+    """
+    Fixed parts of every ATOM record (everything except x, y, z) in CHARMM
+    official style, with the chain ID taken from the last character of the
+    segid as the PDB remediation step does.
+    """
+    prefixes, suffixes = [], []
+    for serial, (segid, resid, resname, name) in enumerate(atoms, start=1):
+        name = OFFICIAL_ATOM_NAMES.get((resname, name), name)
+        resname = OFFICIAL_RESNAMES.get(resname, resname)
+        match = re.match(r"(-?\d+)(\D?)", resid)
+        resseq, icode = (int(match.group(1)), match.group(2)) if match else (0, "")
+        atom_name = name if len(name) >= 4 else f" {name}"
+        prefixes.append(
+            f"ATOM  {serial % 100000:5d} {atom_name:<4} {resname:<4}"
+            f"{segid[-1:] or ' '}{resseq % 10000:4d}{icode:1}   "
+        )
+        suffixes.append(f"  1.00  0.00      {segid:<4}\n")
+    return prefixes, suffixes
+
+
+_templates = None
+
+
+def _init_worker(prefixes, suffixes):
+    global _templates
+    _templates = (prefixes, suffixes)
+
+
+def _write_frames(paths, coords, titles):
+    prefixes, suffixes = _templates
+    for path, xyz, title in zip(paths, coords, titles):
+        lines = [f"REMARK {title}\n"]
+        lines += [
+            f"{p}{x:8.3f}{y:8.3f}{z:8.3f}{s}"
+            for p, (x, y, z), s in zip(prefixes, xyz.tolist(), suffixes)
+        ]
+        lines.append("END\n")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write("".join(lines))
+        os.replace(tmp_path, path)
+    return len(paths)
+
+
+def convert_dcd(dcd_path, out_dir, basename, atoms, pool, chunk=200):
+    """
+    Write every frame of one DCD as <out_dir>/<basename>_<step>.pdb and return
+    the Rg-file lines for them, in frame order.
+    """
+    traj = DCDTrajectory(dcd_path)
+    if traj.natoms != len(atoms):
+        raise ValueError(
+            f"{dcd_path} has {traj.natoms} atoms but the topology has {len(atoms)}"
+        )
+    os.makedirs(out_dir, exist_ok=True)
+    ca = [i for i, atom in enumerate(atoms) if atom[3] == "CA"]
+    steps = traj.steps()
+    lines, futures = [], []
+    for start in range(0, len(traj), chunk):
+        frames = slice(start, min(start + chunk, len(traj)))
+        coords = traj.positions(frames=frames)
+        rgyr = radius_of_gyration(coords.astype(np.float64))
+        maxd = max_dimension(coords[:, ca]) if ca else np.zeros(len(coords))
+        names = [f"{basename}_{int(step)}" for step in steps[frames]]
+        paths = [os.path.join(out_dir, f"{name}.pdb") for name in names]
+        # Title as written by dcd2pdb.inp, read back by the Rg/Dmax analysis
+        titles = [f"{n.upper()} {r:.5f} {d:.5f}" for n, r, d in zip(names, rgyr, maxd)]
+        futures.append(pool.submit(_write_frames, paths, coords, titles))
+        lines += [f"*{n} {r:.5f} {d:.5f}\n" for n, r, d in zip(names, rgyr, maxd)]
+    written = sum(f.result() for f in futures)
+    print(f"✅ {dcd_path}: {written} frames -> {out_dir}")
+    return lines
+
+
+def find_charmm_runs(work_dir):
+    """(dcd path, foxs run name, basename) for every dynamics_rg*_run*.dcd."""
+    runs = []
+    for path in sorted(glob.glob(os.path.join(work_dir, "dynamics_rg*_run*.dcd"))):
+        match = DCD_PATTERN.search(os.path.basename(path))
+        if match:
+            rg, run = match.groups()
+            runs.append((path, f"rg{rg}_run{run}", f"dcd2pdb_rg{rg}_run{run}"))
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract PDB frames with Rg and Dmax from DCD trajectories."
+    )
+    topology = parser.add_mutually_exclusive_group(required=True)
+    topology.add_argument("--psf", help="CHARMM PSF describing the atoms")
+    topology.add_argument("--pdb", help="Template PDB describing the atoms")
+    parser.add_argument("--dcd", help="Single DCD to convert")
+    parser.add_argument("--out-dir", help="Output directory for --dcd")
+    parser.add_argument("--basename", help="PDB file prefix for --dcd")
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Convert every dynamics_rg*_run*.dcd in --work-dir into foxs/rg*_run*",
+    )
+    parser.add_argument("--work-dir", default=".", help="BilboMD job directory")
+    parser.add_argument(
+        "--rg-file", default="foxs_rg.out", help="Rg/Dmax file to append to"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="PDB writer processes"
+    )
+    args = parser.parse_args()
+
+    if args.all:
+        runs = [
+            (dcd, os.path.join(args.work_dir, "foxs", run), basename)
+            for dcd, run, basename in find_charmm_runs(args.work_dir)
+        ]
+    elif args.dcd and args.out_dir and args.basename:
+        runs = [(args.dcd, args.out_dir, args.basename)]
+    else:
+        parser.error("use --all or give --dcd, --out-dir and --basename")
+    if not runs:
+        print(f"No DCD files found in {args.work_dir}")
+        return 1
+
+    atoms = read_psf_atoms(args.psf) if args.psf else read_pdb_atoms(args.pdb)
+    prefixes, suffixes = atom_record_templates(atoms)
+    start = time.perf_counter()
+    rg_lines = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, args.workers),
+        initializer=_init_worker,
+        initargs=(prefixes, suffixes),
+    ) as pool:
+        for dcd_path, out_dir, basename in runs:
+            rg_lines += convert_dcd(dcd_path, out_dir, basename, atoms, pool)
+            # CHARMM leaves a <basename>.end marker once a trajectory is done
+            with open(
+                os.path.join(args.work_dir, f"{basename}.end"), "w", encoding="utf-8"
+            ):
+                pass
+
+    # Append only after every PDB exists, so a failed run adds no Rg lines
+    with open(os.path.join(args.work_dir, args.rg_file), "a", encoding="utf-8") as fh:
+        fh.writelines(rg_lines)
+    print(
+        f"✅ {len(rg_lines)} frames from {len(runs)} trajectories in "
+        f"{time.perf_counter() - start:.1f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
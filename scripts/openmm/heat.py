@@ -4,7 +4,6 @@ import os
 import sys
 import yaml
 from openmm.app import (
-    ForceField,
     Modeller,
     Simulation,
     PDBFile,
@@ -14,103 +13,132 @@ from openmm.app import (
 from openmm import LangevinIntegrator
 from openmm.unit import kelvin, picoseconds, nanometer
 from openmm.openmm import XmlSerializer
+from utils.forcefield import create_system
 from utils.rigid_body import get_rigid_bodies, create_rigid_bodies
-from utils.fixed_bodies import apply_fixed_body_constraints
-
-if len(sys.argv) != 2:
-    print("Usage: python heat.py <config.yaml>")
-    sys.exit(1)
-
-config_path = sys.argv[1]
-with open(config_path, "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
-
-# Build output directories:
-output_dir = config["output"]["output_dir"]
-min_dir = os.path.join(output_dir, config["output"]["min_dir"])
-heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
-md_dir = os.path.join(output_dir, config["output"]["md_dir"])
-
-minimized_pdb_file = config["steps"]["minimization"]["output_pdb"]
-
-output_pdb_file_name = config["steps"]["heating"]["output_pdb"]
-output_restart_file_name = config["steps"]["heating"]["output_restart"]
-
-first_temp = config["steps"]["heating"]["parameters"]["first_temp"] * kelvin
-final_temp = config["steps"]["heating"]["parameters"]["final_temp"] * kelvin
-total_steps = config["steps"]["heating"]["parameters"]["total_steps"]
-timestep = config["steps"]["heating"]["parameters"]["timestep"] * picoseconds
-
-for d in [output_dir, min_dir, heat_dir, md_dir]:
-    if not os.path.exists(d):
-        os.makedirs(d)
-
-# Load minimized structure
-input_pdb_file = os.path.join(min_dir, minimized_pdb_file)
-pdb = PDBFile(file=input_pdb_file)
-
-# Initialize forcefield and modeller
-forcefield = ForceField(*config["input"]["forcefield"])
-modeller = Modeller(pdb.topology, pdb.positions)
-
-fixed_bodies_config = config["constraints"]["fixed_bodies"]
-rigid_bodies_configs = config["constraints"]["rigid_bodies"]
-
-# ⚙️ Get all rigid bodies from the modeller based on our configurations.
-rigid_bodies = get_rigid_bodies(modeller, rigid_bodies_configs)
-
-print(f"Found {len(rigid_bodies)} rigid bodies to apply constraints.")
-
-# ⚙️ Build system
-system = forcefield.createSystem(
-    modeller.topology,
-    nonbondedMethod=CutoffNonPeriodic,
-    nonbondedCutoff=1.2 * nanometer,
-    constraints=HBonds,
-    soluteDielectric=1.0,
-    solventDielectric=78.5
-)
-
-# 🔒 Apply fixed body constraints
-print("Applying fixed body constraints...")
-apply_fixed_body_constraints(system, modeller, fixed_bodies_config)
-
-# 🔒 Apply rigid body constraints
-print("Applying rigid body constraints...")
-create_rigid_bodies(system, modeller.positions, list(rigid_bodies.values()))
-
-
-# 🔥 Heating
-temperature_increment = (final_temp - first_temp) / total_steps
-
-temperature = first_temp
-friction = 1 / picoseconds
-integrator = LangevinIntegrator(temperature, friction, timestep)
-
-simulation = Simulation(modeller.topology, system, integrator)
-simulation.context.setPositions(modeller.positions)
-simulation.context.setVelocitiesToTemperature(first_temp)
-
-print(f"🔥 Starting heating from {first_temp} to {final_temp}...")
-for step in range(total_steps):
-    temperature = first_temp + temperature_increment * step
-    integrator.setTemperature(temperature)
-    simulation.step(1)
-    if step % 1000 == 0:
-        print(f"Step {step}: Temperature = {temperature}")
-
-print("✅ Heating complete.")
-
-# Save output structure
-positions = simulation.context.getState(getPositions=True).getPositions()
-with open(
-    os.path.join(heat_dir, output_pdb_file_name), "w", encoding="utf-8"
-) as out_pdb:
-    PDBFile.writeFile(simulation.topology, positions, out_pdb)
-
-# Save restart file
-with open(os.path.join(heat_dir, output_restart_file_name), "w", encoding="utf-8") as f:
+from utils.fixed_bodies import apply_fixed_bodies
+from utils.exclusions import exclude_intra_body_interactions
+from utils.platform_tuner import select_platform
+
+
+def heat(config, topology=None, positions=None):
+    """
+    Heat the minimized structure and write the heated PDB and restart file.
+
+    `topology` and `positions` default to the minimized PDB on disk.
+    Returns the topology and the final State (positions and velocities).
+    """
+    # Build output directories:
+    output_dir = config["output"]["output_dir"]
+    min_dir = os.path.join(output_dir, config["output"]["min_dir"])
+    heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
+    md_dir = os.path.join(output_dir, config["output"]["md_dir"])
+
+    minimized_pdb_file = config["steps"]["minimization"]["output_pdb"]
+
+    output_pdb_file_name = config["steps"]["heating"]["output_pdb"]
+    output_restart_file_name = config["steps"]["heating"]["output_restart"]
+
+    first_temp = config["steps"]["heating"]["parameters"]["first_temp"] * kelvin
+    final_temp = config["steps"]["heating"]["parameters"]["final_temp"] * kelvin
+    total_steps = config["steps"]["heating"]["parameters"]["total_steps"]
+    timestep = config["steps"]["heating"]["parameters"]["timestep"] * picoseconds
+
+    for d in [output_dir, min_dir, heat_dir, md_dir]:
+        if not os.path.exists(d):
+            os.makedirs(d)
+
+    # Load minimized structure
+    if topology is None:
+        pdb = PDBFile(file=os.path.join(min_dir, minimized_pdb_file))
+        topology, positions = pdb.topology, pdb.positions
+
+    # Initialize modeller
+    modeller = Modeller(topology, positions)
+
+    fixed_bodies_config = config["constraints"]["fixed_bodies"]
+    rigid_bodies_configs = config["constraints"]["rigid_bodies"]
+
+    # ⚙️ Get all rigid bodies from the modeller based on our configurations.
+    rigid_bodies = get_rigid_bodies(modeller, rigid_bodies_configs)
+
+    print(f"Found {len(rigid_bodies)} rigid bodies to apply constraints.")
+
+    # ⚙️ Build system
+    system = create_system(
+        config,
+        modeller.topology,
+        nonbondedMethod=CutoffNonPeriodic,
+        nonbondedCutoff=1.2 * nanometer,
+        constraints=HBonds,
+        soluteDielectric=1.0,
+        solventDielectric=78.5,
+    )
+
+    # 🔒 Apply fixed body constraints
+    fixed_mode = config["constraints"].get("fixed_mode", "restraint")
+    print(f"Applying fixed body constraints ({fixed_mode})...")
+    apply_fixed_bodies(system, modeller, fixed_bodies_config, mode=fixed_mode)
+
+    # 🔒 Apply rigid body constraints
+    print("Applying rigid body constraints...")
+    create_rigid_bodies(system, modeller.positions, list(rigid_bodies.values()))
+
+    if config["constraints"].get("exclude_intra_body", False):
+        print("Excluding interactions inside rigid bodies...")
+        exclude_intra_body_interactions(
+            system, modeller.positions, list(rigid_bodies.values())
+        )
+
+    # 🔥 Heating
+    temperature_increment = (final_temp - first_temp) / total_steps
+
+    temperature = first_temp
+    friction = 1 / picoseconds
+    integrator = LangevinIntegrator(temperature, friction, timestep)
+
+    platform, platform_props = select_platform(
+        config, system, modeller.positions, "heat"
+    )
+    simulation = Simulation(
+        modeller.topology, system, integrator, platform, platform_props
+    )
+    print(f"Initialized on platform: {simulation.context.getPlatform().getName()}")
+    simulation.context.setPositions(modeller.positions)
+    simulation.context.setVelocitiesToTemperature(first_temp)
+
+    print(f"🔥 Starting heating from {first_temp} to {final_temp}...")
+    for step in range(total_steps):
+        temperature = first_temp + temperature_increment * step
+        integrator.setTemperature(temperature)
+        simulation.step(1)
+        if step % 1000 == 0:
+            print(f"Step {step}: Temperature = {temperature}")
+
+    print("✅ Heating complete.")
+
+    # Save output structure
     state = simulation.context.getState(getPositions=True, getVelocities=True)
-    f.write(XmlSerializer.serialize(state))
-
-print(f"✅ Saved {output_pdb_file_name} and {output_restart_file_name} in {heat_dir}")
+    with open(
+        os.path.join(heat_dir, output_pdb_file_name), "w", encoding="utf-8"
+    ) as out_pdb:
+        PDBFile.writeFile(simulation.topology, state.getPositions(), out_pdb)
+
+    # Save restart file
+    with open(
+        os.path.join(heat_dir, output_restart_file_name), "w", encoding="utf-8"
+    ) as f:
+        f.write(XmlSerializer.serialize(state))
+
+    print(
+        f"✅ Saved {output_pdb_file_name} and {output_restart_file_name} in {heat_dir}"
+    )
+    return simulation.topology, state
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python heat.py <config.yaml>")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        heat(yaml.safe_load(f))
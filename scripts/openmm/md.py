@@ -2,57 +2,69 @@
 
 import sys
 import os
+import json
+import math
+import random
+import time
 import yaml
-from openmm.unit import angstroms
+from openmm.unit import MOLAR_GAS_CONSTANT_R, angstroms, amu, kelvin, kilojoule_per_mole
 from openmm.app import (
     Simulation,
     PDBFile,
     Modeller,
-    ForceField,
     StateDataReporter,
     DCDReporter,
     CutoffNonPeriodic,
+    HBonds,
 )
-from openmm import VerletIntegrator, XmlSerializer, RGForce, CustomCVForce, Platform
-from utils.rigid_body import get_rigid_bodies, create_rigid_bodies
-from utils.fixed_bodies import apply_fixed_body_constraints
+from openmm import CMMotionRemover, VerletIntegrator, XmlSerializer
+from utils.rigid_body import (
+    get_rigid_bodies,
+    create_rigid_bodies,
+    remove_virtual_site_constraints,
+)
+from utils.convergence import ConvergenceMonitor
+from utils.fixed_bodies import apply_fixed_bodies
+from utils.force_groups import create_mts_integrator
+from utils.forcefield import create_system
+from utils.reduced_forces import apply_charmm_ca_nonbonded
+from utils.exclusions import exclude_intra_body_interactions
 from utils.pdb_writer import PDBFrameWriter
-from utils.rgyr import RadiusOfGyrationReporter
+from utils.platform_tuner import select_platform
+from utils.saxs import SAXSProfileReporter
+from utils.rgyr import (
+    RadiusOfGyrationReporter,
+    create_rg_restraint,
+    rg_restraint_selection,
+)
+from utils.rg_scheduler import (
+    assign_to_tasks,
+    exploration_grid,
+    mark_done,
+    plan_allocation,
+    read_plan,
+    round_steps,
+    summarize_target,
+    wait_for_markers,
+    write_plan,
+)
+from utils.checkpoint import (
+    CheckpointWriter,
+    load_checkpoint,
+    read_run_status,
+    remove_frames_after_step,
+    save_checkpoint,
+    trim_csv_after_step,
+    truncate_dcd,
+    write_run_status,
+)
 
 
-def run_md_for_rg(rg, config_path, gpu_id=None):
+def build_md_system(config, modeller, log_prefix=""):
     """
-    Run a single MD trajectory targeting radius-of-gyration `rg` (Å).
-    If `gpu_id` is provided, bind the Simulation to that CUDA device.
+    Build the MD System from the config: force field, nonbonded mode, fixed
+    bodies and rigid bodies. The Rg restraint is added separately.
     """
-
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-
-    # Build output directories:
-    output_dir = config["output"]["output_dir"]
-    min_dir = os.path.join(output_dir, config["output"]["min_dir"])
-    heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
-    md_dir = os.path.join(output_dir, config["output"]["md_dir"])
-
-    heated_pdb_file_name = config["steps"]["heating"]["output_pdb"]
-    heated_restart_file_name = config["steps"]["heating"]["output_restart"]
-
-    output_pdb_file_name = config["steps"]["md"]["output_pdb"]
-    output_restart_file_name = config["steps"]["md"]["output_restart"]
-    output_dcd_file_name = config["steps"]["md"]["output_dcd"]
-
-    for d in [output_dir, min_dir, heat_dir, md_dir]:
-        if not os.path.exists(d):
-            os.makedirs(d, exist_ok=True)
-
-    # Load heated structure
-    input_pdb_file = os.path.join(heat_dir, heated_pdb_file_name)
-    pdb = PDBFile(file=input_pdb_file)
-
-    forcefield = ForceField(*config["input"]["forcefield"])
-    modeller = Modeller(pdb.topology, pdb.positions)
-
     fixed_bodies_config = config["constraints"]["fixed_bodies"]
     rigid_bodies_configs = config["constraints"]["rigid_bodies"]
 
@@ -60,79 +72,234 @@ def run_md_for_rg(rg, config_path, gpu_id=None):
     rigid_bodies = get_rigid_bodies(modeller, rigid_bodies_configs)
     for name, atoms in rigid_bodies.items():
         print(
-            f"[GPU {gpu_id}] Rigid body '{name}': {len(atoms)} atoms — indices: "
+            f"{log_prefix}Rigid body '{name}': {len(atoms)} atoms — indices: "
             f"{atoms[:10]}{'...' if len(atoms) > 10 else ''}"
         )
 
+    # ⚖️ Optional hydrogen mass repartitioning with HBonds constraints
+    hydrogen_mass = config["steps"]["md"]["parameters"].get("hydrogen_mass")
+    constraints, hmr_kwargs = None, {}
+    if hydrogen_mass:
+        print(
+            f"{log_prefix}Repartitioning hydrogen mass to {hydrogen_mass} amu "
+            "with HBonds constraints"
+        )
+        constraints = HBonds
+        hmr_kwargs["hydrogenMass"] = float(hydrogen_mass) * amu
+
     # ⚙️ Build system
-    system = forcefield.createSystem(
+    system = create_system(
+        config,
         modeller.topology,
         nonbondedMethod=CutoffNonPeriodic,
         nonbondedCutoff=4 * angstroms,
-        constraints=None,
+        constraints=constraints,
         soluteDielectric=1.0,
         solventDielectric=78.5,
         removeCMMotion=False,
+        **hmr_kwargs,
     )
 
+    # 🧮 Optionally swap full nonbonded/GB terms for the CHARMM CA-only protocol
+    nonbonded_config = dict(config["steps"]["md"].get("nonbonded") or {})
+    nonbonded_mode = nonbonded_config.pop("mode", "full")
+    if nonbonded_mode == "charmm_ca":
+        print(f"{log_prefix}Using CHARMM-style CA-only nonbonded interactions...")
+        apply_charmm_ca_nonbonded(system, modeller.topology, **nonbonded_config)
+    elif nonbonded_mode != "full":
+        raise ValueError(f"Unknown nonbonded mode: {nonbonded_mode}")
+
     # 🔒 Apply fixed body constraints and rigid bodies
-    print(f"[GPU {gpu_id}] Applying fixed body constraints...")
-    apply_fixed_body_constraints(system, modeller, fixed_bodies_config)
+    fixed_mode = config["constraints"].get("fixed_mode", "restraint")
+    print(f"{log_prefix}Applying fixed body constraints ({fixed_mode})...")
+    apply_fixed_bodies(system, modeller, fixed_bodies_config, mode=fixed_mode)
 
-    print(f"[GPU {gpu_id}] Applying rigid body constraints...")
+    print(f"{log_prefix}Applying rigid body constraints...")
     create_rigid_bodies(system, modeller.positions, list(rigid_bodies.values()))
+    if hydrogen_mass:
+        remove_virtual_site_constraints(system)
+
+    if config["constraints"].get("exclude_intra_body", False):
+        print(f"{log_prefix}Excluding interactions inside rigid bodies...")
+        exclude_intra_body_interactions(
+            system, modeller.positions, list(rigid_bodies.values())
+        )
+
+    return system
+
+
+def add_rg_restraint(
+    system, rg, k_rg_yaml, method="rgforce", atom_indices=None, topology=None
+):
+    """
+    Add a harmonic restraint on the radius of gyration.
+    `rg` is in Å and `k_rg_yaml` in kcal/mol/Å^2, as written in the YAML.
+    `method` and `atom_indices` select the CV (see utils.rgyr.create_rg_restraint).
+    """
+    # Convert kcal/mol/Å^2 → kJ/mol/nm^2
+    k_rg = k_rg_yaml * 418.4
+    rg0 = rg * 0.1  # Å → nm
+    cv = create_rg_restraint(
+        method, k_rg, rg0, atom_indices=atom_indices, system=system, topology=topology
+    )
+    system.addForce(cv)
+    return cv
+
+
+def create_md_integrator(config, system, timestep):
+    """
+    Verlet integrator for MD, or a multiple-time-step integrator when
+    `steps.md.mts.enabled` is set. With MTS, `timestep` is the outer step used
+    for nonbonded forces and the Rg restraint; bonded forces are integrated
+    `mts.inner_steps` times per step. Force groups are assigned on `system`,
+    so call this after every force has been added.
+    """
+    mts = config["steps"]["md"].get("mts") or {}
+    if mts.get("enabled"):
+        return create_mts_integrator(system, timestep, mts.get("inner_steps", 2))
+    return VerletIntegrator(timestep)
+
+
+def prepare_md_run(rg, config, gpu_id=None, nsteps=None, heated=None):
+    """
+    Set up (or resume) the MD Simulation and reporters for Rg target `rg` (Å).
+    `heated` is an optional (topology, State) from heating; by default the
+    heated PDB and restart file are read from disk.
+    Returns a dict describing the run, or None if the target already finished.
+    """
+    # Build output directories:
+    output_dir = config["output"]["output_dir"]
+    min_dir = os.path.join(output_dir, config["output"]["min_dir"])
+    heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
+    md_dir = os.path.join(output_dir, config["output"]["md_dir"])
+
+    heated_pdb_file_name = config["steps"]["heating"]["output_pdb"]
+    heated_restart_file_name = config["steps"]["heating"]["output_restart"]
+
+    output_pdb_file_name = config["steps"]["md"]["output_pdb"]
+    output_restart_file_name = config["steps"]["md"]["output_restart"]
+    output_dcd_file_name = config["steps"]["md"]["output_dcd"]
+    output_checkpoint_file_name = config["steps"]["md"].get(
+        "output_checkpoint", "md.chk"
+    )
+
+    for d in [output_dir, min_dir, heat_dir, md_dir]:
+        if not os.path.exists(d):
+            os.makedirs(d, exist_ok=True)
+
+    if nsteps is None:
+        nsteps = int(config["steps"]["md"]["parameters"]["nsteps"])
+
+    rg_md_dir = os.path.join(md_dir, rg_dir_name(rg))
+    os.makedirs(rg_md_dir, exist_ok=True)
+
+    # ⏭️ Skip Rg targets that already finished in a previous (preempted) job
+    status = read_run_status(rg_md_dir)
+    if status.get("completed") and (
+        int(status.get("steps_completed", 0)) >= nsteps
+        or int(status.get("target_steps", -1)) == nsteps  # stopped early
+    ):
+        print(f"[GPU {gpu_id}] ⏭️ Rg {rg} already completed; skipping.")
+        return None
+    if not status and os.path.exists(
+        os.path.join(rg_md_dir, output_restart_file_name)
+    ):
+        print(f"[GPU {gpu_id}] ⏭️ Rg {rg} has a final restart file; skipping.")
+        return None
+
+    # Load heated structure
+    if heated is None:
+        pdb = PDBFile(file=os.path.join(heat_dir, heated_pdb_file_name))
+        with open(
+            os.path.join(heat_dir, heated_restart_file_name), encoding="utf-8"
+        ) as f:
+            state = XmlSerializer.deserialize(f.read())
+        modeller = Modeller(pdb.topology, pdb.positions)
+    else:
+        topology, state = heated
+        modeller = Modeller(topology, state.getPositions())
+    system = build_md_system(config, modeller, log_prefix=f"[GPU {gpu_id}] ")
 
     # ⛓️ RG restraint
     k_rg_yaml = float(config["steps"]["md"]["rgyr"]["k_rg"])  # kcal/mol/Å^2 from YAML
     timestep = float(config["steps"]["md"]["parameters"]["timestep"])
-    nsteps = int(config["steps"]["md"]["parameters"]["nsteps"])
     pdb_report_interval = int(config["steps"]["md"]["pdb_report_interval"])
     report_interval = int(config["steps"]["md"]["rgyr"]["report_interval"])
     rgyr_report = config["steps"]["md"]["rgyr"]["filename"]
+    checkpoint_interval = int(config["steps"]["md"].get("checkpoint_interval", 0))
+    align = math.lcm(report_interval, pdb_report_interval)
+    if checkpoint_interval > 0:
+        # Keep checkpoints aligned with every reporter so resumed output lines up
+        checkpoint_interval = -(-checkpoint_interval // align) * align
     print(f"\n[GPU {gpu_id}] 🔁 Running MD with Rg target: {rg} Å")
 
-    rg_force = RGForce()
-    # Convert kcal/mol/Å^2 → kJ/mol/nm^2
-    k_rg = k_rg_yaml * 418.4
-    rg0 = rg * 0.1  # Å → nm
-    cv = CustomCVForce("0.5 * k * (rg - rg0)^2")
-    cv.addCollectiveVariable("rg", rg_force)
-    cv.addGlobalParameter("k", k_rg)
-    cv.addGlobalParameter("rg0", rg0)
-    system.addForce(cv)
-
-    integrator = VerletIntegrator(timestep)
+    rg_method, rg_atoms = rg_restraint_selection(
+        config["steps"]["md"]["rgyr"], modeller.topology
+    )
+    rg_cv = add_rg_restraint(
+        system, rg, k_rg_yaml, rg_method, rg_atoms, modeller.topology
+    )
 
-    with open(os.path.join(heat_dir, heated_restart_file_name), encoding="utf-8") as f:
-        state = XmlSerializer.deserialize(f.read())
+    integrator = create_md_integrator(config, system, timestep)
 
-    # Prefer CUDA and pin to a device if provided
+    # Prefer CUDA (or the autotuned platform) and pin to a device if provided
+    platform, platform_props = select_platform(
+        config, system, state.getPositions(), "md", gpu_id=gpu_id, prefer="CUDA"
+    )
     try:
-        cuda_platform = Platform.getPlatformByName("CUDA")
-        platform_props = {}
-        if gpu_id is not None:
-            # Bind this Simulation to a specific GPU on the node
-            platform_props["CudaDeviceIndex"] = str(gpu_id)
-            # Optional: Perlmutter A100s are great with mixed/single
-            # platform_props["CudaPrecision"] = "single"  # or "mixed"
         simulation = Simulation(
-            modeller.topology, system, integrator, cuda_platform, platform_props
+            modeller.topology, system, integrator, platform, platform_props
         )
         simulation.context.setState(state)
-        platform = simulation.context.getPlatform().getName()
+        platform_name = simulation.context.getPlatform().getName()
         print(
-            f"[GPU {gpu_id}] Initialized on platform: {platform} (CudaDeviceIndex={platform_props.get('CudaDeviceIndex','-')})"
+            f"[GPU {gpu_id}] Initialized on platform: {platform_name} ({platform_props or 'default properties'})"
         )
     except Exception as e:
-        print(f"[GPU {gpu_id}] [WARNING] CUDA not available; falling back. Error: {e}")
-        simulation = Simulation(modeller.topology, system, integrator)
+        print(
+            f"[GPU {gpu_id}] [WARNING] {platform.getName() if platform else 'Platform'} "
+            f"not available; falling back. Error: {e}"
+        )
+        simulation = Simulation(
+            modeller.topology, system, create_md_integrator(config, system, timestep)
+        )
         simulation.context.setState(state)
-        platform = simulation.context.getPlatform().getName()
-        print(f"[GPU {gpu_id}] Initialized on platform: {platform}")
+        platform_name = simulation.context.getPlatform().getName()
+        print(f"[GPU {gpu_id}] Initialized on platform: {platform_name}")
 
-    rg_label = str(int(rg)) if float(rg).is_integer() else str(rg)
-    rg_md_dir = os.path.join(md_dir, f"rg_{rg_label}")
-    os.makedirs(rg_md_dir, exist_ok=True)
+    # MD steps are counted from zero regardless of the heating step count
+    simulation.currentStep = 0
+
+    dcd_file_path = os.path.join(rg_md_dir, output_dcd_file_name)
+    rgyr_file_path = os.path.join(rg_md_dir, rgyr_report)
+    checkpoint_path = os.path.join(rg_md_dir, output_checkpoint_file_name)
+    base_name = os.path.splitext(output_pdb_file_name)[0]
+
+    # ♻️ Resume from the last checkpoint if a previous job was interrupted
+    resumed = False
+    if checkpoint_interval > 0 and os.path.exists(checkpoint_path):
+        start_step = load_checkpoint(simulation, checkpoint_path)
+        resumed = os.path.exists(dcd_file_path) and os.path.exists(rgyr_file_path)
+        if resumed:
+            kept = truncate_dcd(dcd_file_path, start_step)
+            trim_csv_after_step(rgyr_file_path, start_step)
+        removed = remove_frames_after_step(rg_md_dir, base_name, start_step)
+        print(
+            f"[GPU {gpu_id}] ♻️ Resuming Rg {rg} from step {start_step} "
+            f"({kept if resumed else 0} DCD frames kept, {removed} stale PDB frames removed)"
+        )
+
+    def _record_progress(step, completed=False, **extra):
+        write_run_status(
+            rg_md_dir,
+            {
+                "rg": rg,
+                "target_steps": nsteps,
+                "steps_completed": int(step),
+                "completed": completed,
+                **extra,
+            },
+        )
 
     simulation.reporters = []
     simulation.reporters.append(
@@ -146,38 +313,519 @@ def run_md_for_rg(rg, config_path, gpu_id=None):
             speed=True,
         )
     )
-    dcd_file_path = os.path.join(rg_md_dir, output_dcd_file_name)
-    rgyr_file_path = os.path.join(rg_md_dir, rgyr_report)
-    simulation.reporters.append(DCDReporter(dcd_file_path, report_interval))
+    simulation.reporters.append(
+        DCDReporter(dcd_file_path, report_interval, append=resumed)
+    )
 
     # Radius of Gyration Reporter
     atom_indices = [a.index for a in modeller.topology.atoms() if a.name == "CA"]
     simulation.reporters.append(
         RadiusOfGyrationReporter(
-            atom_indices, system, rgyr_file_path, reportInterval=report_interval
+            atom_indices,
+            system,
+            rgyr_file_path,
+            reportInterval=report_interval,
+            append=resumed,
         )
     )
 
     # PDB Frame Writer
-    base_name = os.path.splitext(output_pdb_file_name)[0]
     simulation.reporters.append(
         PDBFrameWriter(rg_md_dir, base_name, reportInterval=pdb_report_interval)
     )
 
-    simulation.step(nsteps)
+    # 📈 Optional on-the-fly SAXS profiles for early frame screening
+    saxs_config = config["steps"]["md"].get("saxs") or {}
+    saxs_reporter = None
+    if saxs_config.get("enabled"):
+        saxs_reporter = SAXSProfileReporter(
+            modeller.topology,
+            state.getPositions(),
+            os.path.join(rg_md_dir, saxs_config.get("filename", "saxs_profiles.npz")),
+            reportInterval=int(
+                saxs_config.get("report_interval", pdb_report_interval)
+            ),
+            q_max=float(saxs_config.get("q_max", 0.5)),
+            n_q=int(saxs_config.get("n_q", 101)),
+            bin_width=float(saxs_config.get("bin_width", 0.5)),
+            flush_every=int(saxs_config.get("flush_every", 20)),
+            start_step=simulation.currentStep if resumed else None,
+        )
+        simulation.reporters.append(saxs_reporter)
+
+    # 💾 Periodic binary checkpoints
+    if checkpoint_interval > 0:
+        print(f"[GPU {gpu_id}] Checkpointing every {checkpoint_interval} steps")
+        simulation.reporters.append(
+            CheckpointWriter(
+                checkpoint_path, checkpoint_interval, on_checkpoint=_record_progress
+            )
+        )
 
-    with open(
-        os.path.join(rg_md_dir, output_restart_file_name), "w", encoding="utf-8"
-    ) as f:
-        final_state = simulation.context.getState(getPositions=True, getForces=True)
+    # 🛑 Optional early stop once new frames stop adding information
+    convergence = config["steps"]["md"].get("convergence") or {}
+    monitor = None
+    if convergence.get("enabled"):
+        monitor = ConvergenceMonitor(
+            atom_indices,
+            report_interval,
+            min_step=int(float(convergence.get("min_fraction", 0.2)) * nsteps),
+            window=int(convergence.get("window", 50)),
+            rg_tolerance=float(convergence.get("rg_tolerance", 0.5)),
+            novelty_threshold=float(convergence.get("novelty_threshold", 1.0)),
+            target_new_frames=convergence.get("target_new_frames"),
+            stale_frames=convergence.get("stale_frames"),
+        )
+        if resumed:
+            monitor.seed_from_dcd(dcd_file_path, simulation.currentStep)
+        simulation.reporters.append(monitor)
+    # The monitor is checked between chunks aligned with every reporter
+    check_interval = int(convergence.get("check_interval", 10 * report_interval))
+    check_interval = -(-check_interval // align) * align
+
+    return {
+        "rg": rg,
+        "gpu_id": gpu_id,
+        "simulation": simulation,
+        "nsteps": nsteps,
+        "rg_md_dir": rg_md_dir,
+        "rg_cv": rg_cv,
+        "rg_method": rg_method,
+        "monitor": monitor,
+        "saxs_reporter": saxs_reporter,
+        "record_progress": _record_progress,
+        "checkpoint_path": checkpoint_path if checkpoint_interval > 0 else None,
+        "restart_path": os.path.join(rg_md_dir, output_restart_file_name),
+        "pdb_path": os.path.join(rg_md_dir, output_pdb_file_name),
+        "check_interval": check_interval,
+    }
+
+
+def finish_md_run(run, **stop_info):
+    """Write the final restart, PDB, checkpoint and run status of a run."""
+    simulation = run["simulation"]
+    if run["saxs_reporter"] is not None:
+        run["saxs_reporter"].close()
+
+    final_state = simulation.context.getState(getPositions=True, getVelocities=True)
+    restart_path = run["restart_path"]
+    with open(f"{restart_path}.tmp", "w", encoding="utf-8") as f:
         f.write(XmlSerializer.serialize(final_state))
+    os.replace(f"{restart_path}.tmp", restart_path)
 
-    with open(
-        os.path.join(rg_md_dir, output_pdb_file_name), "w", encoding="utf-8"
-    ) as out_pdb:
+    with open(run["pdb_path"], "w", encoding="utf-8") as out_pdb:
         PDBFile.writeFile(simulation.topology, final_state.getPositions(), out_pdb)
 
-    print(f"[GPU {gpu_id}] ✅ Completed MD with Rg {rg}. Results in {rg_md_dir}")
+    if run["checkpoint_path"]:
+        save_checkpoint(simulation, run["checkpoint_path"])
+    run["record_progress"](simulation.currentStep, completed=True, **stop_info)
+
+    print(
+        f"[GPU {run['gpu_id']}] ✅ Completed MD with Rg {run['rg']}. "
+        f"Results in {run['rg_md_dir']}"
+    )
+
+
+def run_md_for_rg(rg, config_path, gpu_id=None, nsteps=None):
+    """
+    Run a single MD trajectory targeting radius-of-gyration `rg` (Å).
+    If `gpu_id` is provided, bind the Simulation to that CUDA device.
+    `nsteps` overrides `steps.md.parameters.nsteps`; raising it for a finished
+    run extends that run from its final checkpoint.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    run_md(rg, config, gpu_id=gpu_id, nsteps=nsteps)
+
+
+def run_md(rg, config, gpu_id=None, nsteps=None, heated=None):
+    """run_md_for_rg for an already loaded config; see prepare_md_run for `heated`."""
+    run = prepare_md_run(rg, config, gpu_id=gpu_id, nsteps=nsteps, heated=heated)
+    if run is None:
+        return
+    simulation, monitor, nsteps = run["simulation"], run["monitor"], run["nsteps"]
+
+    # Run in chunks so an early stop leaves consistent DCD, CSV and PDB output
+    chunk = nsteps if monitor is None else run["check_interval"]
+    start_step, start_time = simulation.currentStep, time.perf_counter()
+    while simulation.currentStep < nsteps:
+        simulation.step(min(chunk, nsteps - simulation.currentStep))
+        if monitor is not None and monitor.stop_reason:
+            break
+
+    stop_info = {"stop_reason": "nsteps"}
+    if monitor is not None:
+        stop_info.update(monitor.summary())
+        if monitor.stop_reason and simulation.currentStep < nsteps:
+            ran = simulation.currentStep - start_step
+            elapsed = time.perf_counter() - start_time
+            saved = (nsteps - simulation.currentStep) * elapsed / max(ran, 1) / 60.0
+            stop_info.update(
+                stop_reason=monitor.stop_reason, gpu_minutes_saved=round(saved, 2)
+            )
+            print(
+                f"[GPU {gpu_id}] 🛑 Stopping Rg {rg} at step "
+                f"{simulation.currentStep}: {monitor.stop_reason} "
+                f"(~{saved:.1f} GPU-minutes saved)"
+            )
+
+    finish_md_run(run, **stop_info)
+
+
+def _restraint_rg(replica, method):
+    """Current restrained Rg (nm) of a replica, read from its Rg CV."""
+    value = replica["cv"].getCollectiveVariableValues(
+        replica["simulation"].context
+    )[0]
+    # RGForce reports Rg; the centroid-based CVs report Rg^2
+    return value if method == "rgforce" else math.sqrt(max(value, 0.0))
+
+
+def _kinetic_kt(simulation, dof):
+    """kT (kJ/mol) at the instantaneous kinetic temperature of a Simulation."""
+    ke = simulation.context.getState(getEnergy=True).getKineticEnergy()
+    return 2.0 * ke.value_in_unit(kilojoule_per_mole) / dof
+
+
+def run_replica_exchange(config_path, rg_set_index, gpu_id=None):
+    """
+    Hamiltonian replica exchange over the Rg targets of one rg_set.
+
+    Every target of the set is a replica in this process. All replicas advance
+    `exchange_interval` steps in turn, then neighbouring targets (alternating
+    even and odd pairs) attempt to swap `rg0` with Metropolis acceptance. MD
+    runs under a VerletIntegrator (NVE), so the temperature drifts away from
+    `parameters.temperature`; kT is taken from the mean instantaneous kinetic
+    temperature of the two replicas of each pair. On a swap the two
+    Simulations also trade their reporters, so each rg_X directory keeps
+    collecting frames restrained at Rg X.
+
+    With `steps.md.convergence` enabled, each target's ConvergenceMonitor
+    travels with that target's other reporters and so only sees frames
+    restrained at its Rg. The replicas advance together, so they all stop at
+    the first exchange once every target's monitor has a stop reason.
+
+    Exchange statistics and per-replica throughput are written to
+    md/replica_exchange_set{i}.json.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    md_config = config["steps"]["md"]
+    rex = md_config.get("replica_exchange") or {}
+    md_dir = os.path.join(config["output"]["output_dir"], config["output"]["md_dir"])
+    rgs = sorted(md_config["rgyr"]["rg_sets"][rg_set_index])
+
+    runs = [prepare_md_run(rg, config, gpu_id=gpu_id) for rg in rgs]
+    runs = [run for run in runs if run is not None]
+    if not runs:
+        return
+    starts = {run["simulation"].currentStep for run in runs}
+    if len(starts) > 1:
+        raise ValueError(
+            f"Replicas of rg_set {rg_set_index} resumed at different steps {starts}; "
+            "remove their checkpoints to restart the exchange"
+        )
+
+    nsteps = runs[0]["nsteps"]
+    interval = int(rex.get("exchange_interval", 1000))
+    method = runs[0]["rg_method"]
+    k = float(md_config["rgyr"]["k_rg"]) * 418.4  # kJ/mol/nm^2, as in add_rg_restraint
+    system = runs[0]["simulation"].system
+    dof = 3 * sum(
+        1
+        for i in range(system.getNumParticles())
+        if system.getParticleMass(i).value_in_unit(amu) > 0
+    ) - system.getNumConstraints()
+    if any(
+        isinstance(system.getForce(i), CMMotionRemover)
+        for i in range(system.getNumForces())
+    ):
+        dof -= 3
+    gas_constant = MOLAR_GAS_CONSTANT_R.value_in_unit(kilojoule_per_mole / kelvin)
+    monitors = [run["monitor"] for run in runs]
+    rng = random.Random(rex.get("seed"))
+
+    # Replicas are Simulations; owner[t] is the replica restrained at target t
+    replicas = [
+        {
+            "simulation": run["simulation"],
+            "cv": run["rg_cv"],
+            "start_rg": run["rg"],
+            "visited": {run["rg"]},
+            "steps": 0,
+            "seconds": 0.0,
+            "kinetic_temperatures": [],
+        }
+        for run in runs
+    ]
+    owner = list(range(len(runs)))
+    rg0 = [run["rg"] * 0.1 for run in runs]  # nm
+    attempts = [0] * (len(runs) - 1)
+    accepted = [0] * (len(runs) - 1)
+    print(
+        f"[GPU {gpu_id}] 🔀 Replica exchange over Rg {[r['rg'] for r in runs]} "
+        f"every {interval} steps"
+    )
+
+    cycle, start_time = 0, time.perf_counter()
+    while replicas[0]["simulation"].currentStep < nsteps:
+        n = min(interval, nsteps - replicas[0]["simulation"].currentStep)
+        for replica in replicas:
+            t0 = time.perf_counter()
+            replica["simulation"].step(n)
+            replica["seconds"] += time.perf_counter() - t0
+            replica["steps"] += n
+
+        if all(m is not None and m.stop_reason for m in monitors):
+            break
+
+        kts = [_kinetic_kt(replica["simulation"], dof) for replica in replicas]
+        for replica, replica_kt in zip(replicas, kts):
+            replica["kinetic_temperatures"].append(replica_kt / gas_constant)
+        for t in range(cycle % 2, len(runs) - 1, 2):
+            a, b = replicas[owner[t]], replicas[owner[t + 1]]
+            kt = 0.5 * (kts[owner[t]] + kts[owner[t + 1]])
+            xa, xb = _restraint_rg(a, method), _restraint_rg(b, method)
+            delta = (
+                0.5
+                * k
+                * (
+                    (xa - rg0[t + 1]) ** 2
+                    + (xb - rg0[t]) ** 2
+                    - (xa - rg0[t]) ** 2
+                    - (xb - rg0[t + 1]) ** 2
+                )
+                / kt
+            )
+            attempts[t] += 1
+            if delta > 0 and rng.random() >= math.exp(-delta):
+                continue
+            accepted[t] += 1
+            a["simulation"].context.setParameter("rg0", rg0[t + 1])
+            b["simulation"].context.setParameter("rg0", rg0[t])
+            sim_a, sim_b = a["simulation"], b["simulation"]
+            sim_a.reporters, sim_b.reporters = sim_b.reporters, sim_a.reporters
+            runs[t]["simulation"], runs[t + 1]["simulation"] = sim_b, sim_a
+            owner[t], owner[t + 1] = owner[t + 1], owner[t]
+            a["visited"].add(runs[t + 1]["rg"])
+            b["visited"].add(runs[t]["rg"])
+        cycle += 1
+
+    for run in runs:
+        stop_info = {"stop_reason": "nsteps"}
+        if run["monitor"] is not None:
+            stop_info.update(run["monitor"].summary())
+            if run["simulation"].currentStep < nsteps:
+                stop_info["stop_reason"] = run["monitor"].stop_reason
+        finish_md_run(run, **stop_info)
+    if runs[0]["simulation"].currentStep < nsteps:
+        print(
+            f"[GPU {gpu_id}] 🛑 Stopping rg_set {rg_set_index} at step "
+            f"{runs[0]['simulation'].currentStep}: every target converged"
+        )
+
+    stats = {
+        "rg_set": rg_set_index,
+        "exchange_interval": interval,
+        "cycles": cycle,
+        "wall_seconds": round(time.perf_counter() - start_time, 1),
+        "pairs": [
+            {
+                "rg_pair": [runs[t]["rg"], runs[t + 1]["rg"]],
+                "attempts": attempts[t],
+                "accepted": accepted[t],
+                "acceptance": (
+                    round(accepted[t] / attempts[t], 3) if attempts[t] else None
+                ),
+            }
+            for t in range(len(runs) - 1)
+        ],
+        "replicas": [
+            {
+                "replica": i,
+                "start_rg": r["start_rg"],
+                "final_rg": runs[owner.index(i)]["rg"],
+                "targets_visited": len(r["visited"]),
+                "steps": r["steps"],
+                "mean_kinetic_temperature": (
+                    round(sum(r["kinetic_temperatures"]) / len(r["kinetic_temperatures"]), 1)
+                    if r["kinetic_temperatures"]
+                    else None
+                ),
+                "steps_per_sec": (
+                    round(r["steps"] / r["seconds"], 1) if r["seconds"] else None
+                ),
+            }
+            for i, r in enumerate(replicas)
+        ],
+    }
+    stats_path = os.path.join(md_dir, f"replica_exchange_set{rg_set_index}.json")
+    with open(f"{stats_path}.tmp", "w", encoding="utf-8") as fh:
+        json.dump(stats, fh, indent=2)
+    os.replace(f"{stats_path}.tmp", stats_path)
+    for pair in stats["pairs"]:
+        print(
+            f"[GPU {gpu_id}] 🔀 Rg {pair['rg_pair'][0]} <-> {pair['rg_pair'][1]}: "
+            f"{pair['accepted']}/{pair['attempts']} swaps accepted"
+        )
+    for r in stats["replicas"]:
+        print(
+            f"[GPU {gpu_id}] Replica {r['replica']}: {r['steps_per_sec']} steps/s, "
+            f"visited {r['targets_visited']} targets"
+        )
+
+
+def rg_dir_name(rg):
+    rg_label = str(int(rg)) if float(rg).is_integer() else str(rg)
+    return f"rg_{rg_label}"
+
+
+def plan_adaptive_extensions(config, md_dir, grid, explore_steps, budget, quantum):
+    """Score the exploration segments and allocate the remaining MD budget."""
+    md_config = config["steps"]["md"]
+    adaptive = md_config.get("adaptive") or {}
+    nsteps = int(md_config["parameters"]["nsteps"])
+    heated_pdb = os.path.join(
+        config["output"]["output_dir"],
+        config["output"]["heat_dir"],
+        config["steps"]["heating"]["output_pdb"],
+    )
+    topology = PDBFile(heated_pdb).topology
+    ca_atoms = [a.index for a in topology.atoms() if a.name == "CA"]
+    summaries = [
+        summarize_target(
+            rg,
+            os.path.join(md_dir, rg_dir_name(rg)),
+            md_config["rgyr"]["filename"],
+            md_config["output_dcd"],
+            ca_atoms,
+            explore_steps,
+            burn_in=float(adaptive.get("burn_in", 0.2)),
+        )
+        for rg in grid
+    ]
+    return plan_allocation(
+        summaries,
+        grid,
+        explore_steps,
+        budget,
+        quantum,
+        int(float(adaptive.get("max_steps_factor", 3)) * nsteps),
+        novelty_threshold=float(adaptive.get("novelty_threshold", 0.5)),
+        reach_tolerance=float(adaptive.get("reach_tolerance", 3.0)),
+    )
+
+
+def run_adaptive(config_path, task_id, world_sz, gpu_id=None):
+    """
+    Adaptive Rg scheduling over the whole MD budget (len(all rg_sets) * nsteps).
+
+    1. Every task runs its share of a wide exploration grid of short segments.
+    2. Tasks wait for each other through marker files in md/adaptive/.
+    3. Task 0 scores the exploration output (achieved Rg and frame shape
+       diversity), writes the allocation to md/adaptive_plan.json and marks it
+       done; the other tasks wait for that marker and load the plan. A plan
+       left by an interrupted run is reused, so a resumed job keeps its
+       allocation even though extensions have already changed the outputs.
+    4. Each task extends its assigned targets from their final checkpoints.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    md_config = config["steps"]["md"]
+    adaptive = md_config.get("adaptive") or {}
+    md_dir = os.path.join(config["output"]["output_dir"], config["output"]["md_dir"])
+    marker_dir = os.path.join(md_dir, "adaptive")
+
+    if int(md_config.get("checkpoint_interval", 0)) <= 0:
+        raise ValueError("Adaptive MD needs checkpoint_interval > 0 to extend runs")
+
+    rgs = [rg for rg_set in md_config["rgyr"].get("rg_sets", []) for rg in rg_set]
+    if not rgs:
+        raise ValueError("No rg_sets found in config.")
+    nsteps = int(md_config["parameters"]["nsteps"])
+    budget = len(rgs) * nsteps
+    quantum = math.lcm(
+        int(md_config["rgyr"]["report_interval"]), int(md_config["pdb_report_interval"])
+    )
+    grid = exploration_grid(
+        adaptive.get("rg_min", min(rgs)),
+        adaptive.get("rg_max", max(rgs)),
+        int(adaptive.get("grid_size", 2 * len(rgs))),
+    )
+    explore_fraction = float(adaptive.get("explore_fraction", 0.3))
+    explore_steps = max(
+        quantum, round_steps(budget * explore_fraction / len(grid), quantum)
+    )
+    if explore_steps * len(grid) > budget:
+        raise ValueError(
+            f"Exploration grid of {len(grid)} x {explore_steps} steps exceeds "
+            f"the budget of {budget} steps"
+        )
+
+    print(
+        f"[md.py] Adaptive: budget {budget} steps, exploring {len(grid)} targets "
+        f"x {explore_steps} steps: {grid}"
+    )
+
+    # 🔭 Exploration
+    failures = 0
+    for rg in grid[task_id::world_sz]:
+        status = read_run_status(os.path.join(md_dir, rg_dir_name(rg)))
+        if int(status.get("steps_completed", 0)) >= explore_steps:
+            continue
+        try:
+            run_md_for_rg(rg, config_path, gpu_id=gpu_id, nsteps=explore_steps)
+        except Exception as e:
+            failures += 1
+            print(
+                f"[md.py] Task {task_id}: FAILED exploration Rg={rg} -> {e}", flush=True
+            )
+    mark_done(marker_dir, f"explore_{task_id}_of_{world_sz}.done")
+    wait_for_markers(
+        marker_dir,
+        [f"explore_{t}_of_{world_sz}.done" for t in range(world_sz)],
+        timeout=float(adaptive.get("barrier_timeout", 86400)),
+    )
+
+    # 📊 Score exploration output and allocate the remaining budget. Only task 0
+    # reads the outputs: a fast task may already be extending (and trimming)
+    # its targets while a slower one would still be scoring them.
+    plan_path = os.path.join(md_dir, "adaptive_plan.json")
+    plan_marker = f"plan_of_{world_sz}.done"
+    if task_id == 0:
+        plan = read_plan(plan_path)
+        if plan is None:
+            plan = plan_adaptive_extensions(
+                config, md_dir, grid, explore_steps, budget, quantum
+            )
+        if len(plan.get("tasks", [])) != world_sz:
+            plan["tasks"] = assign_to_tasks(plan["targets"], world_sz)
+            write_plan(plan_path, plan)
+        mark_done(marker_dir, plan_marker)
+    else:
+        wait_for_markers(
+            marker_dir,
+            [plan_marker],
+            timeout=float(adaptive.get("barrier_timeout", 86400)),
+        )
+        plan = read_plan(plan_path)
+    for d in plan["targets"]:
+        print(
+            f"[md.py] Adaptive Rg={d['rg']}: {d['decision']} "
+            f"(score {d['score']}, +{d['extra_steps']} steps)"
+        )
+
+    # ⏩ Extend the informative targets
+    totals = {d["rg"]: d["total_steps"] for d in plan["targets"]}
+    for rg in plan["tasks"][task_id]:
+        try:
+            run_md_for_rg(rg, config_path, gpu_id=gpu_id, nsteps=totals[rg])
+        except Exception as e:
+            failures += 1
+            print(
+                f"[md.py] Task {task_id}: FAILED extension Rg={rg} -> {e}", flush=True
+            )
+    return failures
 
 
 def _env_int(name: str, default: int) -> int:
@@ -193,10 +841,32 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run OpenMM MD for a specific rg_set.")
     parser.add_argument("config_path", help="Path to openmm_config.yaml")
     parser.add_argument(
-        "--rg-set", type=int, default=0, help="Index of rg_sets to use (default: 0)"
+        "--rg-set", type=int, default=None, help="Index of rg_sets to use (default: 0)"
+    )
+    parser.add_argument(
+        "--replica-exchange",
+        action="store_true",
+        help="Run the rg_set as Rg replica exchange in one process "
+        "(steps.md.replica_exchange); without --rg-set, the rg_sets are shared "
+        "round-robin by the Slurm tasks, one GPU each",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Schedule Rg targets adaptively over all rg_sets (steps.md.adaptive)",
     )
     args = parser.parse_args()
 
+    if args.adaptive:
+        task_id = _env_int("SLURM_PROCID", 0)
+        world_sz = _env_int("SLURM_NTASKS", 1)
+        print(f"[md.py] Adaptive scheduling: TASK={task_id}/{world_sz-1}")
+        failures = run_adaptive(args.config_path, task_id, world_sz, gpu_id=0)
+        if failures:
+            print(f"[md.py] Task {task_id}: {failures} failures.", flush=True)
+            sys.exit(1)
+        sys.exit(0)
+
     with open(args.config_path, "r", encoding="utf-8") as f:
         config = yaml.safe_load(f)
 
@@ -204,6 +874,26 @@ if __name__ == "__main__":
     if not rg_sets:
         print("No rg_sets found in config.")
         sys.exit(1)
+
+    if args.replica_exchange and args.rg_set is None:
+        task_id = _env_int("SLURM_PROCID", 0)
+        world_sz = _env_int("SLURM_NTASKS", 1)
+        my_sets = list(range(len(rg_sets)))[task_id::world_sz]
+        print(f"[md.py] Replica exchange TASK={task_id}/{world_sz-1}: sets {my_sets}")
+        failures = 0
+        for i in my_sets:
+            try:
+                run_replica_exchange(args.config_path, i, gpu_id=0)
+            except Exception as e:
+                failures += 1
+                print(f"[md.py] Task {task_id}: FAILED rg_set {i} -> {e}", flush=True)
+        if failures:
+            print(f"[md.py] Task {task_id}: {failures} failures.", flush=True)
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.rg_set is None:
+        args.rg_set = 0
     if args.rg_set < 0 or args.rg_set >= len(rg_sets):
         print(
             f"Invalid rg_set index {args.rg_set}. Available sets: 0 to {len(rg_sets)-1}"
@@ -215,6 +905,11 @@ if __name__ == "__main__":
         print(f"rg_set {args.rg_set} is empty.")
         sys.exit(1)
 
+    if args.replica_exchange:
+        print(f"[md.py] Replica exchange over rg_set {args.rg_set}: {rgs}")
+        run_replica_exchange(args.config_path, args.rg_set, gpu_id=0)
+        sys.exit(0)
+
     # Slurm task metadata
     task_id = _env_int("SLURM_PROCID", 0)  # 0..(ntasks-1)
     world_sz = _env_int("SLURM_NTASKS", 1)  # total tasks launched by srun
@@ -2,12 +2,14 @@
 This module provides functionality for energy minimization of a molecular system using OpenMM.
 """
 
+import hashlib
+import json
 import os
 import sys
+import time
 import yaml
 from pdbfixer import PDBFixer
 from openmm.app import (
-    ForceField,
     Modeller,
     Simulation,
     PDBFile,
@@ -15,71 +17,267 @@ from openmm.app import (
     HBonds,
 )
 from openmm import LangevinIntegrator
-from openmm.unit import kelvin, picoseconds, nanometer
-
-# Load the YAML configuration file
-if len(sys.argv) != 2:
-    print("Usage: python minimize.py <config.yaml>")
-    sys.exit(1)
-
-config_path = sys.argv[1]
-with open(config_path, "r", encoding="utf-8") as f:
-    config = yaml.safe_load(f)
-
-# Build output directories:
-output_dir = config["output"]["output_dir"]
-min_dir = os.path.join(output_dir, config["output"]["min_dir"])
-heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
-md_dir = os.path.join(output_dir, config["output"]["md_dir"])
-
-initial_pdb_file = os.path.join(config["input"]["dir"], config["input"]["pdb_file"])
-output_pdb_file_name = config["steps"]["minimization"]["output_pdb"]
-
-for d in [output_dir, min_dir, heat_dir, md_dir]:
-    if not os.path.exists(d):
-        os.makedirs(d)
-
-# Step 1: Load and fix the PDB
-fixer = PDBFixer(filename=initial_pdb_file)
-fixer.findMissingResidues()
-fixer.findMissingAtoms()
-fixer.addMissingAtoms()
-fixer.addMissingHydrogens(pH=7.0)
-fixer.findNonstandardResidues()
-if fixer.nonstandardResidues:
-    print("Nonstandard residues found:")
-    for residue in fixer.nonstandardResidues:
-        print(f" - {residue}")
-else:
-    print("No nonstandard residues found.")
-
-# Step 2: Build the system using configured force fields
-forcefield = ForceField(*config["input"]["forcefield"])
-modeller = Modeller(fixer.topology, fixer.positions)
-
-# ⚙️ Build system
-system = forcefield.createSystem(
-    modeller.topology,
-    nonbondedMethod=CutoffNonPeriodic,
-    nonbondedCutoff=1.2 * nanometer,
-    constraints=HBonds,
-    soluteDielectric=1.0,
-    solventDielectric=78.5,
-)
+from openmm.unit import kelvin, kilojoules_per_mole, picoseconds, nanometer
+from utils.forcefield import create_system, load_psf_input, uses_psf
+from utils.platform_tuner import select_platform, size_bucket
+
+FIXER_PH = 7.0
+
+
+def fix_pdb(pdb_path, cache_dir=None):
+    """
+    Complete a PDB with PDBFixer (missing atoms and hydrogens at FIXER_PH).
+
+    With `cache_dir`, the fixed structure is stored under the SHA-256 of the
+    input file, so re-running an unchanged structure skips PDBFixer.
+    Returns (topology, positions, cache_hit).
+    """
+    cache_path = None
+    if cache_dir:
+        with open(pdb_path, "rb") as fh:
+            digest = hashlib.sha256(fh.read() + f"pH={FIXER_PH}".encode()).hexdigest()
+        cache_path = os.path.join(cache_dir, f"{digest}.pdb")
+        if os.path.exists(cache_path):
+            pdb = PDBFile(cache_path)
+            return pdb.topology, pdb.positions, True
+
+    fixer = PDBFixer(filename=pdb_path)
+    fixer.findMissingResidues()
+    fixer.findMissingAtoms()
+    fixer.addMissingAtoms()
+    fixer.addMissingHydrogens(pH=FIXER_PH)
+    fixer.findNonstandardResidues()
+    if fixer.nonstandardResidues:
+        print("Nonstandard residues found:")
+        for residue in fixer.nonstandardResidues:
+            print(f" - {residue}")
+    else:
+        print("No nonstandard residues found.")
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            PDBFile.writeFile(fixer.topology, fixer.positions, fh, keepIds=True)
+        os.replace(tmp_path, cache_path)
+    return fixer.topology, fixer.positions, False
+
+
+def minimize_structure(config, topology, positions, platforms=None):
+    """
+    Minimize one structure with `minimization.parameters.max_iterations`.
+
+    `platforms` is an optional dict reused across calls to remember the
+    platform chosen for each system size. Returns the minimized positions
+    and a dict of energies (kJ/mol) and timings (s).
+    """
+    start = time.perf_counter()
+    modeller = Modeller(topology, positions)
+
+    # ⚙️ Build system
+    system = create_system(
+        config,
+        modeller.topology,
+        nonbondedMethod=CutoffNonPeriodic,
+        nonbondedCutoff=1.2 * nanometer,
+        constraints=HBonds,
+        soluteDielectric=1.0,
+        solventDielectric=78.5,
+    )
+
+    # Simulation setup
+    integrator = LangevinIntegrator(300 * kelvin, 1 / picoseconds, 0.002 * picoseconds)
+    bucket = size_bucket(system.getNumParticles())
+    if platforms is not None and bucket in platforms:
+        platform, platform_props = platforms[bucket]
+    else:
+        platform, platform_props = select_platform(
+            config, system, modeller.positions, "minimize"
+        )
+        if platforms is not None:
+            platforms[bucket] = (platform, platform_props)
+    simulation = Simulation(
+        modeller.topology, system, integrator, platform, platform_props
+    )
+    platform_name = simulation.context.getPlatform().getName()
+    print(f"Initialized on platform: {platform_name}")
+    simulation.context.setPositions(modeller.positions)
+    initial = simulation.context.getState(getEnergy=True).getPotentialEnergy()
+    setup_seconds = time.perf_counter() - start
+
+    # Energy minimization (0 iterations means until converged)
+    max_iterations = int(
+        (config["steps"]["minimization"].get("parameters") or {}).get(
+            "max_iterations", 0
+        )
+    )
+    print(f"Minimizing energy (max_iterations={max_iterations})...")
+    start = time.perf_counter()
+    simulation.minimizeEnergy(maxIterations=max_iterations)
+    state = simulation.context.getState(getPositions=True, getEnergy=True)
+    print("✅ Minimization complete.")
+    return state.getPositions(), {
+        "atoms": system.getNumParticles(),
+        "platform": platform_name,
+        "energy_initial_kj": initial.value_in_unit(kilojoules_per_mole),
+        "energy_final_kj": state.getPotentialEnergy().value_in_unit(
+            kilojoules_per_mole
+        ),
+        "setup_seconds": round(setup_seconds, 3),
+        "minimize_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _min_dir(config):
+    """Create the output directories and return the minimization directory."""
+    output_dir = config["output"]["output_dir"]
+    min_dir = os.path.join(output_dir, config["output"]["min_dir"])
+    heat_dir = os.path.join(output_dir, config["output"]["heat_dir"])
+    md_dir = os.path.join(output_dir, config["output"]["md_dir"])
+    for d in [output_dir, min_dir, heat_dir, md_dir]:
+        if not os.path.exists(d):
+            os.makedirs(d)
+    return min_dir
+
+
+def minimize(config):
+    """
+    Fix the input PDB (or read the PSF/CRD input), minimize it and write the
+    minimized PDB.
+    Returns the minimized topology and positions.
+    """
+    min_dir = _min_dir(config)
+    initial_pdb_file = os.path.join(
+        config["input"]["dir"], config["input"]["pdb_file"]
+    )
+    output_pdb_file_name = config["steps"]["minimization"]["output_pdb"]
+
+    if uses_psf(config):
+        # Step 1: Use the PSF/CRD from the CRD pipeline as-is; it is complete
+        # and already named for the CHARMM parameters
+        print(f"Using PSF input {config['input']['psf_file']}")
+        topology, positions = load_psf_input(config)
+    else:
+        # Step 1: Load and fix the PDB
+        topology, positions, _ = fix_pdb(initial_pdb_file)
+
+    # Step 2: Minimize with the configured force fields
+    positions, _ = minimize_structure(config, topology, positions)
+
+    # Save structure
+    with open(os.path.join(min_dir, output_pdb_file_name), "w", encoding="utf-8") as f:
+        PDBFile.writeFile(topology, positions, f)
+
+    print(f"✅ Saved {output_pdb_file_name}")
+    return topology, positions
+
+
+_worker_platforms = {}
+
+
+def _minimize_one(config, pdb_path, out_dir, cache_dir):
+    """Fix, minimize and write one structure of a batch; returns its summary."""
+    name = os.path.splitext(os.path.basename(pdb_path))[0]
+    entry = {"input": pdb_path}
+    try:
+        start = time.perf_counter()
+        topology, positions, cache_hit = fix_pdb(pdb_path, cache_dir)
+        entry["fixer_cache_hit"] = cache_hit
+        entry["fix_seconds"] = round(time.perf_counter() - start, 3)
+        positions, stats = minimize_structure(
+            config, topology, positions, _worker_platforms
+        )
+        entry.update(stats)
+        entry["output"] = os.path.join(out_dir, f"{name}_minimized.pdb")
+        with open(entry["output"], "w", encoding="utf-8") as fh:
+            PDBFile.writeFile(topology, positions, fh)
+        print(
+            f"✅ {name}: {entry['energy_initial_kj']:.1f} -> "
+            f"{entry['energy_final_kj']:.1f} kJ/mol"
+        )
+    except Exception as e:
+        entry["error"] = str(e)
+        print(f"[minimize.py] FAILED {pdb_path} -> {e}", flush=True)
+    return entry
+
+
+def _minimize_one_star(args):
+    return _minimize_one(*args)
+
+
+def minimize_batch(config, pdb_paths, workers=1):
+    """
+    Minimize many structures in this process (or a pool of `workers`
+    processes), sharing one parsed ForceField and platform choice per
+    process. PDBFixer output is cached by input hash in min_dir/fixer_cache.
+    Writes <name>_minimized.pdb files and batch_summary.json to min_dir/batch.
+
+    The batch PDBs go through PDBFixer and share no atom order with the job's
+    PSF, so their Systems always come from the ForceField; input.psf_file and
+    input.crd_file are ignored here.
+    """
+    if uses_psf(config):
+        print("Batch mode builds Systems from the ForceField; ignoring PSF input")
+        config = {
+            **config,
+            "input": {
+                k: v
+                for k, v in config["input"].items()
+                if k not in ("psf_file", "crd_file")
+            },
+        }
+    min_dir = _min_dir(config)
+    out_dir = os.path.join(min_dir, "batch")
+    cache_dir = os.path.join(min_dir, "fixer_cache")
+    os.makedirs(out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    jobs = [(config, path, out_dir, cache_dir) for path in pdb_paths]
+    if workers > 1:
+        import multiprocessing
+
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            entries = pool.map(_minimize_one_star, jobs)
+    else:
+        entries = [_minimize_one(*job) for job in jobs]
+
+    summary = {
+        "workers": workers,
+        "wall_seconds": round(time.perf_counter() - start, 2),
+        "failures": sum(1 for e in entries if "error" in e),
+        "structures": entries,
+    }
+    summary_path = os.path.join(out_dir, "batch_summary.json")
+    with open(f"{summary_path}.tmp", "w", encoding="utf-8") as fh:
+        json.dump(summary, fh, indent=2)
+    os.replace(f"{summary_path}.tmp", summary_path)
+    print(
+        f"✅ Minimized {len(entries) - summary['failures']}/{len(entries)} "
+        f"structures in {summary['wall_seconds']:.1f} s. Summary: {summary_path}"
+    )
+    return summary
 
-# Simulation setup
-integrator = LangevinIntegrator(300 * kelvin, 1 / picoseconds, 0.002 * picoseconds)
-simulation = Simulation(modeller.topology, system, integrator)
-simulation.context.setPositions(modeller.positions)
 
-# Energy minimization
-print("Minimizing energy...")
-simulation.minimizeEnergy()
-print("✅ Minimization complete.")
+if __name__ == "__main__":
+    import argparse
 
-# Save structure
-positions = simulation.context.getState(getPositions=True).getPositions()
-with open(os.path.join(min_dir, output_pdb_file_name), "w", encoding="utf-8") as f:
-    PDBFile.writeFile(modeller.topology, positions, f)
+    parser = argparse.ArgumentParser(description="OpenMM energy minimization.")
+    parser.add_argument("config_path", help="Path to openmm_config.yaml")
+    parser.add_argument(
+        "--batch",
+        nargs="+",
+        default=None,
+        help="Minimize these PDB files instead of input.pdb_file",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Processes for --batch (default: 1)"
+    )
+    args = parser.parse_args()
 
-print(f"✅ Saved {output_pdb_file_name}")
+    # Load the YAML configuration file
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    if args.batch:
+        summary = minimize_batch(config, args.batch, workers=args.workers)
+        sys.exit(1 if summary["failures"] else 0)
+    minimize(config)
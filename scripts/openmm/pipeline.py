@@ -0,0 +1,100 @@
+"""Run minimize → heat → md in one process, handing state over in memory"""
+
+import json
+import os
+import sys
+import time
+
+import yaml
+
+from heat import heat
+from md import run_md
+from minimize import minimize
+
+STAGES = ("minimize", "heat", "md")
+
+
+def run_pipeline(config, from_stage="minimize", rg_sets=None, gpu_id=0):
+    """
+    Run the OpenMM stages from `from_stage` onwards and return their timings.
+
+    The minimized and heated structures are passed on in memory (the heated
+    State keeps its velocities); every stage still writes its usual PDB and
+    restart files, so the per-stage scripts can pick up from them later.
+    Stages before `from_stage` are read back from those files.
+    """
+    timings = {"stages": {}, "md": {}}
+    minimized = heated = None
+    start = STAGES.index(from_stage)
+
+    if start <= STAGES.index("minimize"):
+        t0 = time.perf_counter()
+        minimized = minimize(config)
+        timings["stages"]["minimize"] = round(time.perf_counter() - t0, 2)
+
+    if start <= STAGES.index("heat"):
+        t0 = time.perf_counter()
+        topology, positions = minimized if minimized else (None, None)
+        heated = heat(config, topology, positions)
+        timings["stages"]["heat"] = round(time.perf_counter() - t0, 2)
+
+    all_sets = config["steps"]["md"]["rgyr"].get("rg_sets", [])
+    selected = range(len(all_sets)) if rg_sets is None else rg_sets
+    rgs = [rg for i in selected for rg in all_sets[i]]
+    t0 = time.perf_counter()
+    failures = 0
+    for rg in rgs:
+        t_rg = time.perf_counter()
+        try:
+            run_md(rg, config, gpu_id=gpu_id, heated=heated)
+        except Exception as e:
+            failures += 1
+            print(f"[pipeline.py] FAILED Rg={rg} -> {e}", flush=True)
+        timings["md"][str(rg)] = round(time.perf_counter() - t_rg, 2)
+    timings["stages"]["md"] = round(time.perf_counter() - t0, 2)
+    timings["failures"] = failures
+    return timings
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run OpenMM minimization, heating and MD in a single process."
+    )
+    parser.add_argument("config_path", help="Path to openmm_config.yaml")
+    parser.add_argument(
+        "--from-stage",
+        choices=STAGES,
+        default="minimize",
+        help="First stage to run; earlier stages are read from disk",
+    )
+    parser.add_argument(
+        "--rg-set",
+        type=int,
+        action="append",
+        default=None,
+        help="Only run MD for this rg_set (repeatable, default: all)",
+    )
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    timings = run_pipeline(config, args.from_stage, args.rg_set)
+    timings["total"] = round(time.perf_counter() - t0, 2)
+
+    for stage, seconds in timings["stages"].items():
+        print(f"⏱️ {stage}: {seconds:.1f} s")
+    print(f"⏱️ total: {timings['total']:.1f} s")
+
+    output_dir = config["output"]["output_dir"]
+    timings_path = os.path.join(output_dir, "pipeline_timings.json")
+    with open(f"{timings_path}.tmp", "w", encoding="utf-8") as fh:
+        json.dump(timings, fh, indent=2)
+    os.replace(f"{timings_path}.tmp", timings_path)
+    return 1 if timings["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
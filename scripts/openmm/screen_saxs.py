@@ -0,0 +1,253 @@
+"""
+Rank MD frames by an approximate SAXS χ² so only the best go to FoXS.
+
+Profiles come from residue-bead Debye sums (utils.saxs.PartialProfileEngine)
+over the heavy atoms of each md_<step>.pdb frame, read from the rg
+directory's DCD. Frames are processed in blocks in a process pool; every
+block is one pair-distance pass and a few weighted histograms. Each frame is
+fitted to the experimental curve over the same c1/c2 ranges as the initial
+FoXS run, with the scale in closed form. The `top_k` frames by χ² are written
+to md/saxs_screening.json, which run-foxs-after-openmm.py accepts as
+--selection.
+
+With --validate, frames that already have a FoXS profile (<pdb>.dat) are
+also fitted from those profiles and the two rankings are compared. The
+partial profiles written by foxs -p are summed as profile_store.read_dat
+does (I_vv + I_ee - I_ve), not read as their vacuum-only first column.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import yaml
+from openmm.app import PDBFile
+
+from select_frames import collect_frames
+from utils.saxs import PartialProfileEngine, fit_c1_c2, fit_to_experiment
+
+# profile_store lives in the scripts directory (/app/scripts)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from profile_store import read_dat, read_saxs_data  # noqa: E402
+
+DEFAULTS = {
+    "top_k": 500,
+    "q_max": 0.5,
+    "bin_width": 0.5,
+    # Same ranges as the initial FoXS run of the slurm script
+    "min_c1": 0.99,
+    "max_c1": 1.05,
+    "n_c1": 7,
+    "min_c2": -0.5,
+    "max_c2": 2.0,
+    "n_c2": 11,
+    "foxs_seconds_per_frame": 2.0,
+    "workers": os.cpu_count() or 1,
+}
+# Bead pairs x frames per block, to bound the pair-distance arrays
+BLOCK_PAIRS = 4_000_000
+
+
+def spearman(a, b):
+    """Spearman rank correlation of two equally long arrays."""
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1]) if len(a) > 1 else float("nan")
+
+
+_engine = None
+
+
+def _init_worker(engine):
+    global _engine
+    _engine = engine
+
+
+def _partial_profiles(beads):
+    return _engine.partial_profiles(beads)
+
+
+def partial_profiles(engine, beads, workers):
+    """Partial profiles of every frame, in blocks spread over `workers`."""
+    n_pairs = max(1, len(engine.pair_i))
+    block = max(1, BLOCK_PAIRS // n_pairs)
+    blocks = [beads[i : i + block] for i in range(0, len(beads), block)]
+    if workers <= 1 or len(blocks) == 1:
+        return np.concatenate([engine.partial_profiles(b) for b in blocks])
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(engine,)
+    ) as pool:
+        return np.concatenate(list(pool.map(_partial_profiles, blocks)))
+
+
+def validate(md_dir, frames, exp_q, exp_i, exp_err, top_k):
+    """
+    Compare the screening χ² with χ² from existing FoXS profiles (scale fit
+    only) for the frames that have one. Returns a dict of agreement metrics.
+    """
+    screened, foxs = [], []
+    for e in frames:
+        dat = os.path.join(md_dir, f"{e['pdb']}.dat")
+        if "chi2" in e and os.path.exists(dat):
+            q, intensity = read_dat(dat)
+            chi2, _ = fit_to_experiment(intensity, exp_q, exp_i, exp_err, q)
+            screened.append(e["chi2"])
+            foxs.append(float(chi2[0]))
+    if not screened:
+        return {"frames": 0}
+    screened, foxs = np.array(screened), np.array(foxs)
+    k = min(top_k, len(foxs))
+    best_foxs = set(np.argsort(foxs)[:k])
+    best_screen = set(np.argsort(screened)[:k])
+    return {
+        "frames": len(foxs),
+        "spearman": round(spearman(screened, foxs), 4),
+        "top_k": k,
+        "top_k_recall": round(len(best_foxs & best_screen) / k, 4),
+        # Screening rank (0 = best) of the frame FoXS fits best
+        "best_foxs_frame_rank": int(np.argsort(np.argsort(screened))[foxs.argmin()]),
+    }
+
+
+def screen_saxs(config, data_file, candidates=None, check=False):
+    """Write md/saxs_screening.json for the MD output and return it."""
+    options = {**DEFAULTS, **(config["steps"]["md"].get("saxs_screening") or {})}
+    md_config = config["steps"]["md"]
+    md_dir = os.path.join(config["output"]["output_dir"], config["output"]["md_dir"])
+    base_name = os.path.splitext(md_config["output_pdb"])[0]
+    exp_q, exp_i, exp_err = read_saxs_data(data_file, float(options["q_max"]))
+    start = time.perf_counter()
+
+    engine = None
+
+    def heavy_atoms(pdb_path):
+        # The bead model is built from the first frame and shared by all
+        nonlocal engine
+        if engine is None:
+            pdb = PDBFile(pdb_path)
+            engine = PartialProfileEngine(
+                pdb.topology, pdb.positions, exp_q, float(options["bin_width"])
+            )
+        return engine.heavy.tolist()
+
+    frames, beads = collect_frames(
+        md_dir,
+        base_name,
+        md_config["output_dcd"],
+        atoms=heavy_atoms,
+        transform=lambda xyz: engine.bead_coords(xyz.astype(np.float64)),
+    )
+    if candidates is not None:
+        keep = [e["pdb"] in candidates for e in frames if e["matched"]]
+        frames = [e for e in frames if e["pdb"] in candidates]
+        beads = beads[np.array(keep, dtype=bool)]
+    matched = [e for e in frames if e["matched"]]
+    print(f"Screening {len(matched)} of {len(frames)} frames against {data_file}...")
+
+    if matched:
+        partials = partial_profiles(engine, beads, int(options["workers"]))
+        chi2, c1, c2, scale = fit_c1_c2(
+            partials,
+            exp_i,
+            exp_err,
+            np.linspace(options["min_c1"], options["max_c1"], int(options["n_c1"])),
+            np.linspace(options["min_c2"], options["max_c2"], int(options["n_c2"])),
+        )
+        for e, x, a, b, s in zip(matched, chi2, c1, c2, scale):
+            e.update(chi2=round(float(x), 4), c1=round(float(a), 3))
+            e.update(c2=round(float(b), 3), scale=float(s))
+    # Frames without a DCD frame cannot be screened, so they always go through
+    top_k = max(0, int(options["top_k"]) - (len(frames) - len(matched)))
+    ranked = sorted(matched, key=lambda e: e["chi2"])
+    for e in ranked[:top_k]:
+        e["selected"] = True
+    for e in frames:
+        e.setdefault("selected", not e["matched"])
+
+    selected = [e for e in frames if e["selected"]]
+    skipped = len(frames) - len(selected)
+    report = {
+        "data_file": data_file,
+        "top_k": int(options["top_k"]),
+        "frames_total": len(frames),
+        "frames_selected": len(selected),
+        "frames_without_dcd": len(frames) - len(matched),
+        "best_chi2": ranked[0]["chi2"] if ranked else None,
+        "foxs_seconds_per_frame": float(options["foxs_seconds_per_frame"]),
+        "estimated_cpu_seconds_saved": round(
+            skipped * float(options["foxs_seconds_per_frame"]), 1
+        ),
+        "seconds": round(time.perf_counter() - start, 2),
+        "selected": [
+            {k: v for k, v in e.items() if k not in ("dir", "matched", "selected")}
+            for e in selected
+        ],
+    }
+    if check:
+        report["validation"] = validate(
+            md_dir, matched, exp_q, exp_i, exp_err, int(options["top_k"])
+        )
+        print(f"Validation against FoXS: {report['validation']}")
+
+    path = os.path.join(md_dir, "saxs_screening.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    os.replace(f"{path}.tmp", path)
+    print(
+        f"✅ Kept the {len(selected)}/{len(frames)} frames with the lowest "
+        f"approximate χ² in {report['seconds']:.1f} s; "
+        f"~{report['estimated_cpu_seconds_saved']:.0f} FoXS CPU-seconds saved. "
+        f"Manifest: {path}"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rank MD frames by approximate SAXS χ² before running FoXS."
+    )
+    parser.add_argument("config_path", help="Path to openmm_config.yaml")
+    parser.add_argument(
+        "--data",
+        default=None,
+        help="Experimental SAXS .dat (default: saxs_screening.data_file)",
+    )
+    parser.add_argument("--top-k", type=int, default=None, help="Frames to keep")
+    parser.add_argument(
+        "--candidates",
+        default=None,
+        help="Screen only the frames of this selection (e.g. frame_selection.json)",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Compare the ranking with existing FoXS profiles of the frames",
+    )
+    args = parser.parse_args()
+
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    options = config["steps"]["md"].get("saxs_screening") or {}
+    if args.top_k is not None:
+        options["top_k"] = args.top_k
+    config["steps"]["md"]["saxs_screening"] = options
+    data_file = args.data
+    if data_file is None:
+        if not options.get("data_file"):
+            parser.error("give --data or set saxs_screening.data_file")
+        data_file = os.path.join(config["input"]["dir"], options["data_file"])
+
+    candidates = None
+    if args.candidates:
+        with open(args.candidates, "r", encoding="utf-8") as f:
+            candidates = {frame["pdb"] for frame in json.load(f)["selected"]}
+    screen_saxs(config, data_file, candidates, check=args.validate)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Pick structurally distinct MD frames for FoXS and MultiFoXS.
+
+Frames at 1500 K that are only a few report intervals apart are often near
+duplicates. For every md_<step>.pdb under md/rg_* this reads the CA
+coordinates of the matching frame from the rg directory's DCD (the PDBs are
+not parsed, apart from one per directory for the CA indices), computes Rg,
+Dmax and principal moments for all frames at once and runs leader clustering
+on CA RMSD after superposition. The cluster leaders, at most
+`frame_selection.budget` of them, are written to md/frame_selection.json for
+run-foxs-after-openmm.py --selection.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import yaml
+
+from utils.dcd import DCDTrajectory, max_dimension
+from utils.rg_scheduler import shape_descriptors
+
+DEFAULTS = {
+    "budget": 1000,
+    "rmsd_cutoff": 1.0,
+    "max_cutoff": 20.0,
+    "foxs_seconds_per_frame": 2.0,
+}
+
+
+def ca_indices(pdb_path):
+    """Indices of the CA atoms in a PDB written by OpenMM (same order as the DCD)."""
+    indices = []
+    with open(pdb_path, "r", encoding="utf-8") as fh:
+        atom = 0
+        for line in fh:
+            if line.startswith(("ATOM", "HETATM")):
+                if line[12:16].strip() == "CA":
+                    indices.append(atom)
+                atom += 1
+    return indices
+
+
+def collect_frames(md_dir, base_name, dcd_name, atoms=ca_indices, transform=None):
+    """
+    PDB frames of every rg_* directory and the coordinates of `atoms(pdb_path)`
+    (default: the CA atoms) of each from the trajectory, optionally passed
+    through `transform` one directory at a time. Returns (frames, coords)
+    where frames is a list of dicts and coords an (n_matched, ..., 3) array
+    for the frames with "matched". Frames whose step has no DCD frame are
+    kept but not clustered.
+    """
+    pattern = re.compile(rf"^{re.escape(base_name)}_(\d+)\.pdb$")
+    frames, blocks = [], []
+    n_atoms = None
+    for rg_dir in sorted(os.listdir(md_dir)):
+        path = os.path.join(md_dir, rg_dir)
+        if not (rg_dir.startswith("rg_") and os.path.isdir(path)):
+            continue
+        pdbs = sorted(
+            (int(m.group(1)), name)
+            for name in os.listdir(path)
+            if (m := pattern.match(name))
+        )
+        if not pdbs:
+            continue
+        entries = [
+            {"dir": rg_dir, "pdb": f"{rg_dir}/{name}", "step": step, "matched": False}
+            for step, name in pdbs
+        ]
+        frames += entries
+        dcd_path = os.path.join(path, dcd_name)
+        if not os.path.exists(dcd_path):
+            print(f"⚠️ {dcd_path} missing; keeping all {len(pdbs)} frames")
+            continue
+        indices = atoms(os.path.join(path, pdbs[0][1]))
+        traj = DCDTrajectory(dcd_path)
+        n = len(indices)
+        if not n or traj.natoms <= max(indices) or n_atoms not in (None, n):
+            print(f"⚠️ {dcd_path} does not match the PDB frames; keeping them all")
+            continue
+        n_atoms = n
+        lookup = {int(step): i for i, step in enumerate(traj.steps())}
+        index = [lookup.get(e["step"]) for e in entries]
+        matched = [i for i, k in enumerate(index) if k is not None]
+        if matched:
+            rows = np.array([index[i] for i in matched])
+            block = traj.positions(indices, frames=rows)
+            blocks.append(transform(block) if transform else block)
+            for i in matched:
+                entries[i]["matched"] = True
+    coords = (
+        np.concatenate(blocks).astype(np.float64)
+        if blocks
+        else np.empty((0, n_atoms or 0, 3))
+    )
+    return frames, coords
+
+
+def rmsd_to_many(frame, refs, ref_sq):
+    """
+    CA RMSD (Å) of one centered frame to many centered references after
+    optimal superposition (Kabsch, from the singular values of the 3x3
+    covariance matrices).
+    """
+    cov = np.einsum("ni,lnj->lij", frame, refs)
+    s = np.linalg.svd(cov, compute_uv=False)
+    s[:, 2] *= np.sign(np.linalg.det(cov))
+    msd = np.einsum("ni,ni->", frame, frame) + ref_sq - 2.0 * s.sum(axis=1)
+    return np.sqrt(np.clip(msd / frame.shape[0], 0.0, None))
+
+
+def leader_cluster(centered, rg, cutoff):
+    """
+    Greedy leader clustering: a frame joins the first leader within `cutoff`
+    Å RMSD, otherwise it becomes a leader. Since RMSD >= |Rg_a - Rg_b|, only
+    leaders with a similar Rg are superposed. Returns (leaders, assignment).
+    """
+    sq = np.einsum("fni,fni->f", centered, centered)
+    leaders = []
+    assignment = np.empty(len(centered), dtype=np.int64)
+    for f in range(len(centered)):
+        if leaders:
+            lead = np.array(leaders)
+            near = lead[np.abs(rg[lead] - rg[f]) < cutoff]
+            if len(near):
+                d = rmsd_to_many(centered[f], centered[near], sq[near])
+                if d.min() < cutoff:
+                    assignment[f] = near[np.argmin(d)]
+                    continue
+        leaders.append(f)
+        assignment[f] = f
+    return np.array(leaders, dtype=np.int64), assignment
+
+
+def select_representatives(coords, budget, cutoff, max_cutoff):
+    """
+    Leader clustering at `cutoff`, loosened by 25% at a time until at most
+    `budget` leaders remain (or `max_cutoff` is reached). Returns
+    (leaders, assignment, cutoff used).
+    """
+    centered = coords - coords.mean(axis=1, keepdims=True)
+    rg = np.sqrt(np.einsum("fni,fni->f", centered, centered) / coords.shape[1])
+    while True:
+        leaders, assignment = leader_cluster(centered, rg, cutoff)
+        if len(leaders) <= budget or cutoff >= max_cutoff:
+            return leaders, assignment, cutoff
+        cutoff = min(cutoff * 1.25, max_cutoff)
+
+
+def select_frames(config):
+    """Write md/frame_selection.json for the MD output and return it."""
+    options = {**DEFAULTS, **(config["steps"]["md"].get("frame_selection") or {})}
+    md_config = config["steps"]["md"]
+    md_dir = os.path.join(config["output"]["output_dir"], config["output"]["md_dir"])
+    base_name = os.path.splitext(md_config["output_pdb"])[0]
+
+    start = time.perf_counter()
+    frames, coords = collect_frames(md_dir, base_name, md_config["output_dcd"])
+    matched = [e for e in frames if e["matched"]]
+    budget = max(1, int(options["budget"]) - (len(frames) - len(matched)))
+    print(f"Clustering {len(matched)} of {len(frames)} frames (budget {budget})...")
+
+    cutoff = float(options["rmsd_cutoff"])
+    if len(matched):
+        # Descriptors of every frame, reported for the representatives
+        moments = shape_descriptors(coords)
+        dmax = max_dimension(coords)
+        leaders, assignment, cutoff = select_representatives(
+            coords, budget, cutoff, float(options["max_cutoff"])
+        )
+        sizes = np.bincount(assignment, minlength=len(matched))
+        for k in leaders:
+            matched[k].update(
+                selected=True,
+                cluster_size=int(sizes[k]),
+                rg=round(float(np.linalg.norm(moments[k])), 3),
+                dmax=round(float(dmax[k]), 3),
+                moments=[round(float(m), 3) for m in moments[k]],
+            )
+    for e in frames:
+        e.setdefault("selected", not e["matched"])
+
+    selected = [e for e in frames if e["selected"]]
+    per_dir = {}
+    for e in frames:
+        counts = per_dir.setdefault(e["dir"], {"frames": 0, "selected": 0})
+        counts["frames"] += 1
+        counts["selected"] += int(e["selected"])
+    skipped = len(frames) - len(selected)
+    report = {
+        "budget": int(options["budget"]),
+        "rmsd_cutoff": float(options["rmsd_cutoff"]),
+        "rmsd_cutoff_used": round(cutoff, 3),
+        "frames_total": len(frames),
+        "frames_selected": len(selected),
+        "frames_without_dcd": len(frames) - len(matched),
+        "foxs_seconds_per_frame": float(options["foxs_seconds_per_frame"]),
+        "estimated_cpu_seconds_saved": round(
+            skipped * float(options["foxs_seconds_per_frame"]), 1
+        ),
+        "seconds": round(time.perf_counter() - start, 2),
+        "directories": per_dir,
+        "selected": [
+            {k: v for k, v in e.items() if k not in ("dir", "matched", "selected")}
+            for e in selected
+        ],
+    }
+    path = os.path.join(md_dir, "frame_selection.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    os.replace(f"{path}.tmp", path)
+    print(
+        f"✅ Selected {len(selected)}/{len(frames)} frames at {cutoff:.2f} Å "
+        f"CA RMSD; ~{report['estimated_cpu_seconds_saved']:.0f} FoXS CPU-seconds "
+        "saved. "
+        f"Manifest: {path}"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Select distinct MD frames for FoXS by CA RMSD clustering."
+    )
+    parser.add_argument("config_path", help="Path to openmm_config.yaml")
+    parser.add_argument("--budget", type=int, default=None, help="Max frames to keep")
+    parser.add_argument(
+        "--rmsd-cutoff", type=float, default=None, help="Initial CA RMSD cutoff (Å)"
+    )
+    args = parser.parse_args()
+
+    with open(args.config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    options = config["steps"]["md"].setdefault("frame_selection", None) or {}
+    if args.budget is not None:
+        options["budget"] = args.budget
+    if args.rmsd_cutoff is not None:
+        options["rmsd_cutoff"] = args.rmsd_cutoff
+    config["steps"]["md"]["frame_selection"] = options
+    select_frames(config)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
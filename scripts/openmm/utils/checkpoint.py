@@ -0,0 +1,136 @@
+"""Checkpoint/resume helpers for long OpenMM MD runs"""
+
+import csv
+import json
+import os
+import re
+import struct
+
+from utils.dcd import read_dcd_header
+
+
+def save_checkpoint(simulation, filename):
+    """
+    Write a binary OpenMM checkpoint (Context.createCheckpoint) atomically.
+
+    The checkpoint is written to a temporary file first and then renamed, so a
+    job killed in the middle of a write never leaves a truncated checkpoint.
+    """
+    tmp_path = f"{filename}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(simulation.context.createCheckpoint())
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, filename)
+
+
+def load_checkpoint(simulation, filename):
+    """
+    Restore a Simulation from a binary checkpoint and return the restored step.
+    """
+    with open(filename, "rb") as fh:
+        simulation.context.loadCheckpoint(fh.read())
+    step = simulation.context.getState().getStepCount()
+    simulation.currentStep = step
+    return step
+
+
+def read_run_status(directory, filename="run_status.json"):
+    """Return the run status dict stored in `directory`, or {} if there is none."""
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_run_status(directory, status, filename="run_status.json"):
+    """Atomically write the run status dict for one Rg run."""
+    path = os.path.join(directory, filename)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(status, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def truncate_dcd(path, last_step):
+    """
+    Drop DCD frames recorded after `last_step` and fix up the header counts.
+
+    Frames written between the last checkpoint and a preemption would otherwise
+    be duplicated once the run resumes and DCDReporter appends to the file.
+    Returns the number of frames kept.
+    """
+    header = read_dcd_header(path)
+    first_step, interval = header["first_step"], header["interval"]
+
+    keep = 0
+    if interval > 0 and last_step >= first_step:
+        keep = (last_step - first_step) // interval + 1
+    keep = max(0, min(keep, header["count"], header["frames_on_disk"]))
+
+    with open(path, "r+b") as fh:
+        size = header["header_size"]
+        if keep:
+            size += header["first_frame_size"] + (keep - 1) * header["frame_size"]
+        fh.truncate(size)
+        fh.seek(8)
+        fh.write(struct.pack("<i", keep))
+        fh.seek(20)
+        fh.write(struct.pack("<i", first_step + keep * interval))
+    return keep
+
+
+def trim_csv_after_step(path, last_step, step_column="Step"):
+    """Remove CSV rows whose step is greater than `last_step`."""
+    with open(path, "r", newline="", encoding="utf-8") as fh:
+        rows = list(csv.reader(fh))
+    if not rows:
+        return
+    header, body = rows[0], rows[1:]
+    col = header.index(step_column)
+    kept = [row for row in body if row and int(float(row[col])) <= last_step]
+    # Replace atomically: other tasks may read the CSV while it is trimmed
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(header)
+        writer.writerows(kept)
+    os.replace(tmp_path, path)
+
+
+def remove_frames_after_step(directory, base_name, last_step):
+    """Delete `<base>_<step>.pdb` frames newer than `last_step`."""
+    pattern = re.compile(rf"{re.escape(base_name)}_(\d+)\.pdb$")
+    removed = 0
+    for name in os.listdir(directory):
+        m = pattern.match(name)
+        if m and int(m.group(1)) > last_step:
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
+
+
+class CheckpointWriter:
+    """
+    Reporter that writes a binary checkpoint every `reportInterval` steps.
+    An optional `on_checkpoint(step)` callback runs after each successful write.
+    """
+
+    def __init__(self, filename: str, reportInterval: int, on_checkpoint=None):
+        self._filename = filename
+        self._reportInterval = int(reportInterval)
+        self._on_checkpoint = on_checkpoint
+
+    def describeNextReport(self, simulation):
+        steps = self._reportInterval - simulation.currentStep % self._reportInterval
+        # (steps, positions, velocities, forces, energies)
+        return (steps, False, False, False, False)
+
+    def report(self, simulation, state):
+        save_checkpoint(simulation, self._filename)
+        if self._on_checkpoint is not None:
+            self._on_checkpoint(simulation.currentStep)
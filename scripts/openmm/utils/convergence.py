@@ -0,0 +1,113 @@
+"""Early termination of MD runs whose new frames stop adding information"""
+
+import os
+from collections import deque
+
+import numpy as np
+from openmm.unit import angstroms
+
+from utils.dcd import DCDTrajectory
+from utils.rg_scheduler import shape_descriptors
+
+
+class ConvergenceMonitor:
+    """
+    Reporter that watches CA frames and decides when a run can stop.
+
+    Each frame is reduced to its gyration-tensor principal moments (Å). A frame
+    is new when it lies at least `novelty_threshold` Å from every new frame
+    seen before it. After `min_step`, the run may stop when either
+    `target_new_frames` new frames have been collected ("enough_new_frames"),
+    or the rolling mean Rg over the last `window` frames is within
+    `rg_tolerance` Å of the window before it and none of the last
+    `stale_frames` frames was new ("converged").
+
+    The monitor only records the decision in `stop_reason`; the caller runs
+    the Simulation in chunks and checks it between chunks.
+    """
+
+    def __init__(
+        self,
+        atom_indices,
+        reportInterval,
+        min_step=0,
+        window=50,
+        rg_tolerance=0.5,
+        novelty_threshold=1.0,
+        target_new_frames=None,
+        stale_frames=None,
+    ):
+        self.atom_indices = list(atom_indices)
+        self.reportInterval = int(reportInterval)
+        self.min_step = int(min_step)
+        self.window = int(window)
+        self.rg_tolerance = float(rg_tolerance)
+        self.novelty_threshold = float(novelty_threshold)
+        self.target_new_frames = int(target_new_frames) if target_new_frames else None
+        self.stale_frames = int(stale_frames) if stale_frames else self.window
+        self._rg = deque(maxlen=2 * self.window)
+        self._novel = []
+        self._since_novel = 0
+        self.frames_seen = 0
+        self.stop_reason = None
+
+    @property
+    def new_frames(self):
+        return len(self._novel)
+
+    def describeNextReport(self, simulation):
+        steps = self.reportInterval - simulation.currentStep % self.reportInterval
+        return (steps, True, False, False, False)
+
+    def report(self, simulation, state):
+        coords = state.getPositions(asNumpy=True).value_in_unit(angstroms)
+        self.observe(simulation.currentStep, coords[self.atom_indices][None, :, :])
+
+    def observe(self, step, frames):
+        """Feed an (n_frames, n_atoms, 3) array in Å whose last frame is at `step`."""
+        for desc in shape_descriptors(np.asarray(frames, dtype=np.float64)):
+            self.frames_seen += 1
+            self._rg.append(float(np.linalg.norm(desc)))
+            if not self._novel or (
+                np.linalg.norm(np.array(self._novel) - desc, axis=1).min()
+                >= self.novelty_threshold
+            ):
+                self._novel.append(desc)
+                self._since_novel = 0
+            else:
+                self._since_novel += 1
+        if self.stop_reason is None and step >= self.min_step:
+            self.stop_reason = self._check()
+
+    def _plateaued(self):
+        if len(self._rg) < 2 * self.window:
+            return False
+        rg = np.array(self._rg)
+        previous, last = rg[: self.window].mean(), rg[self.window :].mean()
+        return abs(last - previous) < self.rg_tolerance
+
+    def _check(self):
+        if self.target_new_frames and self.new_frames >= self.target_new_frames:
+            return "enough_new_frames"
+        if self._since_novel >= self.stale_frames and self._plateaued():
+            return "converged"
+        return None
+
+    def seed_from_dcd(self, dcd_path, max_step):
+        """Replay DCD frames up to `max_step` so a resumed run keeps its history."""
+        if not os.path.exists(dcd_path):
+            return 0
+        traj = DCDTrajectory(dcd_path, max_step=max_step)
+        if len(traj):
+            self.observe(max_step, traj.positions(self.atom_indices))
+        return len(traj)
+
+    def summary(self):
+        rg = np.array(self._rg)
+        return {
+            "frames_seen": self.frames_seen,
+            "new_frames": self.new_frames,
+            "rolling_rg": (
+                round(float(rg[-self.window :].mean()), 3) if len(rg) else None
+            ),
+        }
@@ -0,0 +1,204 @@
+"""Read OpenMM/CHARMM DCD trajectories without loading them into memory"""
+
+import os
+import struct
+
+import numpy as np
+
+try:
+    from scipy.spatial import ConvexHull, QhullError
+except ImportError:  # the OpenMM image has no SciPy
+    ConvexHull = None
+
+
+def read_dcd_header(path):
+    """
+    Parse the header of a DCD file written by OpenMM's DCDReporter (or CHARMM).
+
+    Returns a dict with the frame count stored in the header, the first step,
+    the step interval between frames, the number of atoms, the 0-based indices
+    of the free atoms (None when no atoms are fixed), whether frames carry a
+    unit cell record, the header size in bytes, the sizes of the first and of
+    every later frame in bytes and the number of complete frames on disk.
+
+    When CHARMM writes dynamics with fixed atoms (NAMNF > 0, e.g. `cons fix`),
+    only the first frame holds every atom; later frames hold the free atoms.
+    """
+    with open(path, "rb") as fh:
+        (hdr_len,) = struct.unpack("<i", fh.read(4))
+        fh.seek(8)
+        count, first_step, interval = struct.unpack("<3i", fh.read(12))
+        fh.seek(40)
+        (namnf,) = struct.unpack("<i", fh.read(4))
+        fh.seek(48)
+        (box_flag,) = struct.unpack("<i", fh.read(4))
+        # Skip the first record, then the title record, then read natoms
+        fh.seek(4 + hdr_len + 4)
+        (title_len,) = struct.unpack("<i", fh.read(4))
+        fh.seek(title_len + 4, os.SEEK_CUR)
+        _, natoms, _ = struct.unpack("<3i", fh.read(12))
+        free_atoms = None
+        if namnf > 0:
+            # Fortran record of the 1-based indices of the free atoms
+            (free_len,) = struct.unpack("<i", fh.read(4))
+            nfree = natoms - namnf
+            if free_len != 4 * nfree:
+                raise ValueError(
+                    f"{path}: free atom record has {free_len} bytes, "
+                    f"expected {4 * nfree} for {natoms} atoms with {namnf} fixed"
+                )
+            free_atoms = np.frombuffer(fh.read(free_len), dtype="<i4") - 1
+            fh.seek(4, os.SEEK_CUR)
+        header_size = fh.tell()
+        fh.seek(0, os.SEEK_END)
+        file_size = fh.tell()
+
+    box_size = 56 if box_flag else 0
+    nfree = natoms if free_atoms is None else len(free_atoms)
+    first_frame_size = 3 * (4 * natoms + 8) + box_size
+    frame_size = 3 * (4 * nfree + 8) + box_size
+    frames_on_disk = 0
+    if file_size - header_size >= first_frame_size:
+        frames_on_disk = 1 + (file_size - header_size - first_frame_size) // frame_size
+    return {
+        "count": count,
+        "first_step": first_step,
+        "interval": interval,
+        "natoms": natoms,
+        "free_atoms": free_atoms,
+        "box": bool(box_flag),
+        "header_size": header_size,
+        "first_frame_size": first_frame_size,
+        "frame_size": frame_size,
+        "frames_on_disk": frames_on_disk,
+    }
+
+
+class DCDTrajectory:
+    """
+    Memory-mapped, read-only view of the coordinates in a DCD file (Å).
+
+    Only the pages that are actually indexed are read from disk, so selecting
+    CA atoms of a few frames from a large trajectory stays cheap.
+    """
+
+    def __init__(self, path, max_step=None):
+        self.path = path
+        self.header = read_dcd_header(path)
+        n_frames = self.header["frames_on_disk"]
+        if max_step is not None:
+            n_frames = min(n_frames, self.frame_for_step(max_step) + 1)
+        self.n_frames = max(0, n_frames)
+        natoms = self.header["natoms"]
+        free = self.header["free_atoms"]
+        if free is None:
+            free = np.arange(natoms)
+        # Column of every atom in the later (free atom) frames, -1 when fixed
+        self._free_column = np.full(natoms, -1, dtype=np.int64)
+        self._free_column[free] = np.arange(len(free))
+        self._nfree = len(free)
+        # Each coordinate block is a Fortran record: int32, n float32, int32
+        self._offset = 14 if self.header["box"] else 0
+        self._first = self._rest = None
+        if self.n_frames:
+            self._first = np.memmap(
+                path,
+                dtype="<f4",
+                mode="r",
+                offset=self.header["header_size"],
+                shape=(1, self.header["first_frame_size"] // 4),
+            )
+        if self.n_frames > 1:
+            self._rest = np.memmap(
+                path,
+                dtype="<f4",
+                mode="r",
+                offset=self.header["header_size"] + self.header["first_frame_size"],
+                shape=(self.n_frames - 1, self.header["frame_size"] // 4),
+            )
+
+    def __len__(self):
+        return self.n_frames
+
+    @property
+    def natoms(self):
+        return self.header["natoms"]
+
+    def frame_for_step(self, step):
+        """Index of the last frame written at or before `step` (-1 if none)."""
+        first, interval = self.header["first_step"], self.header["interval"]
+        if interval <= 0 or step < first:
+            return -1
+        return (step - first) // interval
+
+    def steps(self):
+        """MD step of every frame."""
+        first, interval = self.header["first_step"], self.header["interval"]
+        return first + interval * np.arange(self.n_frames)
+
+    def positions(self, atom_indices=None, frames=slice(None)):
+        """
+        Return a float32 array (n_frames, n_atoms, 3) of coordinates in Å.
+
+        Parameters:
+          atom_indices (list of int): Atoms to extract (default: all).
+          frames (slice or array): Frames to extract (default: all).
+        """
+        atoms = (
+            np.arange(self.natoms)
+            if atom_indices is None
+            else np.asarray(atom_indices, dtype=np.int64)
+        )
+        index = np.arange(self.n_frames)[frames]
+        out = np.empty((len(index), len(atoms), 3), dtype=np.float32)
+        if not len(index):
+            return out
+        # Fixed atoms keep their first-frame coordinates in every frame
+        out[:] = self._xyz(self._first, self.natoms, atoms)
+        later = index > 0
+        if later.any():
+            columns = self._free_column[atoms]
+            moving = columns >= 0
+            words = self._rest[index[later] - 1]
+            block = out[later]
+            block[:, moving] = self._xyz(words, self._nfree, columns[moving])
+            out[later] = block
+        return out
+
+    def _xyz(self, words, n, columns):
+        """(frames, columns, 3) coordinates from frame records of n atoms."""
+        stride = n + 2
+        xyz = [words[..., self._offset + k * stride + 1 + columns] for k in range(3)]
+        return np.stack(xyz, axis=-1)
+
+
+def radius_of_gyration(coords):
+    """Unweighted Rg (Å) of every frame of an (n_frames, n_atoms, 3) array."""
+    centered = coords - coords.mean(axis=1, keepdims=True)
+    return np.sqrt(np.einsum("fni,fni->f", centered, centered) / coords.shape[1])
+
+
+def _max_pair_distance(points, chunk=2048):
+    best = 0.0
+    for start in range(0, len(points), chunk):
+        block = points[start : start + chunk]
+        d2 = ((block[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        best = max(best, float(d2.max()))
+    return np.sqrt(best)
+
+
+def max_dimension(coords):
+    """
+    Largest intra-frame distance (Å) of every frame. The farthest pair always
+    lies on the convex hull, so only hull vertices are compared when SciPy is
+    available; otherwise all pairs are compared in chunks.
+    """
+    dmax = np.empty(len(coords))
+    for f, points in enumerate(np.asarray(coords, dtype=np.float64)):
+        if ConvexHull is not None and len(points) > 4:
+            try:
+                points = points[ConvexHull(points).vertices]
+            except QhullError:
+                pass  # flat or degenerate selection
+        dmax[f] = _max_pair_distance(points)
+    return dmax
@@ -0,0 +1,247 @@
+"""Drop interactions that are constant because their atoms cannot move relative to each other"""
+
+import numpy as np
+from openmm import (
+    CMAPTorsionForce,
+    CustomAngleForce,
+    CustomBondForce,
+    CustomNonbondedForce,
+    CustomTorsionForce,
+    HarmonicAngleForce,
+    HarmonicBondForce,
+    NonbondedForce,
+    PeriodicTorsionForce,
+)
+from openmm.unit import nanometer
+
+# Extra distance (nm) added to the nonbonded cutoff when looking for pairs
+PAIR_MARGIN = 0.05
+
+
+def _as_array(positions):
+    if hasattr(positions, "value_in_unit"):
+        positions = positions.value_in_unit(nanometer)
+    return np.array([[p[0], p[1], p[2]] for p in positions], dtype=float)
+
+
+def nonbonded_cutoff(system):
+    """Largest cutoff (nm) used by any nonbonded force, or None if any has no cutoff."""
+    cutoff = 0.0
+    for force in system.getForces():
+        if isinstance(force, NonbondedForce):
+            if force.getNonbondedMethod() == NonbondedForce.NoCutoff:
+                return None
+        elif isinstance(force, CustomNonbondedForce):
+            if force.getNonbondedMethod() == CustomNonbondedForce.NoCutoff:
+                return None
+        else:
+            continue
+        cutoff = max(cutoff, force.getCutoffDistance().value_in_unit(nanometer))
+    return cutoff
+
+
+def find_close_pairs(positions, indices, cutoff=None):
+    """
+    Return an (n, 2) array of atom index pairs from `indices` closer than `cutoff` nm
+    (all pairs when `cutoff` is None). Distances are computed in row blocks so
+    memory stays bounded for large bodies.
+    """
+    idx = np.asarray(sorted(indices), dtype=np.int64)
+    if len(idx) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    xyz = _as_array(positions)[idx]
+    sq = np.einsum("ij,ij->i", xyz, xyz)
+    block = max(1, 2_000_000 // len(idx))
+    pairs = []
+    for start in range(0, len(idx), block):
+        stop = min(start + block, len(idx))
+        if cutoff is None:
+            ii, jj = np.triu_indices(stop - start, 1, len(idx) - start)
+        else:
+            d2 = (
+                sq[start:stop, None]
+                + sq[None, start:]
+                - 2.0 * xyz[start:stop] @ xyz[start:].T
+            )
+            ii, jj = np.nonzero(d2 <= cutoff * cutoff)
+            keep = jj > ii
+            ii, jj = ii[keep], jj[keep]
+        pairs.append(np.stack([idx[ii + start], idx[jj + start]], axis=1))
+    return np.concatenate(pairs)
+
+
+def exclude_pairs(system, pairs, groups):
+    """
+    Remove the nonbonded interaction of every pair in `pairs`, and zero any
+    existing NonbondedForce exception whose atoms share a group in `groups`
+    (exceptions are evaluated without a cutoff). Returns the number of pairs touched.
+    """
+    lookup = _group_lookup(groups)
+    for force in system.getForces():
+        if isinstance(force, NonbondedForce):
+            existing = set()
+            for k in range(force.getNumExceptions()):
+                p1, p2, _, sigma, _ = force.getExceptionParameters(k)
+                existing.add((min(p1, p2), max(p1, p2)))
+                if _same_group((p1, p2), lookup):
+                    force.setExceptionParameters(k, p1, p2, 0.0, sigma, 0.0)
+            for p1, p2 in pairs:
+                if (p1, p2) not in existing:
+                    force.addException(int(p1), int(p2), 0.0, 1.0, 0.0)
+        elif isinstance(force, CustomNonbondedForce):
+            existing = set()
+            for k in range(force.getNumExclusions()):
+                p1, p2 = force.getExclusionParticles(k)
+                existing.add((min(p1, p2), max(p1, p2)))
+            for p1, p2 in pairs:
+                if (p1, p2) not in existing:
+                    force.addExclusion(int(p1), int(p2))
+    return len(pairs)
+
+
+def _group_lookup(groups):
+    lookup = {}
+    for gid, atoms in enumerate(groups):
+        for a in atoms:
+            lookup[a] = gid
+    return lookup
+
+
+def _same_group(atoms, lookup):
+    gid = lookup.get(atoms[0])
+    return gid is not None and all(lookup.get(a) == gid for a in atoms[1:])
+
+
+def _copy_custom_setup(old, new):
+    for i in range(old.getNumGlobalParameters()):
+        new.addGlobalParameter(
+            old.getGlobalParameterName(i), old.getGlobalParameterDefaultValue(i)
+        )
+    return new
+
+
+def _rebuild(force, lookup):
+    """Return (new force without same-group terms, number dropped) or (None, 0)."""
+    dropped = 0
+    if isinstance(force, HarmonicBondForce):
+        new = HarmonicBondForce()
+        for i in range(force.getNumBonds()):
+            p1, p2, length, k = force.getBondParameters(i)
+            if _same_group((p1, p2), lookup):
+                dropped += 1
+            else:
+                new.addBond(p1, p2, length, k)
+    elif isinstance(force, HarmonicAngleForce):
+        new = HarmonicAngleForce()
+        for i in range(force.getNumAngles()):
+            p1, p2, p3, angle, k = force.getAngleParameters(i)
+            if _same_group((p1, p2, p3), lookup):
+                dropped += 1
+            else:
+                new.addAngle(p1, p2, p3, angle, k)
+    elif isinstance(force, PeriodicTorsionForce):
+        new = PeriodicTorsionForce()
+        for i in range(force.getNumTorsions()):
+            p1, p2, p3, p4, periodicity, phase, k = force.getTorsionParameters(i)
+            if _same_group((p1, p2, p3, p4), lookup):
+                dropped += 1
+            else:
+                new.addTorsion(p1, p2, p3, p4, periodicity, phase, k)
+    elif isinstance(force, CMAPTorsionForce):
+        new = CMAPTorsionForce()
+        for i in range(force.getNumMaps()):
+            size, energy = force.getMapParameters(i)
+            new.addMap(size, energy)
+        for i in range(force.getNumTorsions()):
+            params = force.getTorsionParameters(i)
+            if _same_group(params[1:], lookup):
+                dropped += 1
+            else:
+                new.addTorsion(*params)
+    elif isinstance(force, (CustomBondForce, CustomAngleForce, CustomTorsionForce)):
+        cls = type(force)
+        new = _copy_custom_setup(force, cls(force.getEnergyFunction()))
+        if isinstance(force, CustomBondForce):
+            n_terms, get, add, n_atoms = (
+                force.getNumBonds(),
+                force.getBondParameters,
+                new.addBond,
+                2,
+            )
+            for i in range(force.getNumPerBondParameters()):
+                new.addPerBondParameter(force.getPerBondParameterName(i))
+        elif isinstance(force, CustomAngleForce):
+            n_terms, get, add, n_atoms = (
+                force.getNumAngles(),
+                force.getAngleParameters,
+                new.addAngle,
+                3,
+            )
+            for i in range(force.getNumPerAngleParameters()):
+                new.addPerAngleParameter(force.getPerAngleParameterName(i))
+        else:
+            n_terms, get, add, n_atoms = (
+                force.getNumTorsions(),
+                force.getTorsionParameters,
+                new.addTorsion,
+                4,
+            )
+            for i in range(force.getNumPerTorsionParameters()):
+                new.addPerTorsionParameter(force.getPerTorsionParameterName(i))
+        for i in range(n_terms):
+            term = get(i)
+            atoms, params = term[:n_atoms], term[n_atoms]
+            if _same_group(atoms, lookup):
+                dropped += 1
+            else:
+                add(*atoms, params)
+    else:
+        return None, 0
+
+    new.setForceGroup(force.getForceGroup())
+    new.setName(force.getName())
+    if hasattr(new, "setUsesPeriodicBoundaryConditions"):
+        new.setUsesPeriodicBoundaryConditions(force.usesPeriodicBoundaryConditions())
+    return new, dropped
+
+
+def drop_bonded_terms(system, groups):
+    """
+    Remove bonds, angles, torsions and CMAP terms whose atoms all lie in the
+    same group. Forces are rebuilt because OpenMM cannot delete single terms.
+    Returns the number of dropped terms.
+    """
+    lookup = _group_lookup(groups)
+    total = 0
+    for i in reversed(range(system.getNumForces())):
+        new, dropped = _rebuild(system.getForce(i), lookup)
+        if new is None or dropped == 0:
+            continue
+        system.removeForce(i)
+        system.addForce(new)
+        total += dropped
+    return total
+
+
+def exclude_intra_body_interactions(system, positions, bodies):
+    """
+    Remove every interaction that is constant because both (or all) atoms sit
+    in the same rigid body: nonbonded pairs inside the cutoff and bonded terms.
+    The potential energy changes only by a constant; forces are unchanged.
+
+    Implicit-solvent (GB) forces are left alone because Born radii couple
+    every atom to every other atom, so intra-body terms are not constant.
+    """
+    cutoff = nonbonded_cutoff(system)
+    if cutoff is not None:
+        cutoff += PAIR_MARGIN
+    pairs = []
+    for body in bodies:
+        pairs += [tuple(p) for p in find_close_pairs(positions, body, cutoff).tolist()]
+    n_pairs = exclude_pairs(system, pairs, bodies)
+    n_terms = drop_bonded_terms(system, bodies)
+    print(
+        f"Excluded {n_pairs} intra-body nonbonded pairs and dropped "
+        f"{n_terms} intra-body bonded terms"
+    )
+    return n_pairs, n_terms
@@ -3,6 +3,52 @@
 from openmm import unit
 from openmm import CustomExternalForce
 
+from utils.exclusions import (
+    drop_bonded_terms,
+    exclude_pairs,
+    find_close_pairs,
+    nonbonded_cutoff,
+    PAIR_MARGIN,
+)
+
+
+def get_fixed_body_atoms(modeller, fixed_bodies):
+    """
+    Return the indices of all atoms that belong to any fixed body.
+
+    Parameters:
+      modeller (openmm.app.Modeller): Contains the topology with atoms and residues.
+      fixed_bodies (list): A list of dictionaries defining fixed bodies. Each dictionary should
+                           contain "name" and "segments" (with "chain_id" and "residues"
+                           holding "start" and "stop").
+
+    A fixed body that matches no atoms is skipped with a warning.
+    """
+    fixed_atoms = []
+    matched = set()
+    for atom in modeller.topology.atoms():
+        res_id = int(atom.residue.id)
+        chain_id = atom.residue.chain.id
+        hits = {
+            n
+            for n, fixed_body in enumerate(fixed_bodies)
+            if any(
+                chain_id == segment["chain_id"]
+                and segment["residues"]["start"] <= res_id < segment["residues"]["stop"]
+                for segment in fixed_body.get("segments", [])
+            )
+        }
+        if hits:
+            fixed_atoms.append(atom.index)
+            matched |= hits
+    for n, fixed_body in enumerate(fixed_bodies):
+        if n not in matched:
+            print(
+                f"[WARNING] Fixed body {fixed_body.get('name', n)} matches no atoms "
+                "of the topology; skipping it"
+            )
+    return fixed_atoms
+
 
 def apply_fixed_body_constraints_zero_mass(system, modeller, fixed_bodies):
     """
@@ -13,20 +59,10 @@ def apply_fixed_body_constraints_zero_mass(system, modeller, fixed_bodies):
       modeller (openmm.app.Modeller): Contains the topology with atoms and residues.
       fixed_bodies (list): A list of dictionaries defining fixed bodies. Each dictionary should
                            contain keys "name", "chain_id", and "residues" (with "start" and "stop").
-      amu: The unit for atomic mass (e.g., openmm.unit.amu).
     """
-    for atom in modeller.topology.atoms():
-        res_id = int(atom.residue.id)
-        chain_id = atom.residue.chain.id
-        for fixed_body in fixed_bodies:
-            segments = fixed_body.get("segments", [])
-            for segment in segments:
-                if chain_id == segment["chain_id"]:
-                    start = segment["residues"]["start"]
-                    stop = segment["residues"]["stop"]
-                    if start <= res_id < stop:
-                        system.setParticleMass(atom.index, 0.0 * unit.amu)
-                        break
+    fixed_atoms = get_fixed_body_atoms(modeller, fixed_bodies)
+    for index in fixed_atoms:
+        system.setParticleMass(index, 0.0 * unit.amu)
     # Debug: Print atoms with zero mass
     zero_mass_atoms = [
         i
@@ -34,6 +70,57 @@ def apply_fixed_body_constraints_zero_mass(system, modeller, fixed_bodies):
         if system.getParticleMass(i)._value == 0
     ]
     print(f"Zero-mass atoms: {zero_mass_atoms}")
+    return fixed_atoms
+
+
+def apply_fixed_body_frozen(system, modeller, fixed_bodies):
+    """
+    Truly freeze fixed bodies instead of pinning them with stiff springs.
+
+    Fixed atoms get zero mass, so integrators never move them, and every
+    interaction among fixed atoms is removed because it is constant:
+    nonbonded pairs inside the cutoff are excluded and bonded terms whose atoms
+    are all fixed are dropped. Interactions between fixed and mobile atoms are
+    kept. Constraints touching a fixed atom are removed, since OpenMM cannot
+    constrain massless particles.
+
+    Parameters:
+      system (openmm.System): The OpenMM system to modify.
+      modeller (openmm.app.Modeller): Contains the topology with atoms and residues.
+      fixed_bodies (list): Fixed body definitions from the config.
+    """
+    fixed_atoms = get_fixed_body_atoms(modeller, fixed_bodies)
+    if not fixed_atoms:
+        print("No fixed-body atoms to freeze.")
+        return fixed_atoms
+
+    fixed_set = set(fixed_atoms)
+    for index in fixed_atoms:
+        system.setParticleMass(index, 0.0 * unit.amu)
+
+    mixed = 0
+    for i in range(system.getNumConstraints() - 1, -1, -1):
+        p1, p2, _ = system.getConstraintParameters(i)
+        if p1 in fixed_set or p2 in fixed_set:
+            if not (p1 in fixed_set and p2 in fixed_set):
+                mixed += 1
+            system.removeConstraint(i)
+    if mixed:
+        print(f"[WARNING] Removed {mixed} constraints between fixed and mobile atoms")
+
+    cutoff = nonbonded_cutoff(system)
+    if cutoff is not None:
+        cutoff += PAIR_MARGIN
+    pairs = [
+        tuple(p) for p in find_close_pairs(modeller.positions, fixed_atoms, cutoff).tolist()
+    ]
+    exclude_pairs(system, pairs, [fixed_atoms])
+    dropped = drop_bonded_terms(system, [fixed_atoms])
+    print(
+        f"Froze {len(fixed_atoms)} fixed-body atoms: excluded {len(pairs)} "
+        f"fixed-fixed pairs and dropped {dropped} bonded terms"
+    )
+    return fixed_atoms
 
 
 def apply_fixed_body_constraints(system, modeller, fixed_bodies, kfixed=100000.0):
@@ -53,19 +140,9 @@ def apply_fixed_body_constraints(system, modeller, fixed_bodies, kfixed=100000.0
     force.addPerParticleParameter("z0")
     force.addGlobalParameter("kfixed", kfixed)
 
-    for atom in modeller.topology.atoms():
-        res_id = int(atom.residue.id)
-        chain_id = atom.residue.chain.id
-        for fixed_body in fixed_bodies:
-            segments = fixed_body.get("segments", [])
-            for segment in segments:
-                if chain_id == segment["chain_id"]:
-                    start = segment["residues"]["start"]
-                    stop = segment["residues"]["stop"]
-                    if start <= res_id < stop:
-                        pos = modeller.positions[atom.index]
-                        force.addParticle(atom.index, [pos.x, pos.y, pos.z])
-                        break  # Move to next atom once matched
+    for index in get_fixed_body_atoms(modeller, fixed_bodies):
+        pos = modeller.positions[index]
+        force.addParticle(index, [pos.x, pos.y, pos.z])
 
     system.addForce(force)
 
@@ -76,3 +153,15 @@ def apply_fixed_body_constraints(system, modeller, fixed_bodies, kfixed=100000.0
         if system.getParticleMass(i)._value == 0
     ]
     print(f"Zero-mass atoms: {zero_mass_atoms}")
+
+
+def apply_fixed_bodies(system, modeller, fixed_bodies, mode="restraint"):
+    """
+    Apply fixed bodies using the configured mode: "restraint" (stiff harmonic
+    springs, the default) or "frozen" (zero mass plus fixed-fixed exclusions).
+    """
+    if mode == "frozen":
+        return apply_fixed_body_frozen(system, modeller, fixed_bodies)
+    if mode == "restraint":
+        return apply_fixed_body_constraints(system, modeller, fixed_bodies)
+    raise ValueError(f"Unknown fixed body mode: {mode}")
@@ -0,0 +1,53 @@
+"""Force groups and multiple-time-step integration for BilboMD OpenMM MD"""
+
+from openmm import (
+    CustomCVForce,
+    CustomGBForce,
+    CustomNonbondedForce,
+    GBSAOBCForce,
+    MTSIntegrator,
+    NonbondedForce,
+)
+
+# Bonded terms and positional restraints are integrated every inner step;
+# nonbonded, implicit solvent and collective-variable restraints (Rg) once
+# per outer step.
+FAST_GROUP = 0
+SLOW_GROUP = 1
+SLOW_FORCES = (
+    NonbondedForce,
+    CustomNonbondedForce,
+    GBSAOBCForce,
+    CustomGBForce,
+    CustomCVForce,
+)
+
+
+def assign_force_groups(system):
+    """
+    Put every force of `system` in FAST_GROUP or SLOW_GROUP.
+    Returns {group: [force class names]} for logging.
+    """
+    groups = {FAST_GROUP: [], SLOW_GROUP: []}
+    for force in system.getForces():
+        group = SLOW_GROUP if isinstance(force, SLOW_FORCES) else FAST_GROUP
+        force.setForceGroup(group)
+        groups[group].append(force.__class__.__name__)
+    return groups
+
+
+def create_mts_integrator(system, timestep, inner_steps=2):
+    """
+    Assign force groups and return an MTSIntegrator whose outer step is
+    `timestep` (ps). Fast forces are evaluated `inner_steps` times per step,
+    so the bonded terms see a step of timestep / inner_steps.
+    """
+    inner_steps = int(inner_steps)
+    if inner_steps < 1:
+        raise ValueError(f"inner_steps must be >= 1, got {inner_steps}")
+    groups = assign_force_groups(system)
+    print(
+        f"MTS: outer step {timestep} ps for {groups[SLOW_GROUP]}, "
+        f"{inner_steps} inner steps for {groups[FAST_GROUP]}"
+    )
+    return MTSIntegrator(timestep, [(SLOW_GROUP, 1), (FAST_GROUP, inner_steps)])
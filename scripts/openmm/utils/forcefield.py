@@ -0,0 +1,136 @@
+"""
+Shared System construction for minimize, heat and md.
+
+Systems come either from OpenMM ForceField XMLs (template matching against
+the PDB topology) or, when `input.psf_file` is set, straight from the CHARMM
+PSF written by the CRD pipeline with the bundled toppar files. Both loaders
+are cached, so one process parses the force field only once.
+"""
+
+import os
+from functools import lru_cache
+
+from openmm.app import (
+    GBn,
+    GBn2,
+    HCT,
+    OBC1,
+    OBC2,
+    CharmmCrdFile,
+    CharmmParameterSet,
+    CharmmPsfFile,
+    ForceField,
+)
+
+TOPPAR_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "toppar")
+DEFAULT_TOPPAR = [
+    "top_all36_prot.rtf",
+    "par_all36_prot.prm",
+    "top_all36_na.rtf",
+    "par_all36_na.prm",
+    "toppar_water_ions.str",
+]
+# Implicit solvent XMLs from `input.forcefield` and their PSF equivalents
+IMPLICIT_SOLVENT = {
+    "implicit/hct.xml": HCT,
+    "implicit/obc1.xml": OBC1,
+    "implicit/obc2.xml": OBC2,
+    "implicit/gbn.xml": GBn,
+    "implicit/gbn2.xml": GBn2,
+}
+
+
+@lru_cache(maxsize=None)
+def _load(files):
+    return ForceField(*files)
+
+
+def load_forcefield(config):
+    """
+    ForceField for `input.forcefield` of the config. Repeated calls with the
+    same files return the same object, so stages and structures run in one
+    process share it.
+    """
+    return _load(tuple(config["input"]["forcefield"]))
+
+
+def uses_psf(config):
+    """True when the config asks for a System built from a CHARMM PSF."""
+    return bool(config["input"].get("psf_file"))
+
+
+def input_path(config, name):
+    """`name` relative to `input.dir` unless it is absolute."""
+    return name if os.path.isabs(name) else os.path.join(config["input"]["dir"], name)
+
+
+def toppar_files(config):
+    """Absolute paths of the CHARMM topology/parameter files for PSF input."""
+    toppar_dir = config["input"].get("toppar_dir", TOPPAR_DIR)
+    return [
+        name if os.path.isabs(name) else os.path.join(toppar_dir, name)
+        for name in config["input"].get("toppar", DEFAULT_TOPPAR)
+    ]
+
+
+@lru_cache(maxsize=None)
+def _load_parameters(files):
+    return CharmmParameterSet(*files)
+
+
+@lru_cache(maxsize=None)
+def _load_psf(path):
+    return CharmmPsfFile(path)
+
+
+def load_charmm_parameters(config):
+    return _load_parameters(tuple(toppar_files(config)))
+
+
+def load_psf(config):
+    return _load_psf(input_path(config, config["input"]["psf_file"]))
+
+
+def load_psf_input(config):
+    """
+    Topology and positions from `input.psf_file` and `input.crd_file`.
+
+    CharmmPsfFile names chains after the full segid ("PROA"); they are renamed
+    to its last character, the chain ID the rigid/fixed body configs use and
+    the one PDBFile keeps when writing the topology.
+    """
+    psf = load_psf(config)
+    for chain in psf.topology.chains():
+        chain.id = chain.id[-1:] or chain.id
+    crd = CharmmCrdFile(input_path(config, config["input"]["crd_file"]))
+    return psf.topology, crd.positions
+
+
+def implicit_solvent(config):
+    """PSF implicitSolvent model matching the XMLs in `input.forcefield`."""
+    for name in config["input"]["forcefield"]:
+        if name in IMPLICIT_SOLVENT:
+            return IMPLICIT_SOLVENT[name]
+    return None
+
+
+def create_system(config, topology, **kwargs):
+    """
+    Build a System for `topology` with ForceField.createSystem keyword
+    arguments. With PSF input the System comes from the PSF and the CHARMM
+    parameters instead; `topology` must then have the PSF atom order (as every
+    PDB written by these scripts does).
+    """
+    if not uses_psf(config):
+        return load_forcefield(config).createSystem(topology, **kwargs)
+    psf = load_psf(config)
+    if topology.getNumAtoms() != psf.topology.getNumAtoms():
+        raise ValueError(
+            f"Topology has {topology.getNumAtoms()} atoms but the PSF has "
+            f"{psf.topology.getNumAtoms()}"
+        )
+    return psf.createSystem(
+        load_charmm_parameters(config),
+        implicitSolvent=implicit_solvent(config),
+        **kwargs,
+    )
@@ -1,5 +1,116 @@
+import io
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 from openmm.app import PDBFile
+from openmm.unit import angstroms, is_quantity
+
+RECORDS = ("ATOM  ", "HETATM")
+COORD_FORMAT = "%8.3f%8.3f%8.3f"
+
+
+def _format_83(value):
+    # Same width-8 coordinate field as openmm.app.pdbfile
+    if -999.999 < value < 9999.999:
+        return "%8.3f" % value
+    if -9999999 < value < 99999999:
+        return ("%8.3f" % value)[:8]
+    raise ValueError(
+        f'coordinate "{value}" could not be represented in a width-8 field'
+    )
+
+
+class PDBTemplate:
+    """
+    The text PDBFile.writeFile produces for a topology, with every field except
+    the coordinates rendered once. Each frame is then a single %-format of its
+    coordinates, byte-identical to PDBFile.writeFile (keepIds=False).
+    """
+
+    def __init__(self, topology):
+        self.topology = topology
+        self.natoms = topology.getNumAtoms()
+        # Render the model once at the origin and cut out columns 31-54
+        model = io.StringIO()
+        PDBFile.writeModel(topology, np.zeros((self.natoms, 3)), model)
+        fast, slow = [], []
+        for line in model.getvalue().splitlines(keepends=True):
+            if line.startswith(RECORDS):
+                head, tail = line[:30].replace("%", "%%"), line[54:].replace("%", "%%")
+                fast.append(f"{head}{COORD_FORMAT}{tail}")
+                slow.append(f"{head}%s%s%s{tail}")
+            else:
+                fast.append(line.replace("%", "%%"))
+                slow.append(fast[-1])
+        self._model = "".join(fast)
+        self._model_wide = "".join(slow)
+        footer = io.StringIO()
+        PDBFile.writeFooter(topology, footer)
+        self._footer = footer.getvalue()
+
+    def header(self):
+        # REMARK carries today's date, so it is not part of the cached text
+        header = io.StringIO()
+        PDBFile.writeHeader(self.topology, header)
+        return header.getvalue()
+
+    def format(self, positions):
+        """PDB text for one frame; `positions` in Å unless they carry units."""
+        if is_quantity(positions):
+            positions = positions.value_in_unit(angstroms)
+        xyz = np.asarray(positions, dtype=np.float64)
+        if xyz.shape != (self.natoms, 3):
+            raise ValueError("The number of positions must match the number of atoms")
+        if not np.isfinite(xyz).all():
+            raise ValueError("Particle position is NaN or infinite")
+        if xyz.min() > -999.999 and xyz.max() < 9999.999:
+            model = self._model % tuple(xyz.ravel().tolist())
+        else:
+            model = self._model_wide % tuple(_format_83(v) for v in xyz.ravel())
+        return f"{self.header()}{model}{self._footer}"
+
+    def write(self, path, positions):
+        """
+        Write one frame to `path`. The file is renamed into place, so anything
+        watching the directory never sees a half-written PDB.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            fh.write(self.format(positions))
+        os.replace(tmp_path, path)
+
+
+_worker_template = None
+
+
+def _init_worker(template):
+    global _worker_template
+    _worker_template = template
+
+
+def _write_chunk(paths, coords):
+    for path, xyz in zip(paths, coords):
+        _worker_template.write(path, xyz)
+    return len(paths)
+
+
+def write_frames(template, paths, coords, workers=1, chunk=50):
+    """
+    Write frame i of an (n_frames, n_atoms, 3) Å array to paths[i], using
+    `workers` processes for large exports. Returns the number of files written.
+    """
+    if workers <= 1:
+        _init_worker(template)
+        return _write_chunk(paths, coords)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(template,)
+    ) as pool:
+        futures = [
+            pool.submit(_write_chunk, paths[i : i + chunk], coords[i : i + chunk])
+            for i in range(0, len(paths), chunk)
+        ]
+        return sum(f.result() for f in futures)
 
 
 # --- Custom reporter that writes one PDB per report interval ---
@@ -14,6 +125,7 @@ class PDBFrameWriter:
         self._dir = directory
         self._base = base_name
         self._count = 0
+        self._template = None
         os.makedirs(self._dir, exist_ok=True)
 
     def describeNextReport(self, simulation):
@@ -32,6 +144,8 @@ class PDBFrameWriter:
             step = (self._count + 1) * self._reportInterval
         fname = f"{self._base}_{int(step):09d}.pdb"
         out_path = os.path.join(self._dir, fname)
-        with open(out_path, "w", encoding="utf-8") as fh:
-            PDBFile.writeFile(simulation.topology, state.getPositions(), fh)
+        # The topology is fixed for a Simulation, so its template is built once
+        if self._template is None:
+            self._template = PDBTemplate(simulation.topology)
+        self._template.write(out_path, state.getPositions(asNumpy=True))
         self._count += 1
@@ -0,0 +1,242 @@
+"""Pick the fastest OpenMM platform/precision/thread setting for a System"""
+
+import copy
+import hashlib
+import json
+import math
+import os
+import platform as pyplatform
+import socket
+import time
+
+from openmm import Context, Platform, VerletIntegrator
+from openmm.unit import picoseconds
+
+GPU_PLATFORMS = ("CUDA", "OpenCL")
+GPU_PRECISIONS = ("mixed", "single")
+DEFAULT_CACHE = os.path.join(
+    os.path.expanduser("~"), ".cache", "bilbomd", "openmm_platform.json"
+)
+
+
+def _available_platforms():
+    names = [
+        Platform.getPlatform(i).getName() for i in range(Platform.getNumPlatforms())
+    ]
+    return [n for n in ("CUDA", "OpenCL", "CPU") if n in names]
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return pyplatform.processor()
+
+
+def host_fingerprint():
+    """
+    Short hash describing the hardware this process can use.
+
+    Nodes with the same CPU model, usable core count, visible GPU count and
+    OpenMM build share a fingerprint, so one benchmark serves a whole partition.
+    """
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES", "")
+    parts = [
+        pyplatform.machine(),
+        _cpu_model(),
+        str(_cpu_count()),
+        str(len([d for d in visible.split(",") if d])),
+        Platform.getOpenMMVersion(),
+        ",".join(_available_platforms()),
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:12]
+
+
+def size_bucket(num_particles):
+    """Round the particle count up to the next power of two."""
+    return 2 ** max(0, math.ceil(math.log2(max(1, num_particles))))
+
+
+def _thread_candidates(ncpu):
+    candidates = {ncpu}
+    n = 1
+    while n < ncpu:
+        candidates.add(n)
+        n *= 2
+    return sorted(candidates)
+
+
+def _device_properties(name, precision=None, gpu_id=None, threads=None):
+    props = {}
+    if name == "CUDA":
+        if precision:
+            props["CudaPrecision"] = precision
+        if gpu_id is not None:
+            props["CudaDeviceIndex"] = str(gpu_id)
+    elif name == "OpenCL":
+        if precision:
+            props["OpenCLPrecision"] = precision
+        if gpu_id is not None:
+            props["OpenCLDeviceIndex"] = str(gpu_id)
+    elif name == "CPU" and threads:
+        props["Threads"] = str(threads)
+    return props
+
+
+def _benchmark(system, positions, name, props, min_seconds, max_steps):
+    """Return steps/s for `system` on one platform setting."""
+    integrator = VerletIntegrator(0.0005 * picoseconds)
+    context = Context(
+        copy.deepcopy(system), integrator, Platform.getPlatformByName(name), props
+    )
+    context.setPositions(positions)
+    integrator.step(5)  # warm up kernels and neighbour lists
+    context.getState(getEnergy=True)
+    steps = 0
+    start = time.perf_counter()
+    while steps < max_steps:
+        integrator.step(10)
+        steps += 10
+        # Force a sync so asynchronous GPU platforms are timed correctly
+        context.getState(getEnergy=True)
+        if time.perf_counter() - start >= min_seconds:
+            break
+    return steps / (time.perf_counter() - start)
+
+
+def _load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_cache(path, key, entry):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    cache = _load_cache(path)
+    cache[key] = entry
+    # The cache may be shared by concurrent jobs; keep their temp files apart
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(cache, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def autotune(
+    system,
+    positions,
+    label,
+    cache_path=DEFAULT_CACHE,
+    gpu_id=None,
+    min_seconds=1.0,
+    max_steps=2000,
+    refresh=False,
+):
+    """
+    Benchmark the System on every available platform/precision/thread count
+    and return (Platform, properties) for the fastest one.
+
+    The decision is cached per host fingerprint, `label` (e.g. "md") and
+    system-size bucket. GPU device indices are never cached; `gpu_id` is
+    applied to the cached choice at lookup time.
+    """
+    key = f"{host_fingerprint()}:{label}:{size_bucket(system.getNumParticles())}"
+    cache = {} if refresh else _load_cache(cache_path)
+    entry = cache.get(key)
+
+    if entry is None:
+        names = _available_platforms()
+        candidates = []
+        for name in names:
+            if name in GPU_PLATFORMS:
+                candidates += [(name, p, None) for p in GPU_PRECISIONS]
+        if names == ["CPU"]:
+            # CPU-only node: sweeping the thread count is all we can tune
+            candidates += [("CPU", None, t) for t in _thread_candidates(_cpu_count())]
+        elif "CPU" in names:
+            candidates.append(("CPU", None, _cpu_count()))
+
+        results = []
+        for name, precision, threads in candidates:
+            props = _device_properties(name, precision, gpu_id, threads)
+            try:
+                rate = _benchmark(
+                    system, positions, name, props, min_seconds, max_steps
+                )
+            except Exception as e:
+                print(f"[autotune] {name} {precision or threads or ''} failed: {e}")
+                continue
+            print(
+                f"[autotune] {name:<6} precision={precision or '-':<6} "
+                f"threads={threads or '-':<4} {rate:10.1f} steps/s"
+            )
+            results.append(
+                {
+                    "platform": name,
+                    "precision": precision,
+                    "threads": threads,
+                    "steps_per_sec": rate,
+                }
+            )
+
+        if not results:
+            raise RuntimeError("No OpenMM platform could run this System")
+
+        best = max(results, key=lambda r: r["steps_per_sec"])
+        entry = dict(best, host=socket.gethostname(), timestamp=time.time())
+        entry["results"] = results
+        _store_cache(cache_path, key, entry)
+        print(f"[autotune] Cached choice for {key}: {best['platform']}")
+    else:
+        print(f"[autotune] Using cached choice for {key}: {entry['platform']}")
+
+    props = _device_properties(
+        entry["platform"], entry.get("precision"), gpu_id, entry.get("threads")
+    )
+    return Platform.getPlatformByName(entry["platform"]), props
+
+
+def select_platform(config, system, positions, label, gpu_id=None, prefer=None):
+    """
+    Resolve the platform for a Simulation from the config.
+
+    Order of precedence: the OPENMM_PLATFORM environment variable, then
+    `platform.name` in the config, then the autotuner when `platform.autotune`
+    is true, and finally `prefer` (if that platform exists). Returns
+    (None, {}) to let OpenMM pick its default platform.
+    """
+    opts = config.get("platform") or {}
+    name = os.environ.get("OPENMM_PLATFORM") or opts.get("name")
+    if name:
+        props = _device_properties(
+            name, opts.get("precision"), gpu_id, opts.get("threads")
+        )
+        return Platform.getPlatformByName(name), props
+
+    if opts.get("autotune"):
+        return autotune(
+            system,
+            positions,
+            label,
+            cache_path=opts.get("cache", DEFAULT_CACHE),
+            gpu_id=gpu_id,
+            min_seconds=float(opts.get("benchmark_seconds", 1.0)),
+        )
+
+    if prefer and prefer in _available_platforms():
+        return Platform.getPlatformByName(prefer), _device_properties(
+            prefer, gpu_id=gpu_id
+        )
+    return None, {}
@@ -0,0 +1,95 @@
+"""CHARMM-equivalent reduced nonbonded setup for BilboMD OpenMM MD"""
+
+from openmm import (
+    CustomBondForce,
+    CustomGBForce,
+    CustomNonbondedForce,
+    GBSAOBCForce,
+    NonbondedForce,
+)
+
+# CHARMM36 CT1 (protein CA) Lennard-Jones parameters:
+#   epsilon = 0.032 kcal/mol, Rmin/2 = 2.0 Å  ->  sigma = 2 * Rmin/2 / 2^(1/6)
+CA_SIGMA_NM = 0.4 / 2 ** (1.0 / 6.0)
+CA_EPSILON_KJ = 0.032 * 4.184
+
+
+def _is_lj14_bond_force(force):
+    """True for the CustomBondForce ForceField uses for CHARMM 1-4 Lennard-Jones."""
+    if not isinstance(force, CustomBondForce):
+        return False
+    names = {
+        force.getPerBondParameterName(i) for i in range(force.getNumPerBondParameters())
+    }
+    return {"sigma", "epsilon"} <= names
+
+
+def remove_nonbonded_forces(system):
+    """
+    Remove electrostatics, Lennard-Jones (including the CHARMM 1-4 terms) and
+    implicit solvent forces from a System. Bonded terms are left untouched.
+    Returns the class names of the removed forces.
+    """
+    removed = []
+    for i in reversed(range(system.getNumForces())):
+        force = system.getForce(i)
+        if isinstance(
+            force, (NonbondedForce, CustomNonbondedForce, GBSAOBCForce, CustomGBForce)
+        ) or _is_lj14_bond_force(force):
+            removed.append(force.__class__.__name__)
+            system.removeForce(i)
+    return removed
+
+
+def apply_charmm_ca_nonbonded(
+    system,
+    topology,
+    cutoff=0.8,
+    switch_distance=0.7,
+    softcore_alpha=0.5,
+    sigma=CA_SIGMA_NM,
+    epsilon=CA_EPSILON_KJ,
+):
+    """
+    Replace the full nonbonded model with the one used by the CHARMM dynamics
+    template (`NBACtive SELE type CA`, `noelec`, vswitch, CUTNB 8 Å).
+
+    Electrostatics and implicit solvent are dropped and only CA-CA pairs
+    interact, through a soft-core Lennard-Jones potential with a switching
+    function between `switch_distance` and `cutoff` (nm). Pairs up to three
+    bonds apart are excluded, so neighbouring CAs are left to the bonded terms.
+
+    Parameters:
+      system (openmm.System): System built by ForceField.createSystem.
+      topology (openmm.app.Topology): Topology matching the System.
+      cutoff (float): Nonbonded cutoff in nm.
+      switch_distance (float): Distance (nm) where switching starts.
+      softcore_alpha (float): Soft-core parameter; 0 gives plain LJ.
+      sigma (float): LJ sigma in nm (defaults to CHARMM CT1).
+      epsilon (float): LJ well depth in kJ/mol (defaults to CHARMM CT1).
+    """
+    removed = remove_nonbonded_forces(system)
+    print(f"Removed nonbonded forces: {removed}")
+
+    ca_atoms = [atom.index for atom in topology.atoms() if atom.name == "CA"]
+
+    force = CustomNonbondedForce(
+        "4*eps_ca*(x^2 - x); x = sig6/(r^6 + alpha_sc*sig6); sig6 = sig_ca^6"
+    )
+    force.addGlobalParameter("eps_ca", epsilon)
+    force.addGlobalParameter("sig_ca", sigma)
+    force.addGlobalParameter("alpha_sc", softcore_alpha)
+    for _ in range(system.getNumParticles()):
+        force.addParticle([])
+    force.setNonbondedMethod(CustomNonbondedForce.CutoffNonPeriodic)
+    force.setCutoffDistance(cutoff)
+    force.setUseSwitchingFunction(True)
+    force.setSwitchingDistance(switch_distance)
+    force.addInteractionGroup(ca_atoms, ca_atoms)
+
+    bonds = [(bond[0].index, bond[1].index) for bond in topology.bonds()]
+    force.createExclusionsFromBonds(bonds, 3)
+    system.addForce(force)
+
+    print(f"CA-only soft-core nonbonded force over {len(ca_atoms)} CA atoms")
+    return force
@@ -0,0 +1,280 @@
+"""Adaptive allocation of MD steps across Rg targets"""
+
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+from utils.dcd import DCDTrajectory
+
+
+def exploration_grid(rg_min, rg_max, size):
+    """Evenly spaced Rg targets (Å, rounded to 0.1) covering [rg_min, rg_max]."""
+    if size <= 1 or rg_max <= rg_min:
+        return [float(rg_min)]
+    return sorted({round(float(rg), 1) for rg in np.linspace(rg_min, rg_max, size)})
+
+
+def round_steps(steps, quantum):
+    """Round `steps` down to a multiple of `quantum`."""
+    return int(steps) // quantum * quantum
+
+
+def read_rg_samples(csv_path, max_step, burn_in_step=0):
+    """
+    Rg values (Å) from a RadiusOfGyrationReporter CSV with
+    burn_in_step < Step <= max_step. Incomplete trailing rows are ignored.
+    """
+    values = []
+    if not os.path.exists(csv_path):
+        return np.array(values)
+    with open(csv_path, "r", newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        next(reader, None)
+        for row in reader:
+            try:
+                step, rg = int(float(row[0])), float(row[1])
+            except (IndexError, ValueError):
+                continue
+            if burn_in_step < step <= max_step:
+                values.append(rg)
+    return np.array(values)
+
+
+def shape_descriptors(coords):
+    """
+    Rotation-invariant shape of each frame: square roots of the eigenvalues
+    of the gyration tensor (Å), sorted descending. Their norm is the Rg.
+    """
+    centered = coords - coords.mean(axis=1, keepdims=True)
+    gyration = np.einsum("fni,fnj->fij", centered, centered) / coords.shape[1]
+    eig = np.linalg.eigvalsh(gyration)[:, ::-1]
+    return np.sqrt(np.clip(eig, 0.0, None))
+
+
+def summarize_target(
+    rg, rg_dir, rgyr_filename, dcd_filename, atom_indices, max_step, burn_in=0.2
+):
+    """
+    Summarise the exploration segment of one Rg target, ignoring anything
+    written after `max_step` (an extension may already be appending).
+    Returns None if the target produced no usable output.
+    """
+    burn_in_step = int(max_step * burn_in)
+    samples = read_rg_samples(
+        os.path.join(rg_dir, rgyr_filename), max_step, burn_in_step
+    )
+    dcd_path = os.path.join(rg_dir, dcd_filename)
+    descriptors = np.empty((0, 3))
+    if os.path.exists(dcd_path):
+        traj = DCDTrajectory(dcd_path, max_step=max_step)
+        keep = traj.steps() > burn_in_step
+        if keep.any():
+            coords = traj.positions(atom_indices, np.nonzero(keep)[0])
+            descriptors = shape_descriptors(coords.astype(np.float64))
+    if len(samples) == 0 and len(descriptors) == 0:
+        return None
+    if len(samples) == 0:
+        samples = np.linalg.norm(descriptors, axis=1)
+    return {
+        "rg": rg,
+        "mean_rg": float(samples.mean()),
+        "std_rg": float(samples.std()),
+        "n_frames": int(len(descriptors)),
+        "descriptors": descriptors,
+    }
+
+
+def _nearest_median(desc, others):
+    """Median over `desc` rows of the distance to the nearest row of `others`."""
+    if len(others) == 0:
+        return float("inf")
+    d = np.linalg.norm(desc[:, None, :] - others[None, :, :], axis=2)
+    return float(np.median(d.min(axis=1)))
+
+
+def _score_targets(summaries, novelty_threshold):
+    """
+    Add novelty (median distance from each frame's shape to the nearest frame
+    of any other target) and spread (mean distance of frames to the target's
+    own mean shape) to every summary; both are in Å. Then walk the targets
+    from most to least informative and flag as redundant any whose frames lie
+    within `novelty_threshold` of a target already kept, so one member of
+    every cluster of look-alike targets survives.
+    """
+    if not summaries:
+        return
+    pooled = np.concatenate([s["descriptors"] for s in summaries])
+    owners = np.concatenate(
+        [np.full(len(s["descriptors"]), i) for i, s in enumerate(summaries)]
+    )
+    for i, s in enumerate(summaries):
+        desc = s["descriptors"]
+        if len(desc) == 0:
+            s["novelty"], s["spread"] = 0.0, 0.0
+            continue
+        s["novelty"] = _nearest_median(desc, pooled[owners != i])
+        s["spread"] = float(np.linalg.norm(desc - desc.mean(axis=0), axis=1).mean())
+
+    kept = []
+    order = sorted(summaries, key=lambda s: (-(s["novelty"] + s["spread"]), s["rg"]))
+    for s in order:
+        desc = s["descriptors"]
+        pool = np.concatenate(kept) if kept else np.empty((0, 3))
+        s["redundant"] = len(desc) == 0 or (
+            _nearest_median(desc, pool) < novelty_threshold
+        )
+        if not s["redundant"]:
+            kept.append(desc)
+
+
+def _largest_remainder(weights, units, caps):
+    """Split `units` proportionally to `weights` without exceeding `caps`."""
+    alloc = np.zeros(len(weights), dtype=np.int64)
+    weights = np.asarray(weights, dtype=float)
+    caps = np.asarray(caps, dtype=np.int64)
+    while units > 0:
+        open_ = (alloc < caps) & (weights > 0)
+        if not open_.any():
+            break
+        share = np.where(open_, weights, 0.0)
+        share = share / share.sum() * units
+        give = np.minimum(np.floor(share).astype(np.int64), caps - alloc)
+        if give.sum() == 0:
+            # Hand out single units in order of largest remainder (ties by index)
+            order = sorted(np.nonzero(open_)[0], key=lambda i: (-share[i], i))
+            for i in order[:units]:
+                give[i] = 1
+        alloc += give
+        units -= int(give.sum())
+    return alloc
+
+
+def plan_allocation(
+    summaries,
+    targets,
+    explore_steps,
+    budget_steps,
+    quantum,
+    max_steps_per_target,
+    novelty_threshold=0.5,
+    reach_tolerance=3.0,
+):
+    """
+    Decide how many extra steps each exploration target gets.
+
+    Targets whose frames sit within `novelty_threshold` Å (shape space) of a
+    more informative target are redundant; those that also ended more than
+    `reach_tolerance` Å from their target are marked unreachable. The rest of
+    the budget is split in multiples of `quantum` steps in proportion to
+    novelty + spread, capped at `max_steps_per_target` in total per target.
+    If no target qualifies, every target that produced output competes.
+    The result is deterministic for identical inputs.
+    """
+    by_rg = {s["rg"]: s for s in summaries if s is not None}
+    scored = [by_rg[rg] for rg in targets if rg in by_rg]
+    _score_targets(scored, novelty_threshold)
+
+    decisions = []
+    for rg in targets:
+        s = by_rg.get(rg)
+        entry = {"rg": rg, "explore_steps": explore_steps, "extra_steps": 0}
+        if s is None:
+            entry.update(decision="failed", score=0.0)
+            decisions.append(entry)
+            continue
+        novelty = min(s["novelty"], 1e6)
+        entry.update(
+            mean_rg=round(s["mean_rg"], 3),
+            std_rg=round(s["std_rg"], 3),
+            n_frames=s["n_frames"],
+            novelty=round(novelty, 3),
+            spread=round(s["spread"], 3),
+            score=round(novelty + s["spread"], 3),
+        )
+        if s["redundant"]:
+            off_target = abs(s["mean_rg"] - rg) > reach_tolerance
+            entry["decision"] = "unreachable" if off_target else "redundant"
+        else:
+            entry["decision"] = "extend"
+        decisions.append(entry)
+
+    remaining = budget_steps - explore_steps * len(targets)
+    candidates = [d for d in decisions if d["decision"] == "extend"]
+    if not candidates:
+        candidates = [d for d in decisions if d["decision"] != "failed"]
+    cap_units = max(0, (max_steps_per_target - explore_steps) // quantum)
+    units = max(0, remaining // quantum)
+    alloc = _largest_remainder(
+        [d["score"] for d in candidates], units, [cap_units] * len(candidates)
+    )
+    for d, n in zip(candidates, alloc):
+        d["extra_steps"] = int(n) * quantum
+        if n and d["decision"] != "extend":
+            d["decision"] = "extend (fallback)"
+    for d in decisions:
+        d["total_steps"] = d["explore_steps"] + d["extra_steps"]
+
+    allocated = sum(d["extra_steps"] for d in decisions)
+    return {
+        "budget_steps": budget_steps,
+        "explore_steps_per_target": explore_steps,
+        "explore_total": explore_steps * len(targets),
+        "extension_total": allocated,
+        "unspent_steps": budget_steps - explore_steps * len(targets) - allocated,
+        "targets": decisions,
+    }
+
+
+def assign_to_tasks(decisions, world_size):
+    """
+    Spread extensions over tasks, longest first, always onto the least loaded
+    task (ties broken by task id). Returns a list of rg lists, one per task.
+    """
+    loads = [0] * world_size
+    tasks = [[] for _ in range(world_size)]
+    work = sorted(
+        (d for d in decisions if d["extra_steps"] > 0),
+        key=lambda d: (-d["extra_steps"], d["rg"]),
+    )
+    for d in work:
+        t = min(range(world_size), key=lambda i: (loads[i], i))
+        tasks[t].append(d["rg"])
+        loads[t] += d["extra_steps"]
+    return tasks
+
+
+def mark_done(directory, name):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as fh:
+        fh.write(f"{time.time()}\n")
+
+
+def wait_for_markers(directory, names, timeout=86400.0, poll=10.0):
+    """Block until every marker file in `names` exists in `directory`."""
+    deadline = time.monotonic() + timeout
+    while True:
+        missing = [n for n in names if not os.path.exists(os.path.join(directory, n))]
+        if not missing:
+            return
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Timed out waiting for {missing} in {directory}")
+        time.sleep(poll)
+
+
+def write_plan(path, plan):
+    """Atomically write an allocation plan as JSON."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(plan, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_plan(path):
+    """Load an allocation plan written by write_plan, or None if absent."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
@@ -1,5 +1,5 @@
 # from openmm.app import *
-from openmm import CustomCVForce, CustomCentroidBondForce
+from openmm import CustomCVForce, CustomCentroidBondForce, RGForce
 from openmm.unit import nanometer, dalton, angstroms
 import csv
 import numpy as np
@@ -34,15 +34,17 @@ class RadiusOfGyrationReporter:
         system,
         filename,
         reportInterval=500,
+        append=False,
     ):
         self.atom_indices = atom_indices
         self.system = system
         self.reportInterval = reportInterval
         self.filename = filename
-        # Open CSV file and write header
-        self.csvfile = open(self.filename, "w", newline="")
+        # Open CSV file and write header (keep existing rows when resuming)
+        self.csvfile = open(self.filename, "a" if append else "w", newline="")
         self.writer = csv.writer(self.csvfile)
-        self.writer.writerow(["Step", "Radius_of_Gyration_nm"])
+        if not append:
+            self.writer.writerow(["Step", "Radius_of_Gyration_nm"])
 
     def describeNextReport(self, simulation):
         # print(f"describeNextReport called at step {simulation.currentStep}, interval={self.reportInterval}")
@@ -138,6 +140,110 @@ class RadiusOfGyrationCVForce(CustomCVForce):
         print("Done creating CVForce object for Rg")
 
 
+RG_METHODS = ("rgforce", "centroid", "residue")
+RG_SELECTIONS = ("all", "ca", "residue")
+
+
+def _element_mass(atom):
+    if atom.element is None:
+        return 12.011
+    return atom.element.mass.value_in_unit(dalton)
+
+
+def rg_restraint_selection(rgyr_config, topology):
+    """
+    Resolve (method, atom_indices) for the Rg restraint from the `rgyr` config.
+
+    `selection` is "all" (every particle, the default), "ca" (CA atoms only,
+    matching RadiusOfGyrationReporter) or "residue" (mass-weighted residue
+    centroids, which always uses the "residue" method). `method` is
+    "rgforce" (default) or "centroid".
+    """
+    selection = rgyr_config.get("selection", "all")
+    method = rgyr_config.get("method", "rgforce")
+    if selection == "all":
+        return method, None
+    if selection == "ca":
+        return method, [a.index for a in topology.atoms() if a.name == "CA"]
+    if selection == "residue":
+        return "residue", None
+    raise ValueError(f"Unknown Rg selection: {selection} (expected {RG_SELECTIONS})")
+
+
+def create_residue_rg_restraint(topology, k, rg0, atom_indices=None):
+    """
+    Harmonic restraint on the Rg of mass-weighted residue centroids.
+
+    Uses one centroid group per residue plus one for the whole selection, so
+    the cost scales with the number of residues rather than atoms. The CV is
+    sum_r (M_r / M) * |c_r - C|^2, which is the all-atom Rg^2 minus the
+    (nearly constant) spread of atoms inside each residue, and is close to the
+    CA Rg written by RadiusOfGyrationReporter. Element masses are used as
+    weights so residues inside rigid bodies (massless real atoms) still count.
+
+    Parameters:
+        topology (Topology): Topology matching the System.
+        k (float): Force constant in kJ/mol/nm².
+        rg0 (float): Target Rg in nm.
+        atom_indices (list of int): Optional subset of atoms to include.
+    """
+    keep = None if atom_indices is None else set(atom_indices)
+    residues = []
+    for residue in topology.residues():
+        atoms = [a for a in residue.atoms() if keep is None or a.index in keep]
+        if atoms:
+            residues.append(atoms)
+
+    all_atoms = [a.index for atoms in residues for a in atoms]
+    all_weights = [_element_mass(a) for atoms in residues for a in atoms]
+    total_mass = sum(all_weights)
+
+    rg2_force = CustomCentroidBondForce(2, "w * distance(g1, g2)^2")
+    rg2_force.addPerBondParameter("w")
+    for atoms in residues:
+        rg2_force.addGroup([a.index for a in atoms], [_element_mass(a) for a in atoms])
+    whole = rg2_force.addGroup(all_atoms, all_weights)
+    for g, atoms in enumerate(residues):
+        rg2_force.addBond([g, whole], [sum(_element_mass(a) for a in atoms) / total_mass])
+
+    cv = CustomCVForce("0.5 * k * (sqrt(cv) - rg0)^2")
+    cv.addCollectiveVariable("cv", rg2_force)
+    cv.addGlobalParameter("k", k)
+    cv.addGlobalParameter("rg0", rg0)
+    print(f"Residue-centroid Rg restraint over {len(residues)} residues")
+    return cv
+
+
+def create_rg_restraint(method, k, rg0, atom_indices=None, system=None, topology=None):
+    """
+    Build a harmonic Rg restraint as a CustomCVForce with an `rg0` global parameter.
+
+    Parameters:
+        method (str): "rgforce" (OpenMM's built-in RGForce, unweighted),
+                      "centroid" (RadiusOfGyrationCVForce, one centroid bond per atom)
+                      or "residue" (create_residue_rg_restraint).
+        k (float): Force constant in kJ/mol/nm².
+        rg0 (float): Target Rg in nm.
+        atom_indices (list of int): Atoms in the Rg; None means every particle.
+        system (System): Needed by "centroid" when atom_indices is None.
+        topology (Topology): Needed by "residue".
+    """
+    if method == "rgforce":
+        rg_force = RGForce(atom_indices) if atom_indices is not None else RGForce()
+        cv = CustomCVForce("0.5 * k * (rg - rg0)^2")
+        cv.addCollectiveVariable("rg", rg_force)
+        cv.addGlobalParameter("k", k)
+        cv.addGlobalParameter("rg0", rg0)
+        return cv
+    if method == "centroid":
+        if atom_indices is None:
+            atom_indices = list(range(system.getNumParticles()))
+        return RadiusOfGyrationCVForce(atom_indices, k, rg0, system=system)
+    if method == "residue":
+        return create_residue_rg_restraint(topology, k, rg0, atom_indices)
+    raise ValueError(f"Unknown Rg restraint method: {method} (expected {RG_METHODS})")
+
+
 def compute_radius_of_gyration(positions, atom_indices, masses):
     coords = np.array([positions[i].value_in_unit(nanometer) for i in atom_indices])
     mass_array = np.array([masses[i] for i in atom_indices])
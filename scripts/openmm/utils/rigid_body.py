@@ -80,6 +80,8 @@ def get_rigid_bodies(modeller, configs):
         - "segments": a list of segments, where each segment has:
             - "chain_id": the chain identifier.
             - "residues": either a dictionary with keys "start" and "stop" or an iterable of residue IDs.
+
+    A rigid body that matches no atoms is skipped with a warning.
     """
     rigid_bodies = {}
 
@@ -106,6 +108,8 @@ def get_rigid_bodies(modeller, configs):
 
         if body_atoms:
             rigid_bodies[name] = body_atoms
+        else:
+            print(f"[WARNING] Rigid body {name} matches no atoms of the topology; skipping it")
 
     return rigid_bodies
 
@@ -250,3 +254,23 @@ def create_rigid_bodies(system, positions, bodies):
                         weights[2],
                     ),
                 )
+
+
+def remove_virtual_site_constraints(system):
+    """
+    Remove every constraint that involves a virtual site.
+
+    create_rigid_bodies already drops constraints inside a body, but a
+    constraint between a virtual site and an atom outside its body (e.g. an
+    HBonds constraint across a body boundary) would make Context creation fail.
+    Returns the number of removed constraints.
+    """
+    removed = 0
+    for i in range(system.getNumConstraints() - 1, -1, -1):
+        p1, p2, _ = system.getConstraintParameters(i)
+        if system.isVirtualSite(p1) or system.isVirtualSite(p2):
+            system.removeConstraint(i)
+            removed += 1
+    if removed:
+        print(f"Removed {removed} constraints involving rigid-body virtual sites.")
+    return removed
@@ -0,0 +1,379 @@
+"""Approximate SAXS profiles from MD frames (Debye formula over residue beads)"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+from openmm.unit import angstroms
+
+# Atomic excluded volumes (Å^3, Fraser et al. 1978, as used by FoXS) and the
+# electron density of bulk water (e/Å^3)
+ATOM_VOLUMES = {"H": 5.15, "C": 16.44, "N": 2.49, "O": 9.13, "S": 19.86, "P": 5.73}
+WATER_DENSITY = 0.334
+# Hydration layer of the partial profiles: excess electrons per exposed heavy
+# atom, volume of a water molecule (Å^3), and the bead neighbour count (within
+# NEIGHBOUR_RADIUS Å) at which a residue counts as fully buried
+HYDRATION_ELECTRONS = 1.0
+WATER_VOLUME = 29.9
+NEIGHBOUR_RADIUS = 10.0
+BURIED_NEIGHBOURS = 24
+# Order of the partial profiles and the c1/c2 coefficient of each in
+# I = I_vv + c1^2 I_ee + c2^2 I_hh - 2 c1 I_ve + 2 c2 I_vh - 2 c1 c2 I_eh
+PARTIALS = ("vv", "ee", "hh", "ve", "vh", "eh")
+
+
+def atomic_form_factor(q, electrons, volume, rho0=WATER_DENSITY):
+    """
+    Form factor of one atom (plus its hydrogens) in solution: electrons minus
+    the Gaussian-sphere displaced solvent term. `q` in 1/Å.
+    """
+    displaced = rho0 * volume * np.exp(-(q**2) * volume ** (2.0 / 3.0) / (4 * np.pi))
+    return electrons - displaced
+
+
+def residue_beads(topology):
+    """
+    Describe each residue as one bead at the centroid of its heavy atoms.
+
+    Returns (heavy atom indices grouped by residue, reduceat offsets of each
+    residue, and per residue a list of (atom index, electrons, volume)).
+    Hydrogens are folded into the heavy atom they are bonded to.
+    """
+    hydrogens = {}
+    for a, b in topology.bonds():
+        for heavy, h in ((a, b), (b, a)):
+            if h.element is not None and h.element.symbol == "H":
+                hydrogens[heavy.index] = hydrogens.get(heavy.index, 0) + 1
+
+    heavy, offsets, atoms = [], [], []
+    for residue in topology.residues():
+        res_atoms = []
+        for atom in residue.atoms():
+            if atom.element is None or atom.element.symbol == "H":
+                continue
+            nh = hydrogens.get(atom.index, 0)
+            symbol = atom.element.symbol
+            electrons = atom.element.atomic_number + nh
+            volume = ATOM_VOLUMES.get(symbol, ATOM_VOLUMES["C"])
+            volume += nh * ATOM_VOLUMES["H"]
+            res_atoms.append((atom.index, electrons, volume))
+        if res_atoms:
+            offsets.append(len(heavy))
+            heavy += [i for i, _, _ in res_atoms]
+            atoms.append(res_atoms)
+    return np.array(heavy, dtype=np.int64), np.array(offsets, dtype=np.int64), atoms
+
+
+class DebyeProfileEngine:
+    """
+    Residue-bead Debye calculator with a shared form-factor shape.
+
+    Each bead's form factor is f_r(q) = f_r(0) * E(q), where E(q) is the
+    average normalised residue form factor computed once from the starting
+    structure. Then I(q) = E(q)^2 * sum_ij f_i(0) f_j(0) sinc(q r_ij), which is
+    evaluated from a single weighted histogram of bead distances and a
+    precomputed sinc matrix, so each frame costs one pair-distance pass.
+    """
+
+    def __init__(self, topology, positions, q, bin_width=0.5, d_max=None):
+        self.q = np.asarray(q, dtype=np.float64)
+        self.heavy, self.offsets, residues = residue_beads(topology)
+        self.counts = np.diff(np.append(self.offsets, len(self.heavy)))
+
+        xyz = self._atom_coords(positions)
+        beads = self.bead_coords(xyz)
+        shapes, weights = [], []
+        for r, res_atoms in enumerate(residues):
+            f = np.array(
+                [atomic_form_factor(self.q, e, v) for _, e, v in res_atoms]
+            )  # (n_atoms, n_q)
+            local = xyz[self.offsets[r] : self.offsets[r] + self.counts[r]]
+            d = np.linalg.norm(local[:, None, :] - local[None, :, :], axis=2)
+            sinc = np.sinc(self.q[None, None, :] * d[:, :, None] / np.pi)
+            amplitude = np.sqrt(np.abs(np.einsum("iq,jq,ijq->q", f, f, sinc)))
+            weights.append(amplitude[0])
+            shapes.append(amplitude / amplitude[0])
+        self.weights = np.array(weights)
+        self.shape = np.mean(shapes, axis=0) ** 2
+        self.self_term = np.sum(self.weights**2)
+
+        if d_max is None:
+            extent = np.linalg.norm(beads - beads.mean(axis=0), axis=1).max()
+            d_max = 4.0 * extent + 20.0
+        self.bin_width = float(bin_width)
+        self._set_range(d_max)
+        self.pair_i, self.pair_j = np.triu_indices(len(self.weights), 1)
+        self.pair_w = self.weights[self.pair_i] * self.weights[self.pair_j]
+
+    def _set_range(self, d_max):
+        self.edges = np.arange(0.0, d_max + self.bin_width, self.bin_width)
+        centres = 0.5 * (self.edges[1:] + self.edges[:-1])
+        self.sinc = np.sinc(np.outer(self.q, centres) / np.pi)  # (n_q, n_bins)
+
+    def _atom_coords(self, positions):
+        if hasattr(positions, "value_in_unit"):
+            positions = positions.value_in_unit(angstroms)
+        return np.asarray(positions, dtype=np.float64)[self.heavy]
+
+    def bead_coords(self, heavy_xyz):
+        """Residue centroids from heavy-atom coordinates ordered like `self.heavy`."""
+        return np.add.reduceat(heavy_xyz, self.offsets, axis=0) / self.counts[:, None]
+
+    def profile(self, beads):
+        """I(q) for one frame of bead coordinates (Å)."""
+        diff = beads[self.pair_i] - beads[self.pair_j]
+        r = np.sqrt(np.einsum("ij,ij->i", diff, diff))
+        if r.size and r.max() >= self.edges[-1]:
+            # Unfolded frame: widen the histogram instead of dropping pairs
+            self._set_range(1.5 * r.max())
+        hist, _ = np.histogram(r, bins=self.edges, weights=self.pair_w)
+        return self.shape * (self.self_term + 2.0 * self.sinc @ hist)
+
+
+def fit_to_experiment(profiles, exp_q, exp_i, exp_err, q):
+    """
+    Interpolate `profiles` (n_frames, n_q) onto the experimental q grid and fit
+    a scale factor per frame in closed form. Returns (chi2, scale) arrays, χ²
+    per data point as in pipeline_decision_tree.calculate_chi_square.
+    """
+    model = np.array([np.interp(exp_q, q, p) for p in np.atleast_2d(profiles)])
+    w = 1.0 / np.asarray(exp_err) ** 2
+    scale = (model * exp_i * w).sum(axis=1) / (model**2 * w).sum(axis=1)
+    resid = (exp_i[None, :] - scale[:, None] * model) ** 2 * w
+    return resid.sum(axis=1) / max(1, len(exp_q)), scale
+
+
+def _debye_shape(q, factors, xyz):
+    """Normalised amplitude sqrt(sum_ij f_i f_j sinc(q r_ij)) / sum_i f_i(0)."""
+    d = np.linalg.norm(xyz[:, None, :] - xyz[None, :, :], axis=2)
+    sinc = np.sinc(q[None, None, :] * d[:, :, None] / np.pi)
+    amplitude = np.sqrt(np.abs(np.einsum("iq,jq,ijq->q", factors, factors, sinc)))
+    return amplitude / amplitude[0]
+
+
+class PartialProfileEngine:
+    """
+    Residue-bead Debye profiles split FoXS-style into vacuum (v), excluded
+    volume (e) and hydration layer (h) parts, so the c1 (excluded volume) and
+    c2 (hydration) parameters can be fitted afterwards without recomputing.
+
+    Each bead carries v_r = electrons, e_r = displaced solvent electrons and
+    h_r = HYDRATION_ELECTRONS per heavy atom times its exposure, estimated per
+    frame from the number of beads within NEIGHBOUR_RADIUS. Every part has one
+    form-factor shape shared by all residues (see DebyeProfileEngine). Frames
+    are processed in blocks: each block needs one pair-distance pass and six
+    weighted histograms, from which I_XY(q) follows by one matrix product.
+    """
+
+    def __init__(self, topology, positions, q, bin_width=0.5):
+        self.q = np.asarray(q, dtype=np.float64)
+        self.heavy, self.offsets, residues = residue_beads(topology)
+        self.counts = np.diff(np.append(self.offsets, len(self.heavy)))
+        if hasattr(positions, "value_in_unit"):
+            positions = positions.value_in_unit(angstroms)
+        xyz = np.asarray(positions, dtype=np.float64)[self.heavy]
+
+        self.v = np.array([sum(e for _, e, _ in atoms) for atoms in residues])
+        self.e = np.array(
+            [sum(WATER_DENSITY * v for _, _, v in atoms) for atoms in residues]
+        )
+        shapes_v, shapes_e = [], []
+        for r, atoms in enumerate(residues):
+            local = xyz[self.offsets[r] : self.offsets[r] + self.counts[r]]
+            electrons = np.array([[e] * len(self.q) for _, e, _ in atoms])
+            displaced = np.array(
+                [
+                    WATER_DENSITY
+                    * v
+                    * np.exp(-(self.q**2) * v ** (2.0 / 3.0) / (4 * np.pi))
+                    for _, _, v in atoms
+                ]
+            )
+            shapes_v.append(_debye_shape(self.q, electrons, local))
+            shapes_e.append(_debye_shape(self.q, displaced, local))
+        water = np.exp(-(self.q**2) * WATER_VOLUME ** (2.0 / 3.0) / (4 * np.pi))
+        shape_v = np.mean(shapes_v, axis=0)
+        self.shapes = {
+            "v": shape_v,
+            "e": np.mean(shapes_e, axis=0),
+            "h": shape_v * water,
+        }
+        self.bin_width = float(bin_width)
+        self.pair_i, self.pair_j = np.triu_indices(len(self.v), 1)
+
+    def bead_coords(self, heavy_xyz):
+        """
+        Residue centroids of (n_frames, n_heavy, 3) heavy-atom coordinates
+        ordered like `self.heavy`.
+        """
+        return np.add.reduceat(heavy_xyz, self.offsets, axis=1) / self.counts[:, None]
+
+    def exposure(self, r, n_frames):
+        """Fraction of each bead exposed to solvent, from pair distances r."""
+        n_beads = len(self.v)
+        close = (r < NEIGHBOUR_RADIUS).astype(np.float64)
+        base = (np.arange(n_frames) * n_beads)[:, None]
+        neighbours = np.bincount(
+            (base + self.pair_i).ravel(), close.ravel(), minlength=n_frames * n_beads
+        ) + np.bincount(
+            (base + self.pair_j).ravel(), close.ravel(), minlength=n_frames * n_beads
+        )
+        neighbours = neighbours.reshape(n_frames, n_beads)
+        return np.clip(1.0 - neighbours / BURIED_NEIGHBOURS, 0.0, 1.0)
+
+    def partial_profiles(self, beads):
+        """
+        Partial profiles (n_frames, 6, n_q) in PARTIALS order for bead
+        coordinates of shape (n_frames, n_beads, 3).
+        """
+        n_frames = len(beads)
+        diff = beads[:, self.pair_i] - beads[:, self.pair_j]
+        r = np.sqrt(np.einsum("fpi,fpi->fp", diff, diff))
+        h = self.exposure(r, n_frames) * (self.counts * HYDRATION_ELECTRONS)
+        v = np.broadcast_to(self.v, h.shape)
+        e = np.broadcast_to(self.e, h.shape)
+        weights = {"v": v, "e": e, "h": h}
+
+        n_bins = int(r.max() / self.bin_width) + 2 if r.size else 1
+        centres = (np.arange(n_bins) + 0.5) * self.bin_width
+        sinc = np.sinc(np.outer(centres, self.q) / np.pi)  # (n_bins, n_q)
+        flat = (
+            np.arange(n_frames)[:, None] * n_bins
+            + (r / self.bin_width).astype(np.int64)
+        ).ravel()
+
+        partials = np.empty((n_frames, len(PARTIALS), len(self.q)))
+        for k, (x, y) in enumerate(PARTIALS):
+            wx, wy = weights[x], weights[y]
+            pair_w = (
+                wx[:, self.pair_i] * wy[:, self.pair_j]
+                + wx[:, self.pair_j] * wy[:, self.pair_i]
+            )
+            hist = np.bincount(flat, pair_w.ravel(), minlength=n_frames * n_bins)
+            total = (wx * wy).sum(axis=1)[:, None] + hist.reshape(n_frames, -1) @ sinc
+            partials[:, k] = self.shapes[x] * self.shapes[y] * total
+        return partials
+
+
+def c1_c2_coefficients(c1, c2):
+    """Coefficients of the PARTIALS for each (c1, c2) pair; shape (n, 6)."""
+    c1, c2 = np.asarray(c1, dtype=np.float64), np.asarray(c2, dtype=np.float64)
+    return np.stack(
+        [np.ones_like(c1), c1**2, c2**2, -2 * c1, 2 * c2, -2 * c1 * c2], axis=-1
+    )
+
+
+def fit_c1_c2(partials, exp_i, exp_err, c1_values, c2_values):
+    """
+    Best χ² of each frame over a c1 x c2 grid, with the scale factor in closed
+    form. The model is linear in the partial profiles, so only their weighted
+    inner products with the data and with each other are needed per frame.
+    Returns (chi2, c1, c2, scale) arrays, one value per frame, χ² per data
+    point as in fit_to_experiment.
+    """
+    c1, c2 = np.meshgrid(c1_values, c2_values, indexing="ij")
+    c1, c2 = c1.ravel(), c2.ravel()
+    coeffs = c1_c2_coefficients(c1, c2)  # (n_grid, 6)
+    w = 1.0 / np.asarray(exp_err, dtype=np.float64) ** 2
+    b = np.einsum("fkq,q->fk", partials, w * exp_i)
+    gram = np.einsum("fkq,flq,q->fkl", partials, partials, w)
+    num = b @ coeffs.T  # (n_frames, n_grid)
+    den = np.einsum("gk,fkl,gl->fg", coeffs, gram, coeffs)
+    valid = (den > 0) & (num > 0)
+    explained = num**2 / np.where(valid, den, 1.0)
+    resid = np.where(valid, (w * exp_i**2).sum() - explained, np.inf)
+    best = np.argmin(resid, axis=1)
+    rows = np.arange(len(partials))
+    scale = num[rows, best] / den[rows, best]
+    chi2 = resid[rows, best] / max(1, len(exp_i))
+    return chi2, c1[best], c2[best], scale
+
+
+class SAXSProfileReporter:
+    """
+    Compute an approximate SAXS profile for every reported frame on a worker
+    thread and keep all profiles in one matrix file (NumPy .npz with `q`,
+    `steps` and `intensities` of shape (n_frames, n_q)).
+
+    The file is rewritten atomically every `flush_every` frames, so frames can
+    be screened against experimental data while MD is still running.
+    """
+
+    def __init__(
+        self,
+        topology,
+        positions,
+        filename,
+        reportInterval=500,
+        q_max=0.5,
+        n_q=101,
+        bin_width=0.5,
+        flush_every=20,
+        start_step=None,
+    ):
+        self.filename = filename
+        self.reportInterval = int(reportInterval)
+        self.flush_every = int(flush_every)
+        self.engine = DebyeProfileEngine(
+            topology, positions, np.linspace(0.0, q_max, n_q), bin_width=bin_width
+        )
+        self.steps, self.intensities = [], []
+        if start_step is not None and os.path.exists(filename):
+            # Resuming: keep profiles up to the checkpoint step
+            with np.load(filename) as data:
+                keep = data["steps"] <= start_step
+                self.steps = list(data["steps"][keep])
+                self.intensities = list(data["intensities"][keep])
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def describeNextReport(self, simulation):
+        steps = self.reportInterval - simulation.currentStep % self.reportInterval
+        return (steps, True, False, False, False)
+
+    def report(self, simulation, state):
+        xyz = state.getPositions(asNumpy=True).value_in_unit(angstroms)
+        beads = self.engine.bead_coords(np.asarray(xyz)[self.engine.heavy])
+        self._queue.put((simulation.currentStep, beads))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            step, beads = item
+            try:
+                profile = self.engine.profile(beads)
+            except Exception as e:
+                print(f"Exception in SAXSProfileReporter at step {step}: {e}")
+                continue
+            with self._lock:
+                self.steps.append(step)
+                self.intensities.append(profile)
+                self._pending += 1
+                if self._pending >= self.flush_every:
+                    self._write()
+
+    def _write(self):
+        tmp_path = f"{self.filename}.tmp.npz"
+        np.savez(
+            tmp_path,
+            q=self.engine.q,
+            steps=np.array(self.steps, dtype=np.int64),
+            intensities=np.array(self.intensities, dtype=np.float32).reshape(
+                len(self.steps), len(self.engine.q)
+            ),
+        )
+        os.replace(tmp_path, self.filename)
+        self._pending = 0
+
+    def close(self):
+        """Finish queued frames and write the matrix file."""
+        self._queue.put(None)
+        self._worker.join()
+        with self._lock:
+            self._write()
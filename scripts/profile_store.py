@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+Consolidate FoXS profiles (<pdb>.dat files) into one memory-mappable store.
+
+run-multifoxs.py, the analysis scripts and any re-scoring otherwise re-read
+thousands of small text files. `build` parses every profile listed in a
+foxs_dat_files.txt manifest in parallel and writes a single file holding:
+
+- an (n_frames, n_q) float32 intensity matrix, memory-mapped on load
+- the q values (1/Å) of its columns
+- per frame: name (PDB path relative to the manifest directory), the .dat
+  path as listed in the manifest, label, Rg and Dmax (Å) of the PDB, and
+  χ², scale and offset of a fit to the experimental curve (with --data)
+
+File layout: a 64-byte preamble (magic, n_frames, n_q, header offset), the
+little-endian float32 matrix, then a JSON header with everything else.
+
+    python profile_store.py build openmm/md/foxs_dat_files.txt --data saxs.dat
+    python profile_store.py info openmm/md/foxs_profiles.bin
+
+    from profile_store import ProfileStore
+    store = ProfileStore("openmm/md/foxs_profiles.bin")
+    store.intensity[store.row("rg_30/md_000010000.pdb")]
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Rg and Dmax are shared with dcd2pdb and select_frames (scripts/openmm/utils)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "openmm"))
+from utils.dcd import max_dimension, radius_of_gyration  # noqa: E402
+
+MAGIC = b"BMDPROF1"
+PREAMBLE = struct.Struct("<8sQQQ")
+DATA_OFFSET = 64
+DTYPE = np.dtype("<f4")
+STORE_NAME = "foxs_profiles.bin"
+FRAME_COLUMNS = ("rg", "dmax", "chi2", "scale", "offset")
+
+
+def read_dat(path):
+    """
+    q and intensity of a FoXS profile: the second column of a q/intensity
+    (/error) file, or for a partial profile file (q plus 3 or 6 partial
+    profiles, as written by foxs -p) their sum at FoXS's default c1 = 1,
+    c2 = 0, which is I_vv + I_ee - I_ve.
+    """
+    with open(path, "r", encoding="utf-8") as fh:
+        rows = [line for line in fh if line.strip() and not line.startswith("#")]
+    if not rows:
+        raise ValueError(f"{path} has no profile data")
+    ncols = len(rows[0].split())
+    values = np.array(" ".join(rows).split(), dtype=np.float64).reshape(-1, ncols)
+    if ncols in (4, 7):
+        return values[:, 0], values[:, 1] + values[:, 2] - values[:, 3]
+    return values[:, 0], values[:, 1]
+
+
+def read_saxs_data(path, q_max=None):
+    """
+    q (1/Å), intensity and error columns of an experimental .dat file, up to
+    `q_max` if given.
+    """
+    rows = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                values = [float(v) for v in line.split()[:3]]
+            except ValueError:
+                continue
+            if len(values) == 3 and values[2] > 0:
+                rows.append(values)
+    data = np.array(rows)
+    if q_max is not None:
+        data = data[data[:, 0] <= q_max]
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def structure_descriptors(pdb_path):
+    """
+    (label, Rg, Dmax) of a PDB. CHARMM frames carry them in a
+    REMARK DCD2PDB_RG record; otherwise they are computed from the ATOM and
+    HETATM coordinates (unweighted Rg, Dmax over the convex hull when SciPy
+    is available). Missing files give (None, nan, nan).
+    """
+    label = os.path.splitext(os.path.basename(pdb_path))[0].upper()
+    coords = []
+    try:
+        with open(pdb_path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                if line.startswith("REMARK DCD2PDB_RG"):
+                    parts = line.split()
+                    if len(parts) >= 4:
+                        return parts[1], float(parts[2]), float(parts[3])
+                elif line.startswith(("ATOM", "HETATM")):
+                    coords.append((line[30:38], line[38:46], line[46:54]))
+    except FileNotFoundError:
+        return None, np.nan, np.nan
+    if not coords:
+        return label, np.nan, np.nan
+    points = np.array(coords, dtype=np.float64)[None]
+    return label, float(radius_of_gyration(points)[0]), float(max_dimension(points)[0])
+
+
+def _read_chunk(paths, q_ref, structures):
+    """Parse one chunk of profiles; rows are put on the q_ref grid if needed."""
+    rows, info, regridded = [], [], 0
+    for path in paths:
+        q, intensity = read_dat(path)
+        if q_ref is not None and (len(q) != len(q_ref) or not np.allclose(q, q_ref)):
+            intensity = np.interp(q_ref, q, intensity)
+            regridded += 1
+        rows.append(intensity)
+        pdb_path = path[: -len(".dat")] if path.endswith(".dat") else path
+        info.append(
+            structure_descriptors(pdb_path) if structures else (None, np.nan, np.nan)
+        )
+    return np.array(rows, dtype=DTYPE), info, regridded
+
+
+def interpolate(intensity, q, new_q):
+    """Every row of `intensity` linearly interpolated from `q` to `new_q`."""
+    # Interpolation weights are shared by every row
+    hi = np.clip(np.searchsorted(q, new_q), 1, len(q) - 1)
+    t = (new_q - q[hi - 1]) / (q[hi] - q[hi - 1])
+    return intensity[:, hi - 1] * (1.0 - t) + intensity[:, hi] * t
+
+
+def fit_to_data(intensity, q, exp_q, exp_i, exp_err, offset=True):
+    """
+    Weighted least-squares fit exp ≈ scale * model + offset of every row of
+    `intensity` (interpolated to exp_q; data beyond the profiles' q range is
+    ignored). Returns (chi2, scale, offset) arrays, χ² per data point.
+    """
+    keep = (exp_q >= q[0]) & (exp_q <= q[-1])
+    exp_q, exp_i, exp_err = exp_q[keep], exp_i[keep], exp_err[keep]
+    model = interpolate(intensity, q, exp_q)
+    w = 1.0 / exp_err**2
+    s_mm = (model * model) @ w
+    s_me = model @ (w * exp_i)
+    if offset:
+        s_m, s_1, s_e = model @ w, w.sum(), (w * exp_i).sum()
+        det = s_mm * s_1 - s_m**2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.where(det > 0, (s_me * s_1 - s_m * s_e) / det, 0.0)
+            shift = np.where(det > 0, (s_mm * s_e - s_m * s_me) / det, 0.0)
+    else:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scale = np.where(s_mm > 0, s_me / s_mm, 0.0)
+        shift = np.zeros(len(intensity))
+    residual = (exp_i - scale[:, None] * model - shift[:, None]) / exp_err
+    return (residual**2).mean(axis=1), scale, shift
+
+
+def _json_column(values):
+    return [None if np.isnan(v) else float(v) for v in values]
+
+
+class ProfileStore:
+    """
+    A consolidated FoXS profile store. `intensity` is a read-only memmap of
+    shape (n_frames, n_q); the per-frame columns are NumPy arrays (NaN where
+    unknown) and `frames`, `dat` and `labels` are lists in row order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as fh:
+            magic, n_frames, n_q, header_offset = PREAMBLE.unpack(
+                fh.read(PREAMBLE.size)
+            )
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a FoXS profile store")
+            fh.seek(header_offset)
+            self.header = json.loads(fh.read().decode("utf-8"))
+        self.q = np.array(self.header["q"])
+        self.frames = self.header["frames"]
+        self.dat = self.header["dat"]
+        self.labels = self.header["labels"]
+        for column in FRAME_COLUMNS:
+            values = self.header.get(column) or [None] * n_frames
+            setattr(self, column, np.array(values, dtype=np.float64))
+        self.intensity = (
+            np.memmap(
+                path, dtype=DTYPE, mode="r", offset=DATA_OFFSET, shape=(n_frames, n_q)
+            )
+            if n_frames
+            else np.empty((0, n_q), dtype=DTYPE)
+        )
+        # Frames are found by name, or by file name when that is unique
+        self.index = {name: i for i, name in enumerate(self.frames)}
+        basenames = {}
+        for i, name in enumerate(self.frames):
+            basenames.setdefault(os.path.basename(name), []).append(i)
+        for base, rows in basenames.items():
+            if len(rows) == 1:
+                self.index.setdefault(base, rows[0])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def row(self, name):
+        """Row of a frame, by name (e.g. rg_30/md_000010000.pdb) or file name."""
+        name = name[: -len(".dat")] if name.endswith(".dat") else name
+        return self.index[name]
+
+    def profile(self, name):
+        """Intensity of one frame."""
+        return self.intensity[self.row(name)]
+
+    def table(self):
+        """One dict per frame with its name, label and per-frame columns."""
+        return [
+            {
+                "frame": name,
+                "dat": self.dat[i],
+                "label": self.labels[i],
+                **{c: getattr(self, c)[i] for c in FRAME_COLUMNS},
+            }
+            for i, name in enumerate(self.frames)
+        ]
+
+
+def write_store(path, q, intensity, frames, dat, labels, columns, extra=None):
+    """
+    Write a store from an (n_frames, n_q) matrix and per-frame lists; rows of
+    `intensity` are written in order, so it may itself be a memmap.
+    """
+    n_frames, n_q = len(frames), len(q)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(PREAMBLE.pack(MAGIC, n_frames, n_q, 0).ljust(DATA_OFFSET, b"\0"))
+        for start in range(0, n_frames, 4096):
+            block = np.asarray(intensity[start : start + 4096], dtype=DTYPE)
+            fh.write(np.ascontiguousarray(block).tobytes())
+        header_offset = fh.tell()
+        header = {
+            "version": 1,
+            "q": [float(v) for v in q],
+            "frames": list(frames),
+            "dat": list(dat),
+            "labels": list(labels),
+            **{c: _json_column(np.asarray(v, float)) for c, v in columns.items()},
+            **(extra or {}),
+        }
+        fh.write(json.dumps(header).encode("utf-8"))
+        fh.seek(0)
+        fh.write(PREAMBLE.pack(MAGIC, n_frames, n_q, header_offset))
+    os.replace(tmp_path, path)
+
+
+def read_manifest(manifest, base=None):
+    """
+    (names, manifest entries, absolute .dat paths) of a foxs_dat_files.txt.
+    Entries are relative to `base` (default: the manifest's directory).
+    """
+    base = os.path.abspath(base or os.path.dirname(manifest) or ".")
+    with open(manifest, "r", encoding="utf-8") as fh:
+        entries = [line.strip() for line in fh if line.strip()]
+    paths = [os.path.normpath(os.path.join(base, e)) for e in entries]
+    names = [os.path.relpath(p, base)[: -len(".dat")] for p in paths]
+    return names, entries, paths
+
+
+def load_profiles(paths, workers=None, chunk=64, structures=False):
+    """
+    Parse the FoXS profiles at `paths` in a process pool. Returns (q, an
+    (n, n_q) float32 matrix, labels, rg, dmax); profiles on another q grid
+    are interpolated to that of the first.
+    """
+    q_ref, _ = read_dat(paths[0])
+    n_frames = len(paths)
+    matrix = np.empty((n_frames, len(q_ref)), dtype=DTYPE)
+    labels = [None] * n_frames
+    rg, dmax = np.full(n_frames, np.nan), np.full(n_frames, np.nan)
+    regridded = 0
+    starts = range(0, n_frames, chunk)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_read_chunk, paths[i : i + chunk], q_ref, structures)
+            for i in starts
+        ]
+        for i, future in zip(starts, futures):
+            rows, info, n = future.result()
+            matrix[i : i + len(rows)] = rows
+            for k, (label, r, d) in enumerate(info, start=i):
+                labels[k], rg[k], dmax[k] = label, r, d
+            regridded += n
+    if regridded:
+        print(f"⚠️ {regridded} profiles interpolated to the q grid of {paths[0]}")
+    return q_ref, matrix, labels, rg, dmax
+
+
+def build_store(
+    manifest,
+    output=None,
+    data_file=None,
+    base=None,
+    workers=None,
+    chunk=64,
+    structures=True,
+):
+    """Parse every profile of `manifest` into a store; returns the output path."""
+    start = time.perf_counter()
+    names, entries, paths = read_manifest(manifest, base)
+    output = output or os.path.join(os.path.dirname(manifest), STORE_NAME)
+    if not paths:
+        raise ValueError(f"{manifest} lists no profiles")
+    print(f"Reading {len(paths)} FoXS profiles from {manifest}...")
+    q_ref, matrix, labels, rg, dmax = load_profiles(paths, workers, chunk, structures)
+    n_frames = len(paths)
+
+    columns = {"rg": rg, "dmax": dmax}
+    extra = {"data_file": None}
+    if data_file:
+        exp_q, exp_i, exp_err = read_saxs_data(data_file)
+        chi2, scale, offset = fit_to_data(
+            matrix.astype(np.float64), q_ref, exp_q, exp_i, exp_err
+        )
+        columns.update(chi2=chi2, scale=scale, offset=offset)
+        extra["data_file"] = os.path.abspath(data_file)
+    write_store(output, q_ref, matrix, names, entries, labels, columns, extra)
+    print(
+        f"✅ Wrote {n_frames} profiles to {output} "
+        f"in {time.perf_counter() - start:.1f} s"
+    )
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Consolidate FoXS .dat profiles into one memory-mappable file."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Build a store from a FoXS manifest")
+    build.add_argument("manifest", help="foxs_dat_files.txt listing the profiles")
+    build.add_argument(
+        "--output",
+        default=None,
+        help=f"Store to write (default: {STORE_NAME} next to the manifest)",
+    )
+    build.add_argument(
+        "--data", default=None, help="Experimental SAXS .dat for the χ² columns"
+    )
+    build.add_argument(
+        "--base",
+        default=None,
+        help="Directory the manifest paths are relative to (default: its own)",
+    )
+    build.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Parallel parser processes (default: CPU count)",
+    )
+    build.add_argument(
+        "--no-structures",
+        action="store_true",
+        help="Do not read the PDBs for Rg and Dmax",
+    )
+    info = sub.add_parser("info", help="Summarize a store")
+    info.add_argument("store", help="Store file")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_store(
+            args.manifest,
+            args.output,
+            args.data,
+            args.base,
+            args.workers,
+            structures=not args.no_structures,
+        )
+        return 0
+
+    store = ProfileStore(args.store)
+    print(f"{args.store}: {len(store)} frames x {len(store.q)} q values")
+    if len(store.q):
+        print(f"- q: {store.q[0]:.4f} to {store.q[-1]:.4f} 1/Å")
+    for column in FRAME_COLUMNS:
+        values = getattr(store, column)
+        if len(values) and not np.isnan(values).all():
+            print(
+                f"- {column}: {np.nanmin(values):.4g} to {np.nanmax(values):.4g}"
+            )
+    if len(store) and not np.isnan(store.chi2).all():
+        best = int(np.nanargmin(store.chi2))
+        print(f"- best χ²: {store.frames[best]} ({store.chi2[best]:.4g})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
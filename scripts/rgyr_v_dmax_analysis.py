@@ -1,10 +1,13 @@
 import argparse
 import json
+import math
 import os
 import re
 
 import pandas as pd
 
+from profile_store import STORE_NAME, ProfileStore
+
 os.environ["MKL_SERVICE_FORCE_INTEL"] = "1"
 
 def parse_pdb_file(pdb_file):
@@ -61,6 +64,15 @@ def collect_pdb_data(foxs_dir):
 
     return pdb_data
 
+def collect_store_data(store_path):
+    """Collect Rgyr and Dmax from a FoXS profile store instead of the PDB files."""
+    store = ProfileStore(store_path)
+    pdb_data = {}
+    for label, rgyr, dmax in zip(store.labels, store.rg, store.dmax):
+        if label is not None and not (math.isnan(rgyr) or math.isnan(dmax)):
+            pdb_data[label] = {"rgyr": float(rgyr), "dmax": float(dmax), "pdb": label}
+    return pdb_data
+
 def build_scatter_data(base_dir):
     """Build scatter data and save separate CSV and JSON files for each ensemble size file."""
     foxs_dir = os.path.join(base_dir, "foxs")
@@ -68,8 +80,13 @@ def build_scatter_data(base_dir):
     print(f"FoXS directory: {foxs_dir}")
     print(f"MultiFoXS directory: {multifoxs_dir}")
 
-    # Collect PDB data from the foxs directory
-    pdb_data = collect_pdb_data(foxs_dir)
+    # Collect PDB data from the foxs directory (its profile store if built)
+    store_path = os.path.join(foxs_dir, STORE_NAME)
+    if os.path.exists(store_path):
+        print(f"Reading Rgyr and Dmax from {store_path}")
+        pdb_data = collect_store_data(store_path)
+    else:
+        pdb_data = collect_pdb_data(foxs_dir)
 
     # Traverse through the multifoxs directory for ensemble size files
     for root, _, files in os.walk(multifoxs_dir):
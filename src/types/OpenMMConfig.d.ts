@@ -19,10 +19,14 @@ type RigidBody = BodyBase
 interface Constraints {
   fixed_bodies?: FixedBody[]
   rigid_bodies?: RigidBody[]
+  /** Drop nonbonded pairs and bonded terms that lie inside one rigid body */
+  exclude_intra_body?: boolean
+  /** "restraint": stiff harmonic springs (default); "frozen": zero mass + exclusions */
+  fixed_mode?: 'restraint' | 'frozen'
 }
 
 interface MinimizationParameters {
-  /** Max iterations for OpenMM local energy minimization */
+  /** Max iterations for OpenMM local energy minimization (0 = until converged) */
   max_iterations: number
 }
 
@@ -60,6 +64,11 @@ interface MDParameters {
   nsteps: number
   /** Timestep (ps) */
   timestep: number
+  /**
+   * Repartitioned hydrogen mass (amu). When set, H-bond lengths are
+   * constrained so timesteps of 3-4 fs become stable.
+   */
+  hydrogen_mass?: number
 }
 
 interface RgyrOptions {
@@ -71,10 +80,190 @@ interface RgyrOptions {
   report_interval: number
   /** CSV filename for Rg reporting */
   filename: string
+  /**
+   * Atoms in the Rg restraint: every particle (default), CA atoms only, or
+   * mass-weighted residue centroids.
+   */
+  selection?: 'all' | 'ca' | 'residue'
+  /** Rg CV implementation; ignored for the residue selection */
+  method?: 'rgforce' | 'centroid'
+}
+
+interface NonbondedOptions {
+  /**
+   * "full": charmm36 + implicit solvent on every atom (default).
+   * "charmm_ca": CHARMM dynamics protocol, soft-core vdW between CA atoms only.
+   */
+  mode: 'full' | 'charmm_ca'
+  /** CA-only cutoff (nm) */
+  cutoff?: number
+  /** CA-only switching distance (nm) */
+  switch_distance?: number
+  /** Soft-core alpha for the CA-only potential */
+  softcore_alpha?: number
+}
+
+interface MTSOptions {
+  /**
+   * Use a multiple-time-step integrator: `timestep` becomes the outer step
+   * for nonbonded forces and the Rg restraint.
+   */
+  enabled: boolean
+  /** Bonded-force steps per outer step */
+  inner_steps?: number
+}
+
+interface SAXSReporterOptions {
+  /** Compute approximate residue-bead SAXS profiles during MD */
+  enabled: boolean
+  /** Profile matrix file written in each rg_* directory (NumPy .npz) */
+  filename?: string
+  /** Steps between profiles (default: pdb_report_interval) */
+  report_interval?: number
+  /** Largest q (1/Å) */
+  q_max?: number
+  /** Number of q points from 0 to q_max */
+  n_q?: number
+  /** Distance histogram bin width (Å) */
+  bin_width?: number
+  /** Rewrite the matrix file every N profiles */
+  flush_every?: number
+}
+
+interface ConvergenceOptions {
+  /** Stop a per-Rg run early once new frames stop adding information */
+  enabled: boolean
+  /** Fraction of nsteps that always runs before stopping is allowed */
+  min_fraction?: number
+  /** Frames in the rolling Rg window */
+  window?: number
+  /** Change in rolling mean Rg (Å) between windows that counts as a plateau */
+  rg_tolerance?: number
+  /** Shape-space distance (Å) from earlier frames for a frame to count as new */
+  novelty_threshold?: number
+  /** Stop once this many new frames have been collected */
+  target_new_frames?: number
+  /** Consecutive non-new frames needed to call a plateaued run converged (default: window) */
+  stale_frames?: number
+  /** Steps between stop checks (rounded up to the report intervals) */
+  check_interval?: number
+}
+
+interface AdaptiveOptions {
+  /**
+   * Run short exploratory segments on a wide Rg grid, then spend the rest of
+   * the budget (all rg_sets x nsteps) on targets that add new coverage.
+   */
+  enabled: boolean
+  /** Number of exploratory Rg targets (default: twice the number of Rg values) */
+  grid_size?: number
+  /** Lowest exploratory Rg (Å, default: smallest Rg in rg_sets) */
+  rg_min?: number
+  /** Highest exploratory Rg (Å, default: largest Rg in rg_sets) */
+  rg_max?: number
+  /** Fraction of the budget spent on exploration */
+  explore_fraction?: number
+  /** Cap on total steps for one target, as a multiple of nsteps */
+  max_steps_factor?: number
+  /** Fraction of each exploratory segment ignored as equilibration */
+  burn_in?: number
+  /** Shape-space distance (Å) below which a target counts as redundant */
+  novelty_threshold?: number
+  /** Distance (Å) from the target beyond which a redundant target is unreachable */
+  reach_tolerance?: number
+  /** Seconds to wait for all tasks to finish exploring */
+  barrier_timeout?: number
+}
+
+interface ReplicaExchangeOptions {
+  /** Run the Rg targets of each rg_set as replicas that swap rg0 in one process */
+  enabled: boolean
+  /** Steps between exchange attempts */
+  exchange_interval?: number
+  /** Seed for the Metropolis acceptance test */
+  seed?: number
+}
+
+interface FrameSelectionOptions {
+  /** Send only structurally distinct MD frames (CA RMSD leaders) to FoXS */
+  enabled: boolean
+  /** Maximum number of frames kept across all Rg directories */
+  budget?: number
+  /** Initial CA RMSD cutoff (Å); loosened until the budget is met */
+  rmsd_cutoff?: number
+  /** Largest CA RMSD cutoff (Å) tried */
+  max_cutoff?: number
+  /** FoXS CPU time per frame (s) used to estimate the savings */
+  foxs_seconds_per_frame?: number
+}
+
+interface StreamingFoxsOptions {
+  /**
+   * Run FoXS on MD frames as they are written, alongside MD, instead of
+   * after it. Ignored when frame_selection or saxs_screening is enabled.
+   */
+  enabled: boolean
+  /** Seconds between scans for new frames */
+  poll_seconds?: number
+}
+
+interface SAXSScreeningOptions {
+  /** Rank MD frames by approximate χ² and run FoXS on the best only */
+  enabled: boolean
+  /** Experimental SAXS data, relative to input.dir */
+  data_file?: string
+  /** Number of frames kept for FoXS */
+  top_k?: number
+  /** Largest q (1/Å) of the data used for screening */
+  q_max?: number
+  /** Pair-distance histogram bin width (Å) */
+  bin_width?: number
+  /** Processes computing the approximate profiles */
+  workers?: number
+}
+
+interface MultiFoxsPrefilterOptions {
+  /** Drop near-duplicate profiles and keep the best before MultiFoXS */
+  enabled: boolean
+  /** Most profiles passed to MultiFoXS */
+  max_profiles?: number
+  /** RMS distance, in experimental errors, below which profiles are duplicates */
+  min_distance?: number
+}
+
+interface NativeMultistateOptions {
+  /** Fit ensembles with multistate.py instead of multi_foxs */
+  enabled: boolean
+  /** Largest ensemble size */
+  max_size?: number
+  /** Best models of each size extended to the next (1 = greedy) */
+  beam?: number
 }
 
 interface MDStep {
   parameters: MDParameters
+  /** Nonbonded model used during MD */
+  nonbonded?: NonbondedOptions
+  /** Multiple-time-step integration */
+  mts?: MTSOptions
+  /** On-the-fly SAXS profiles */
+  saxs?: SAXSReporterOptions
+  /** Early termination of converged Rg runs */
+  convergence?: ConvergenceOptions
+  /** Adaptive Rg target scheduling */
+  adaptive?: AdaptiveOptions
+  /** Rg replica exchange within each rg_set */
+  replica_exchange?: ReplicaExchangeOptions
+  /** Frame deduplication before FoXS (select_frames.py) */
+  frame_selection?: FrameSelectionOptions
+  /** FoXS profiles computed while MD runs */
+  streaming_foxs?: StreamingFoxsOptions
+  /** Approximate SAXS ranking before FoXS (screen_saxs.py) */
+  saxs_screening?: SAXSScreeningOptions
+  /** Profile prefilter before MultiFoXS (run-multifoxs.py --prefilter) */
+  multifoxs_prefilter?: MultiFoxsPrefilterOptions
+  /** NumPy multi-state solver in place of multi_foxs */
+  native_multistate?: NativeMultistateOptions
   /** Optional Rg restraint/monitoring settings */
   rgyr?: RgyrOptions
   /** Final PDB from MD */
@@ -85,12 +274,43 @@ interface MDStep {
   output_dcd: string
   /** Write a single PDB file every N steps (e.g., for visualization) */
   pdb_report_interval: number
+  /** Binary OpenMM checkpoint used to resume interrupted runs */
+  output_checkpoint?: string
+  /** Write a checkpoint every N steps (0 disables checkpointing) */
+  checkpoint_interval?: number
+}
+
+interface CGMDStep {
+  /** Langevin temperature (K) */
+  temperature?: number
+  /** Langevin friction coefficient (1/ps) */
+  friction?: number
+  /** Timestep (ps) */
+  timestep?: number
+  /** Steps per Rg target */
+  nsteps?: number
+  /** Steps between DCD/Rg/PDB frames */
+  report_interval?: number
+  /** CA-CA bond force constant (kJ/mol/nm^2) */
+  k_bond?: number
+  /** Elastic network force constant inside rigid/fixed bodies (kJ/mol/nm^2) */
+  k_enm?: number
+  /** Elastic network cutoff (nm) */
+  enm_cutoff?: number
+  /** Soft CA-CA repulsion force constant (kJ/mol/nm^2) */
+  k_repulsion?: number
+  /** Distance below which CA pairs repel (nm) */
+  repulsion_distance?: number
+  /** Energy minimization iterations before sampling */
+  minimize_iterations?: number
 }
 
 interface Steps {
   minimization: MinimizationStep
   heating: HeatingStep
   md: MDStep
+  /** Coarse-grained CA-only pre-screen (cg_md.py) */
+  cg_md?: CGMDStep
 }
 
 interface InputConfig {
@@ -100,6 +320,17 @@ interface InputConfig {
   pdb_file: string
   /** OpenMM ForceField XMLs in load order */
   forcefield: string[]
+  /**
+   * CHARMM PSF (relative to dir or absolute). When set with crd_file, Systems
+   * are built from the PSF and toppar files instead of PDBFixer + forcefield.
+   */
+  psf_file?: string
+  /** CHARMM CRD coordinates matching psf_file */
+  crd_file?: string
+  /** Directory of CHARMM topology/parameter files (default: scripts/toppar) */
+  toppar_dir?: string
+  /** CHARMM topology/parameter/stream files, relative to toppar_dir */
+  toppar?: string[]
 }
 
 interface OutputConfig {
@@ -111,11 +342,29 @@ interface OutputConfig {
   heat_dir: string
   /** Subdir for MD artifacts */
   md_dir: string
+  /** Subdir for coarse-grained CA-only MD artifacts (default "cg_md") */
+  cg_md_dir?: string
+}
+
+interface PlatformConfig {
+  /** Force a platform (also settable via OPENMM_PLATFORM) */
+  name?: 'CUDA' | 'OpenCL' | 'CPU'
+  /** CUDA/OpenCL precision used with `name` */
+  precision?: 'single' | 'mixed' | 'double'
+  /** CPU thread count used with `name` */
+  threads?: number
+  /** Benchmark the System and cache the fastest platform per host */
+  autotune?: boolean
+  /** JSON file holding cached autotune decisions, shared by all jobs */
+  cache?: string
+  /** Minimum wall time (s) spent benchmarking each candidate */
+  benchmark_seconds?: number
 }
 
 interface OpenMMConfig {
   input: InputConfig
   output: OutputConfig
+  platform?: PlatformConfig
   constraints?: Constraints
   steps?: Steps
 }